@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Sustained Events API throughput of a service handling every event
+
+Posts signed ``event_callback`` requests over keep-alive connections of
+several concurrent clients and reports how many events per second were
+acknowledged and handled::
+
+    $ python benchmarks/events_api_throughput.py --events 20000 --clients 20
+
+"""
+
+import eventlet
+
+eventlet.monkey_patch()  # noqa (code before imports)
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import logging  # noqa: E402
+import time  # noqa: E402
+
+import requests  # noqa: E402
+from nameko.containers import ServiceContainer  # noqa: E402
+from nameko.testing.utils import find_free_port  # noqa: E402
+
+from nameko_slack import constants, events  # noqa: E402
+
+
+SIGNING_SECRET = "bench-secret"
+
+handled = []
+
+
+class Service(object):
+
+    name = "benchmark"
+
+    @events.handle_event("reaction_added")
+    def on_reaction(self, event):
+        handled.append(event)
+
+
+def make_request(seq):
+    body = json.dumps(
+        {
+            "type": "event_callback",
+            "event_id": "Ev{}".format(seq),
+            "event": {"type": "reaction_added", "event_ts": str(seq)},
+        }
+    ).encode("utf-8")
+    timestamp = str(int(time.time()))
+    headers = {
+        "Content-Type": "application/json",
+        "X-Slack-Request-Timestamp": timestamp,
+        "X-Slack-Signature": events.sign(SIGNING_SECRET, timestamp, body),
+    }
+    return body, headers
+
+
+def client(url, requests_to_send, acked):
+    with requests.Session() as session:
+        for body, headers in requests_to_send:
+            response = session.post(url, data=body, headers=headers)
+            if response.status_code == 200:
+                acked.append(time.time())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--max-workers", type=int, default=100)
+    args = parser.parse_args()
+
+    logging.getLogger("nameko").setLevel(logging.ERROR)
+
+    port = find_free_port()
+    config = {
+        "WEB_SERVER_ADDRESS": "127.0.0.1:{}".format(port),
+        "max_workers": args.max_workers,
+        constants.CONFIG_KEY: {"SIGNING_SECRET": SIGNING_SECRET},
+    }
+    url = "http://127.0.0.1:{}{}".format(port, constants.EVENTS_API_URL)
+
+    # sign up front so that the clients measure the service only
+    batches = [[] for _ in range(args.clients)]
+    for seq in range(args.events):
+        batches[seq % args.clients].append(make_request(seq))
+    container = ServiceContainer(Service, config)
+    container.start()
+
+    acked = []
+    pool = eventlet.GreenPool(args.clients)
+    started = time.time()
+    for batch in batches:
+        pool.spawn(client, url, batch, acked)
+    pool.waitall()
+    acked_in = time.time() - started
+    while len(handled) < len(acked):
+        eventlet.sleep(0.01)
+    handled_in = time.time() - started
+
+    container.stop()
+
+    print("{:<10} {:>10} {:>12}".format("", "events", "events/s"))
+    print("{:<10} {:>10} {:>12.0f}".format("acked", len(acked), len(acked) / acked_in))
+    print(
+        "{:<10} {:>10} {:>12.0f}".format(
+            "handled", len(handled), len(handled) / handled_in
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Frame decoding throughput of the RTM reader
+
+Compares decoding every frame with the stdlib ``json`` (as the Slack client
+does) with the ``auto`` decoder, with and without skipping frames of event
+types nobody subscribed to::
+
+    $ python benchmarks/frame_decoding.py --frames 50000
+
+"""
+
+import argparse
+import json
+import random
+import time
+from itertools import islice
+
+from nameko_slack import rtm
+
+
+class Server(object):
+    """Stand-in websocket returning one batch of frames per read"""
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+
+    def websocket_safe_read(self):
+        return self.batches.pop() if self.batches else ""
+
+
+class Client(object):
+    def __init__(self, batches):
+        self.server = Server(batches)
+
+    def process_changes(self, event):
+        pass
+
+
+def make_frames(count):
+    """Mostly typing and presence noise, some messages with nested blocks"""
+    frames = []
+    for index in range(count):
+        kind = random.random()
+        if kind < 0.4:
+            event = {"type": "user_typing", "channel": "C1", "user": "U1"}
+        elif kind < 0.8:
+            event = {"type": "presence_change", "user": "U1", "presence": "away"}
+        else:
+            event = {
+                "type": "message",
+                "channel": "C1",
+                "user": "U1",
+                "text": "spam " * 20,
+                "ts": "{}.000100".format(index),
+                "blocks": [{"type": "rich_text", "elements": []}],
+            }
+        frames.append(json.dumps(event))
+    return frames
+
+
+def make_client_manager(decoder, skip_unsubscribed):
+    client_manager = rtm.SlackRTMClientManager()
+    client_manager.setup_decoder(decoder)
+    client_manager.skip_unsubscribed = skip_unsubscribed
+    entrypoint = rtm.RTMMessageHandlerEntrypoint("^spam")
+    client_manager.register_provider(entrypoint)
+    return client_manager
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--frames", type=int, default=50000)
+    parser.add_argument("--batch", type=int, default=10)
+    args = parser.parse_args()
+
+    frames = make_frames(args.frames)
+    remaining = iter(frames)
+    batches = []
+    while True:
+        batch = list(islice(remaining, args.batch))
+        if not batch:
+            break
+        batches.append("\n".join(batch))
+
+    print("{:>8} {:>6} {:>14}".format("decoder", "skip", "frames/s"))
+    for decoder, skip_unsubscribed in (
+        ("json", False),
+        ("auto", False),
+        ("json", True),
+        ("auto", True),
+    ):
+        client_manager = make_client_manager(decoder, skip_unsubscribed)
+        client = Client(batches)
+        started = time.time()
+        while rtm.read(client, client_manager.frame_reader("default")):
+            pass
+        rate = len(frames) / (time.time() - started)
+        print("{:>8} {:>6} {:>14.0f}".format(decoder, str(skip_unsubscribed), rate))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Message dispatch throughput against the number of ``handle_message`` patterns
+
+Compares trying every entrypoint's pattern in turn with routing messages
+through the client manager's combined matcher::
+
+    $ python benchmarks/message_matching.py --messages 20000
+
+"""
+
+import argparse
+import random
+import time
+from functools import partial
+
+from nameko_slack import constants, rtm
+
+
+class Container(object):
+    """Stand-in container counting spawned workers"""
+
+    def __init__(self):
+        self.spawned = 0
+
+    def spawn_worker(self, *args, **kwargs):
+        self.spawned += 1
+
+
+def make_entrypoints(count, container):
+    entrypoints = []
+    for index in range(count):
+        entrypoint = rtm.RTMMessageHandlerEntrypoint(
+            "^command{} (?P<argument>\\w+)".format(index)
+        )
+        entrypoint.container = container
+        entrypoints.append(entrypoint)
+    return entrypoints
+
+
+def make_messages(count, handlers):
+    messages = []
+    for _ in range(count):
+        if random.random() < 0.5:
+            text = "command{} spam".format(random.randrange(handlers))
+        else:
+            text = "just chatting about spam and ham"
+        messages.append({"type": "message", "channel": "C1", "text": text})
+    return messages
+
+
+def linear(entrypoints):
+    def dispatch(event):
+        for entrypoint in entrypoints:
+            entrypoint.handle_event(event)
+
+    return dispatch
+
+
+def indexed(entrypoints):
+    client_manager = rtm.SlackRTMClientManager()
+    for entrypoint in entrypoints:
+        client_manager.register_provider(entrypoint)
+    return partial(client_manager.handle, constants.DEFAULT_BOT_NAME)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--handlers", type=int, nargs="+", default=[1, 10, 100, 500])
+    args = parser.parse_args()
+
+    print("{:>8} {:>14} {:>14}".format("handlers", "linear msg/s", "indexed msg/s"))
+    for handlers in args.handlers:
+        messages = make_messages(args.messages, handlers)
+        rates = []
+        for make_dispatcher in (linear, indexed):
+            container = Container()
+            dispatch = make_dispatcher(make_entrypoints(handlers, container))
+            started = time.time()
+            for event in messages:
+                dispatch(event)
+            rates.append(len(messages) / (time.time() - started))
+        print("{:>8} {:>14.0f} {:>14.0f}".format(handlers, *rates))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput, reply latency and memory of RTM bots under a realistic event mix
+
+Connects bots to a local fake Slack, RTM websocket and Web API, and publishes
+a mix of typing, presence, message and thread events at a steady rate, round
+robin over the bots' connections. Messages are answered by a
+``handle_message`` entrypoint, over RTM or with ``chat.postMessage``::
+
+    $ python benchmarks/rtm_load.py --bots 10 --rate 500 --duration 10
+
+Runs offline. Save the results with ``--output`` and compare a later run, of
+another version for example, against them with ``--baseline``::
+
+    $ python benchmarks/rtm_load.py --output before.json
+    $ python benchmarks/rtm_load.py --baseline before.json
+
+Memory per connection is allocated by the service while its bots connect,
+as traced by ``tracemalloc``, including the share of whatever the service
+allocates once.
+
+"""
+
+import eventlet
+
+eventlet.monkey_patch()  # noqa (code before imports)
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import logging  # noqa: E402
+import platform  # noqa: E402
+import random  # noqa: E402
+import time  # noqa: E402
+import tracemalloc  # noqa: E402
+from collections import Counter  # noqa: E402
+from importlib import metadata  # noqa: E402
+
+from nameko.containers import ServiceContainer  # noqa: E402
+
+from nameko_slack import constants, rtm  # noqa: E402
+from nameko_slack.testing import FakeSlack  # noqa: E402
+from nameko_slack.web import Slack  # noqa: E402
+
+
+DEFAULT_MIX = "user_typing=50,presence_change=30,message=15,thread=5"
+
+# allocations of the fake Slack server, left out of memory per connection
+FAKE_SLACK_FILES = ("*/nameko_slack/testing.py", "*/eventlet/websocket.py")
+
+handled = Counter()
+
+
+def count(event_type):
+    def handler(self, event):
+        handled[event_type] += 1
+
+    return handler
+
+
+def reply_over_rtm():
+    def pong(self, event, message, seq):
+        handled["message"] += 1
+        return "pong {}".format(seq)
+
+    return pong
+
+
+def reply_over_web_api():
+    def pong(self, event, message, seq):
+        handled["message"] += 1
+        self.slack.api_call(
+            "chat.postMessage", channel=event["channel"], text="pong {}".format(seq)
+        )
+
+    return pong
+
+
+def make_service(bot_names, reply):
+    """ Return a service handling the events of every bot
+    """
+    attributes = {"name": "benchmark"}
+    if reply == "web":
+        attributes["slack"] = Slack(bot_names[0])
+    for bot_name in bot_names:
+        for event_type in ("user_typing", "presence_change"):
+            handle = rtm.handle_event(event_type, bot_name=bot_name)
+            attributes["{}_{}".format(event_type, bot_name)] = handle(count(event_type))
+        pong = reply_over_web_api() if reply == "web" else reply_over_rtm()
+        handle = rtm.handle_message("^ping (?P<seq>\\d+)", bot_name=bot_name)
+        attributes["pong_{}".format(bot_name)] = handle(pong)
+    return type("Service", (object,), attributes)
+
+
+def parse_mix(mix):
+    kinds, weights = [], []
+    for part in mix.split(","):
+        kind, _, weight = part.partition("=")
+        kinds.append(kind.strip())
+        weights.append(float(weight))
+    return kinds, weights
+
+
+def make_event(kind, seq):
+    if kind == "user_typing":
+        return {"type": "user_typing", "channel": "C1", "user": "U1"}
+    if kind == "presence_change":
+        return {"type": "presence_change", "user": "U1", "presence": "away"}
+    event = {
+        "type": "message",
+        "channel": "C{}".format(seq % 10),
+        "user": "U1",
+        "text": "ping {}".format(seq),
+        "ts": "{}.000100".format(seq),
+    }
+    if kind == "thread":
+        event["thread_ts"] = "1.000100"
+    return event
+
+
+def percentile(values, percent):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    index = int(round((len(values) - 1) * percent / 100.0))
+    return values[index]
+
+
+def traced_memory():
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, path, all_frames=True) for path in FAKE_SLACK_FILES]
+    )
+    return sum(stat.size for stat in snapshot.statistics("filename"))
+
+
+def run(args):
+    bot_names = ["bot{}".format(index) for index in range(args.bots)]
+    config = {
+        "max_workers": args.max_workers,
+        constants.CONFIG_KEY: {
+            "BOTS": {bot_name: "xoxb-{}".format(bot_name) for bot_name in bot_names},
+            "READ_MODE": args.read_mode,
+            "READ_INTERVAL": args.read_interval,
+            "TRANSPORT": args.transport,
+            "CONNECT_METHOD": constants.CONNECT_RTM_CONNECT,
+        },
+    }
+    service = make_service(bot_names, args.reply)
+
+    fake_slack = FakeSlack()
+    fake_slack.start()
+    with fake_slack.patch_web_api():
+        tracemalloc.start(25)
+        before = traced_memory()
+        container = ServiceContainer(service, config)
+        container.start()
+        while len(fake_slack.connections) < args.bots:
+            eventlet.sleep(0.01)
+        eventlet.sleep(0.5)
+        memory = (traced_memory() - before) / float(args.bots)
+        tracemalloc.stop()
+
+        sent = {}
+        latencies = []
+
+        def collect():
+            while True:
+                reply = fake_slack.received.get()
+                seq = reply["text"].split()[-1]
+                latencies.append(time.time() - sent.pop(seq))
+
+        collector = eventlet.spawn(collect)
+        kinds, weights = parse_mix(args.mix)
+        chooser = random.Random(args.seed)
+        connections = list(fake_slack.connections)
+        total = int(args.rate * args.duration)
+
+        started = time.time()
+        for seq in range(total):
+            delay = started + seq / float(args.rate) - time.time()
+            if delay > 0:
+                eventlet.sleep(delay)
+            kind = chooser.choices(kinds, weights)[0]
+            if kind in ("message", "thread"):
+                sent[str(seq)] = time.time()
+            event = make_event(kind, seq)
+            fake_slack.publish(event, connections[seq % len(connections)])
+        published_in = time.time() - started
+
+        with eventlet.Timeout(args.timeout, False):
+            while sum(handled.values()) < total or sent:
+                eventlet.sleep(0.001)
+        handled_in = time.time() - started
+
+        collector.kill()
+        container.kill()
+    fake_slack.stop()
+
+    latencies_ms = [latency * 1000 for latency in latencies]
+    return {
+        "published": total,
+        "published_per_second": total / published_in,
+        "handled": sum(handled.values()),
+        "handled_per_second": sum(handled.values()) / handled_in,
+        "replies": len(latencies),
+        "latency_p50_ms": percentile(latencies_ms, 50),
+        "latency_p90_ms": percentile(latencies_ms, 90),
+        "latency_p99_ms": percentile(latencies_ms, 99),
+        "latency_max_ms": max(latencies_ms) if latencies_ms else float("nan"),
+        "memory_per_connection_kb": memory / 1024,
+    }
+
+
+def version():
+    try:
+        return metadata.version("nameko-slack")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def report(results, baseline=None):
+    header = "{:<26} {:>12}".format("", "result")
+    if baseline:
+        header += " {:>12} {:>8}".format("baseline", "change")
+    print(header)
+    for name, value in results.items():
+        line = "{:<26} {:>12.2f}".format(name, value)
+        if baseline and baseline.get(name):
+            before = baseline[name]
+            change = (value - before) / before * 100
+            line += " {:>12.2f} {:>+7.1f}%".format(before, change)
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bots", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=500, help="events per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weights of event kinds")
+    parser.add_argument("--reply", choices=("rtm", "web"), default="rtm")
+    parser.add_argument(
+        "--read-mode", choices=constants.READ_MODES, default=constants.READ_MODE_SELECT
+    )
+    parser.add_argument(
+        "--read-interval", type=float, default=0.01, help="seconds, in poll mode"
+    )
+    parser.add_argument(
+        "--transport",
+        choices=constants.TRANSPORTS,
+        default=constants.TRANSPORT_EVENTLET,
+    )
+    parser.add_argument("--max-workers", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--output", help="file to save results to, as JSON")
+    parser.add_argument("--baseline", help="file of results to compare with")
+    args = parser.parse_args()
+
+    logging.getLogger("nameko").setLevel(logging.ERROR)
+
+    results = run(args)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+    report(results, baseline)
+
+    if args.output:
+        options = dict(vars(args))
+        del options["output"], options["baseline"]
+        with open(args.output, "w") as output_file:
+            json.dump(
+                {
+                    "version": version(),
+                    "python": platform.python_version(),
+                    "options": options,
+                    "results": results,
+                },
+                output_file,
+                indent=2,
+                sort_keys=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Reply latency of a ``handle_message`` bot per RTM read mode
+
+Publishes messages at random intervals through a local fake Slack websocket
+and measures the time until the bot's reply arrives back at the server::
+
+    $ python benchmarks/rtm_read_latency.py --messages 20 --interval 1.5
+
+Add ``--transports eventlet asyncio`` to compare the RTM transports too.
+
+"""
+
+import eventlet
+
+eventlet.monkey_patch()  # noqa (code before imports)
+
+import argparse  # noqa: E402
+import logging  # noqa: E402
+import random  # noqa: E402
+import time  # noqa: E402
+
+from mock import patch  # noqa: E402
+from nameko.containers import ServiceContainer  # noqa: E402
+from slackclient.server import Server  # noqa: E402
+
+from nameko_slack import constants, rtm  # noqa: E402
+from nameko_slack.testing import FakeSlack  # noqa: E402
+
+
+class Service(object):
+
+    name = "benchmark"
+
+    @rtm.handle_message("^ping (?P<seq>\\d+)")
+    def pong(self, event, message, seq):
+        return "pong {}".format(seq)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = int(round((len(values) - 1) * percent / 100.0))
+    return values[index]
+
+
+def measure(transport, read_mode, messages, interval):
+    fake_slack = FakeSlack()
+    fake_slack.start()
+
+    def rtm_connect(server, **kwargs):
+        server.login_data = {"ok": True}
+        server.connect_slack_websocket(fake_slack.url)
+
+    config = {
+        constants.CONFIG_KEY: {
+            "TOKEN": "xoxb-bench",
+            "READ_MODE": read_mode,
+            "TRANSPORT": transport,
+        }
+    }
+
+    with patch.object(Server, "rtm_connect", rtm_connect):
+        container = ServiceContainer(Service, config)
+        container.start()
+        while not fake_slack.connections:
+            eventlet.sleep(0.01)
+
+        sent = {}
+        latencies = []
+
+        def collect():
+            while len(latencies) < messages:
+                reply = fake_slack.received.get()
+                seq = reply["text"].split()[-1]
+                latencies.append(time.time() - sent[seq])
+
+        collector = eventlet.spawn(collect)
+        for seq in range(messages):
+            eventlet.sleep(random.uniform(0, 2 * interval))
+            sent[str(seq)] = time.time()
+            fake_slack.publish(
+                {"type": "message", "channel": "C1", "text": "ping {}".format(seq)}
+            )
+
+        with eventlet.Timeout(10):
+            collector.wait()
+
+        container.kill()
+    fake_slack.stop()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=1.5)
+    parser.add_argument(
+        "--transports", nargs="+", default=[constants.TRANSPORT_EVENTLET]
+    )
+    args = parser.parse_args()
+
+    logging.getLogger("nameko").setLevel(logging.ERROR)
+
+    print(
+        "{:<9} {:<8} {:>10} {:>10} {:>10}".format(
+            "transport", "mode", "p50 ms", "p95 ms", "max ms"
+        )
+    )
+    for transport in args.transports:
+        for read_mode in constants.READ_MODES:
+            latencies = [
+                latency * 1000
+                for latency in measure(
+                    transport, read_mode, args.messages, args.interval
+                )
+            ]
+            print(
+                "{:<9} {:<8} {:>10.2f} {:>10.2f} {:>10.2f}".format(
+                    transport,
+                    read_mode,
+                    percentile(latencies, 50),
+                    percentile(latencies, 95),
+                    max(latencies),
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
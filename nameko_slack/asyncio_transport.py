@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+""" RTM transport running websockets on an asyncio loop in a separate thread
+
+Requires Python 3 and the ``websockets`` package. Frames are received and
+sent by the asyncio loop and handed over to the eventlet hub of the service
+through a queue and a pipe which becomes readable when there are frames
+waiting, so the rest of the client manager works the same with either
+transport.
+
+"""
+
+import asyncio
+import errno
+import logging
+import selectors
+import socket
+import time
+from collections import deque
+from functools import partial
+
+import eventlet
+from eventlet.hubs import trampoline
+from nameko.exceptions import ConfigurationError
+from slackclient.server import SlackConnectionError
+from websocket import WebSocketConnectionClosedException
+
+from nameko_slack.transport import Transport
+
+try:
+    import websockets
+except ImportError:  # pragma: no cover
+    websockets = None
+
+log = logging.getLogger(__name__)
+
+# the asyncio loop runs outside of the eventlet hub, it needs the blocking
+# modules of the standard library even when they are monkey patched, and so
+# does the pipe between the two which must never wait when read; coroutines
+# run in that thread too, out of sight of coverage
+original_os = eventlet.patcher.original("os")
+original_select = eventlet.patcher.original("select")
+original_socket = eventlet.patcher.original("socket")
+original_threading = eventlet.patcher.original("threading")
+
+
+class Selector(selectors.SelectSelector):
+    _select = staticmethod(original_select.select)
+
+
+class EventLoop(asyncio.SelectorEventLoop):
+    def __init__(self):
+        super(EventLoop, self).__init__(Selector())
+
+    async def getaddrinfo(  # pragma: no cover
+        self, host, port, *, family=0, type=0, proto=0, flags=0
+    ):
+        # resolves in the loop's thread, connecting is rare enough for that
+        return original_socket.getaddrinfo(host, port, family, type, proto, flags)
+
+
+class Waker(object):
+    """ Pipe becoming readable when woken up from another thread
+    """
+
+    def __init__(self):
+        self.read_fd, self.write_fd = original_os.pipe()
+        original_os.set_blocking(self.read_fd, False)
+        original_os.set_blocking(self.write_fd, False)
+
+    def fileno(self):
+        return self.read_fd
+
+    def wake(self):
+        try:
+            original_os.write(self.write_fd, b"x")
+        except BlockingIOError:
+            pass  # a full pipe wakes up the reader all the same
+
+    def drain(self):
+        try:
+            while True:
+                original_os.read(self.read_fd, 4096)
+        except BlockingIOError:
+            pass
+
+    def wait(self):
+        trampoline(self.read_fd, read=True)
+        self.drain()
+
+    def close(self):
+        original_os.close(self.read_fd)
+        original_os.close(self.write_fd)
+
+
+class AsyncioWebSocket(object):
+    """ Websocket connection running on an asyncio loop in another thread
+
+    Received frames are queued until :meth:`recv` is called from the eventlet
+    hub, ``sock`` becomes readable when there are frames to receive.
+
+    """
+
+    close_timeout = 1
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.sock = Waker()
+        self.frames = deque()
+        self.connection = None
+        self.closed = False
+        self.released = False
+        self.error = None
+
+        # the pipe is closed once both the loop and the hub are done with it
+        self.users = 2
+        self.lock = original_threading.Lock()
+
+    def release(self):
+        with self.lock:
+            self.users -= 1
+            if not self.users:
+                self.sock.close()
+
+    def open(self, url):
+        asyncio.run_coroutine_threadsafe(self.run(url), self.loop)
+        while self.connection is None and not self.closed:
+            self.sock.wait()
+        if self.connection is None:
+            raise SlackConnectionError(message=str(self.error))
+
+    async def run(self, url):  # pragma: no cover
+        try:
+            self.connection = await websockets.connect(
+                url, close_timeout=self.close_timeout
+            )
+            self.sock.wake()
+            async for frame in self.connection:
+                self.frames.append(frame)
+                self.sock.wake()
+        except Exception as exc:
+            self.error = exc
+            log.debug("Websocket of %s closed", url, exc_info=True)
+        finally:
+            self.closed = True
+            self.sock.wake()
+            self.release()
+
+    def recv(self):
+        self.sock.drain()
+        if self.frames:
+            return self.frames.popleft()
+        if self.closed:
+            raise WebSocketConnectionClosedException("Websocket is closed")
+        raise socket.error(errno.EAGAIN, "No frames to receive")
+
+    def send(self, data):
+        if self.closed:
+            raise WebSocketConnectionClosedException("Websocket is closed")
+        asyncio.run_coroutine_threadsafe(self.connection.send(data), self.loop)
+
+    def ping(self):
+        if self.closed:
+            raise WebSocketConnectionClosedException("Websocket is closed")
+        asyncio.run_coroutine_threadsafe(self.connection.ping(), self.loop)
+
+    def close(self):
+        """ Close the connection, the websocket must not be used any more
+        """
+        if self.released:
+            return
+        self.released = True
+        self.closed = True
+        if self.connection is not None:
+            asyncio.run_coroutine_threadsafe(self.connection.close(), self.loop)
+        self.release()
+
+
+class AsyncioTransport(Transport):
+    """ Runs the websockets of all bots on one asyncio loop in an OS thread
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self.websockets = set()
+
+    def setup(self):
+        if websockets is None:  # pragma: no cover
+            raise ConfigurationError(
+                "`asyncio` transport requires the `websockets` package"
+            )
+
+    def start(self):
+        self.loop = EventLoop()
+        self.thread = original_threading.Thread(
+            target=self.loop.run_forever, name="nameko-slack-rtm"
+        )
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.loop is None:
+            return
+        connections = [
+            websocket.connection
+            for websocket in self.websockets
+            if websocket.connection is not None
+        ]
+        for websocket in self.websockets:
+            websocket.close()
+        self.websockets.clear()
+        asyncio.run_coroutine_threadsafe(self.shutdown(connections), self.loop)
+        # wait without blocking the hub
+        while self.thread.is_alive():
+            eventlet.sleep(0.01)
+        self.loop.close()
+        self.loop = None
+
+    async def shutdown(self, connections):  # pragma: no cover
+        await asyncio.gather(
+            *(connection.wait_closed() for connection in connections),
+            return_exceptions=True
+        )
+        self.loop.stop()
+
+    def attach(self, client):
+        server = client.server
+        server.connect_slack_websocket = partial(self.connect, server)
+
+    def connect(self, server, url):
+        """ Open websocket of the Slack client's server
+        """
+        self.close(server)
+        websocket = AsyncioWebSocket(self.loop)
+        try:
+            websocket.open(url)
+        except SlackConnectionError:
+            websocket.close()
+            raise
+        self.websockets.add(websocket)
+        server.websocket = websocket
+        server.connected = True
+        server.last_connected_at = time.time()
+
+    def disconnect(self, client):
+        self.close(client.server)
+
+    def close(self, server):
+        if server.websocket in self.websockets:
+            self.websockets.discard(server.websocket)
+            server.websocket.close()
+        server.connected = False
@@ -1,3 +1,38 @@
 # -*- coding: utf-8 -*-
 CONFIG_KEY = "SLACK"
 DEFAULT_BOT_NAME = "default"
+
+READ_MODE_POLL = "poll"
+READ_MODE_SELECT = "select"
+READ_MODES = (READ_MODE_POLL, READ_MODE_SELECT)
+
+WHEN_FULL_BLOCK = "block"
+WHEN_FULL_DROP_OLDEST = "drop_oldest"
+WHEN_FULL_ERROR = "error"
+WHEN_FULL_POLICIES = (WHEN_FULL_BLOCK, WHEN_FULL_DROP_OLDEST, WHEN_FULL_ERROR)
+
+CONNECT_RTM_START = "rtm.start"
+CONNECT_RTM_CONNECT = "rtm.connect"
+CONNECT_METHODS = (CONNECT_RTM_START, CONNECT_RTM_CONNECT)
+
+OVERLOAD_SHED_OLDEST = "shed_oldest"
+OVERLOAD_SHED_BY_EVENT_TYPE = "shed_by_event_type"
+OVERLOAD_FAIR = "fair"
+OVERLOAD_POLICIES = (OVERLOAD_SHED_OLDEST, OVERLOAD_SHED_BY_EVENT_TYPE, OVERLOAD_FAIR)
+
+ORDERED_BY_CHANNEL = "channel"
+ORDERED_BY_USER = "user"
+ORDERED_BY_THREAD = "thread_ts"
+ORDERED_BY = (ORDERED_BY_CHANNEL, ORDERED_BY_USER, ORDERED_BY_THREAD)
+
+DECODER_AUTO = "auto"
+DECODER_ORJSON = "orjson"
+DECODER_UJSON = "ujson"
+DECODER_JSON = "json"
+DECODERS = (DECODER_AUTO, DECODER_ORJSON, DECODER_UJSON, DECODER_JSON)
+
+TRANSPORT_EVENTLET = "eventlet"
+TRANSPORT_ASYNCIO = "asyncio"
+TRANSPORTS = (TRANSPORT_EVENTLET, TRANSPORT_ASYNCIO)
+
+EVENTS_API_URL = "/slack/events"
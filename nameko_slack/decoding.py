@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import json
+import re
+from importlib import import_module
+
+from nameko_slack import constants
+
+
+# a "type" key anywhere in a frame, escaped quotes inside string values
+# do not match
+TYPE_PATTERN = re.compile(r'"type"\s*:\s*"([^"\\]*)"')
+
+
+def get_decoder(name):
+    """ Return the `loads` function of the named JSON library
+
+    The ``auto`` decoder is the fastest library installed. Raises
+    ``ImportError`` if the library is not installed.
+
+    """
+    if name == constants.DECODER_AUTO:
+        for library in (constants.DECODER_ORJSON, constants.DECODER_UJSON):
+            try:
+                return import_module(library).loads
+            except ImportError:
+                continue
+        return json.loads
+    if name == constants.DECODER_JSON:
+        return json.loads
+    return import_module(name).loads
+
+
+def frame_types(frame):
+    """ Return every event type a raw frame may be of without decoding it
+
+    The type of the event is always among them, the others come from
+    objects nested in the event.
+
+    """
+    return frozenset(TYPE_PATTERN.findall(frame))
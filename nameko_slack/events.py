@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+""" Entrypoints handling events delivered over Slack's `Events API`
+
+Slack posts events to a URL of the service instead of pushing them over
+a websocket per bot. Requests are served by nameko's web server, verified
+against the app's signing secret and answered straight away, as Slack
+expects an answer within three seconds and retries otherwise. Workers are
+spawned after answering.
+
+"""
+import hashlib
+import hmac
+import json
+import logging
+import sys
+import time
+from collections import Counter
+from functools import partial
+
+from nameko.exceptions import ConfigurationError
+from nameko.extensions import Entrypoint, ProviderCollector, SharedExtension
+from nameko.web.server import WebServer
+from werkzeug.routing import Rule
+from werkzeug.wrappers import Response
+
+from nameko_slack import constants
+from nameko_slack.rtm import (
+    EVENT_TYPE_MESSAGE,
+    RecentEvents,
+    compile_message_pattern,
+    index_providers,
+    message_arguments,
+    routed,
+)
+from nameko_slack.web import make_client, make_session
+
+
+log = logging.getLogger(__name__)
+
+
+def event_id(payload):
+    return payload.get("event_id")
+
+
+def sign(signing_secret, timestamp, body):
+    """ Return the ``X-Slack-Signature`` of a request
+    """
+    base = b":".join([b"v0", str(timestamp).encode("ascii"), body])
+    digest = hmac.new(signing_secret.encode("utf-8"), base, hashlib.sha256)
+    return "v0={}".format(digest.hexdigest())
+
+
+class SlackEventsDispatcher(SharedExtension, ProviderCollector):
+    """ Receives Events API requests and routes events to entrypoints
+    """
+
+    server = WebServer()
+
+    def __init__(self):
+        super(SlackEventsDispatcher, self).__init__()
+        self.url = constants.EVENTS_API_URL
+        self.signing_secret = None
+        self.max_age = 300
+        self.recent_events = None
+        self.client = None
+        self.routes = {}
+        self.counters = Counter()
+
+    def setup(self):
+        try:
+            config = self.container.config[constants.CONFIG_KEY]
+        except KeyError:
+            raise ConfigurationError(
+                "`{}` config key not found".format(constants.CONFIG_KEY)
+            )
+
+        self.signing_secret = config.get("SIGNING_SECRET")
+        if not self.signing_secret:
+            raise ConfigurationError(
+                "`SIGNING_SECRET` must be provided in `{}` config".format(
+                    constants.CONFIG_KEY
+                )
+            )
+
+        events_config = config.get("EVENTS_API", {})
+        self.url = events_config.get("URL", self.url)
+        self.max_age = events_config.get("MAX_AGE", self.max_age)
+        dedupe_size = events_config.get("DEDUPE", 1000)
+        if dedupe_size:
+            self.recent_events = RecentEvents(dedupe_size, key=event_id)
+
+        token = config.get("TOKEN")
+        if token:
+            self.client = make_client(token, make_session(pool_size=10))
+
+        self.server.register_provider(self)
+
+    def stop(self):
+        self.server.unregister_provider(self)
+        super(SlackEventsDispatcher, self).stop()
+
+    def get_url_rule(self):
+        return Rule(self.url, methods=["POST"])
+
+    def verify(self, request, body):
+        """ Tell whether the request comes from Slack, and recently so
+        """
+        timestamp = request.headers.get("X-Slack-Request-Timestamp", "")
+        signature = request.headers.get("X-Slack-Signature", "")
+        try:
+            age = abs(time.time() - int(timestamp))
+        except ValueError:
+            return False
+        if age > self.max_age:
+            return False
+        expected = sign(self.signing_secret, timestamp, body)
+        return hmac.compare_digest(expected, str(signature))
+
+    def handle_request(self, request):
+        request.shallow = False
+        body = request.get_data()
+        if not self.verify(request, body):
+            self.counters["rejected"] += 1
+            log.warning("Rejected Events API request with invalid signature")
+            return Response("Invalid signature", status=401)
+        try:
+            payload = json.loads(body.decode("utf-8"))
+        except ValueError:
+            self.counters["rejected"] += 1
+            return Response("Invalid payload", status=400)
+
+        payload_type = payload.get("type")
+        if payload_type == "url_verification":
+            return Response(payload.get("challenge", ""), mimetype="text/plain")
+        if payload_type == "event_callback":
+            # Slack delivers an event again when the answer is late
+            if self.recent_events is not None and not self.recent_events.add(payload):
+                self.counters["duplicate"] += 1
+            else:
+                self.counters["received"] += 1
+                # workers are spawned once Slack has got its answer
+                event = payload.get("event", {})
+                self.container.spawn_managed_thread(partial(self.handle, event))
+        return Response("", status=200)
+
+    def register_provider(self, provider):
+        super(SlackEventsDispatcher, self).register_provider(provider)
+        self.build_routes()
+
+    def unregister_provider(self, provider):
+        super(SlackEventsDispatcher, self).unregister_provider(provider)
+        self.build_routes()
+
+    def build_routes(self):
+        """ Index providers by the event type they listen to
+
+        Same as routes of the RTM client manager, all in a single scope
+        instead of one per bot.
+
+        """
+        self.routes = index_providers(
+            self._providers,
+            scope=lambda provider: None,
+            patterned=lambda provider: (
+                isinstance(provider, MessageHandlerEntrypoint)
+                and provider.message_pattern
+            ),
+        )
+
+    def handle(self, event):
+        for provider in routed(self.routes, None, event):
+            provider.handle_event(event)
+
+    def reply(self, event, message):
+        if self.client is None:
+            raise ConfigurationError(
+                "`TOKEN` must be provided in `{}` config to reply".format(
+                    constants.CONFIG_KEY
+                )
+            )
+        self.client.api_call(
+            "chat.postMessage", channel=event["channel"], text=message
+        )
+
+    def stats(self):
+        """ Return counts of events received and dropped, and of bad requests
+        """
+        return {
+            "received": self.counters["received"],
+            "duplicate": self.counters["duplicate"],
+            "rejected": self.counters["rejected"],
+        }
+
+
+class EventHandlerEntrypoint(Entrypoint):
+
+    dispatcher = SlackEventsDispatcher()
+
+    def __init__(self, event_type=None, **kwargs):
+        self.event_type = event_type
+        super(EventHandlerEntrypoint, self).__init__(**kwargs)
+
+    def setup(self):
+        self.dispatcher.register_provider(self)
+
+    def stop(self):
+        self.dispatcher.unregister_provider(self)
+
+    def handle_event(self, event):
+        self.spawn_worker((event,), {})
+
+    def spawn_worker(self, args, kwargs, handle_result=None):
+        context_data = {}
+        self.container.spawn_worker(
+            self,
+            args,
+            kwargs,
+            context_data=context_data,
+            handle_result=handle_result,
+        )
+
+
+handle_event = EventHandlerEntrypoint.decorator
+
+
+class MessageHandlerEntrypoint(EventHandlerEntrypoint):
+    def __init__(self, message_pattern=None, **kwargs):
+        self.message_pattern, self.message_prefix = compile_message_pattern(
+            message_pattern
+        )
+        # message entrypoints always listen to message events only
+        kwargs.pop("event_type", None)
+        super(MessageHandlerEntrypoint, self).__init__(
+            event_type=EVENT_TYPE_MESSAGE, **kwargs
+        )
+
+    def handle_event(self, event):
+        arguments = message_arguments(self.message_pattern, event)
+        if arguments is None:
+            return
+        args, kwargs = arguments
+        self.spawn_worker(args, kwargs, partial(self.handle_result, event))
+
+    def handle_result(self, event, worker_ctx, result, exc_info):
+        if result:
+            try:
+                self.dispatcher.reply(event, result)
+            except Exception:
+                exc_info = sys.exc_info()
+        return result, exc_info
+
+
+handle_message = MessageHandlerEntrypoint.decorator
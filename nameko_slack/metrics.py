@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+""" Timings and counts of the Slack extensions
+
+The extensions report what they measure to a :class:`Recorder` when metrics
+are enabled in config, and skip measuring altogether otherwise. Recorders
+render the measurements for Prometheus, send them to statsd or pass them on
+to any other metrics library.
+
+Gauges are not pushed by the extensions but read when they are collected,
+every ``INTERVAL`` seconds and whenever Prometheus metrics are rendered.
+
+"""
+import logging
+import re
+from bisect import bisect_left
+from collections import defaultdict
+
+import eventlet
+from eventlet.green import socket
+from nameko.exceptions import ConfigurationError
+from nameko.extensions import DependencyProvider, SharedExtension
+
+from nameko_slack import constants
+from nameko_slack.sharding import import_path
+
+
+log = logging.getLogger(__name__)
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Recorder(object):
+    """ Receives the measurements of the extensions, ignoring all of them
+    """
+
+    def incr(self, name, value=1, **labels):
+        pass
+
+    def timing(self, name, seconds, **labels):
+        pass
+
+    def gauge(self, name, value, **labels):
+        pass
+
+
+class Recorders(Recorder):
+    """ Passes measurements on to several recorders
+    """
+
+    def __init__(self, recorders):
+        self.recorders = recorders
+
+    def incr(self, name, value=1, **labels):
+        for recorder in self.recorders:
+            recorder.incr(name, value, **labels)
+
+    def timing(self, name, seconds, **labels):
+        for recorder in self.recorders:
+            recorder.timing(name, seconds, **labels)
+
+    def gauge(self, name, value, **labels):
+        for recorder in self.recorders:
+            recorder.gauge(name, value, **labels)
+
+
+class PrometheusRecorder(Recorder):
+    """ Keeps measurements to render them in Prometheus' text format
+
+    Counts are rendered as counters and timings as histograms.
+
+    """
+
+    buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, namespace="nameko_slack"):
+        self.namespace = namespace
+        self.counters = defaultdict(dict)
+        self.histograms = defaultdict(dict)
+        self.gauges = defaultdict(dict)
+
+    def incr(self, name, value=1, **labels):
+        values = self.counters[name]
+        key = label_key(labels)
+        values[key] = values.get(key, 0) + value
+
+    def timing(self, name, seconds, **labels):
+        values = self.histograms[name]
+        key = label_key(labels)
+        histogram = values.get(key)
+        if histogram is None:
+            # observations by bucket, the last one is +Inf, then sum
+            histogram = values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        histogram[bisect_left(self.buckets, seconds)] += 1
+        histogram[-1] += seconds
+
+    def gauge(self, name, value, **labels):
+        self.gauges[name][label_key(labels)] = value
+
+    def metric_name(self, name):
+        return "{}_{}".format(self.namespace, name) if self.namespace else name
+
+    def render(self):
+        lines = []
+        for name, values in sorted(self.counters.items()):
+            metric = self.metric_name(name) + "_total"
+            lines.append("# TYPE {} counter".format(metric))
+            for key, value in sorted(values.items()):
+                lines.append(sample(metric, key, value))
+        for name, values in sorted(self.gauges.items()):
+            metric = self.metric_name(name)
+            lines.append("# TYPE {} gauge".format(metric))
+            for key, value in sorted(values.items()):
+                lines.append(sample(metric, key, value))
+        for name, values in sorted(self.histograms.items()):
+            metric = self.metric_name(name)
+            lines.append("# TYPE {} histogram".format(metric))
+            for key, histogram in sorted(values.items()):
+                count = 0
+                bounds = [repr(float(bound)) for bound in self.buckets] + ["+Inf"]
+                for bound, observations in zip(bounds, histogram):
+                    count += observations
+                    bucket_key = key + (("le", bound),)
+                    lines.append(sample(metric + "_bucket", bucket_key, count))
+                lines.append(sample(metric + "_sum", key, histogram[-1]))
+                lines.append(sample(metric + "_count", key, count))
+        return "\n".join(lines) + "\n"
+
+
+def escape(value):
+    return (
+        str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    )
+
+
+def sample(metric, key, value):
+    if not key:
+        return "{} {}".format(metric, value)
+    labels = ",".join('{}="{}"'.format(name, escape(label)) for name, label in key)
+    return "{}{{{}}} {}".format(metric, labels, value)
+
+
+class StatsdRecorder(Recorder):
+    """ Sends measurements to a statsd server over UDP
+
+    Values of labels are appended to the name of the metric, ordered by the
+    names of the labels, as plain statsd has no labels.
+
+    """
+
+    unsafe = re.compile(r"[^\w\-]")
+
+    def __init__(self, host="localhost", port=8125, prefix="nameko_slack"):
+        self.address = (socket.gethostbyname(host), port)
+        self.prefix = prefix
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, name, value, kind, labels):
+        parts = [self.prefix, name] if self.prefix else [name]
+        for _, label in label_key(labels):
+            parts.append(self.unsafe.sub("_", str(label)))
+        line = "{}:{}|{}".format(".".join(parts), value, kind)
+        try:
+            self.sock.sendto(line.encode("utf-8"), self.address)
+        except socket.error:
+            log.debug("Failed to send %s to statsd", line, exc_info=True)
+
+    def incr(self, name, value=1, **labels):
+        self.send(name, value, "c", labels)
+
+    def timing(self, name, seconds, **labels):
+        self.send(name, round(seconds * 1000, 3), "ms", labels)
+
+    def gauge(self, name, value, **labels):
+        self.send(name, value, "g", labels)
+
+
+class Instrumentation(SharedExtension):
+    """ Hands the recorder configured in ``METRICS`` to the Slack extensions
+
+    ``recorder`` stays ``None`` when metrics are disabled, and extensions
+    check for it once they are started.
+
+    """
+
+    def __init__(self):
+        super(Instrumentation, self).__init__()
+        self.recorder = None
+        self.prometheus = None
+        self.interval = 10
+        self.gauges = {}
+
+    def setup(self):
+        config = self.container.config.get(constants.CONFIG_KEY, {}).get("METRICS")
+        if config is None:
+            return
+        recorders = []
+        if config.get("PROMETHEUS"):
+            self.prometheus = PrometheusRecorder(
+                namespace=config.get("NAMESPACE", "nameko_slack")
+            )
+            recorders.append(self.prometheus)
+        statsd_config = config.get("STATSD")
+        if statsd_config is not None:
+            recorders.append(
+                StatsdRecorder(
+                    host=statsd_config.get("HOST", "localhost"),
+                    port=statsd_config.get("PORT", 8125),
+                    prefix=statsd_config.get("PREFIX", "nameko_slack"),
+                )
+            )
+        for factory in config.get("RECORDERS", ()):
+            if not callable(factory):
+                factory = import_path(factory)
+            recorders.append(factory())
+        self.interval = config.get("INTERVAL", self.interval)
+        if len(recorders) == 1:
+            self.recorder = recorders[0]
+        elif recorders:
+            self.recorder = Recorders(recorders)
+
+    def start(self):
+        if self.recorder is not None:
+            self.container.spawn_managed_thread(self.report)
+
+    def add_gauge(self, name, read, **labels):
+        """ Have the value returned by ``read`` collected as a gauge
+        """
+        self.gauges[(name, label_key(labels))] = read
+
+    def collect(self):
+        for (name, key), read in list(self.gauges.items()):
+            self.recorder.gauge(name, read(), **dict(key))
+
+    def report(self):
+        while True:
+            eventlet.sleep(self.interval)
+            self.collect()
+
+    def render(self):
+        """ Return all metrics in Prometheus' text format
+        """
+        if self.prometheus is None:
+            raise ConfigurationError(
+                "`METRICS.PROMETHEUS` must be enabled in `{}` config".format(
+                    constants.CONFIG_KEY
+                )
+            )
+        self.collect()
+        return self.prometheus.render()
+
+
+class Metrics(DependencyProvider):
+    """ Dependency provider exposing the :class:`Instrumentation` of the service
+
+    Serve ``render()`` at an HTTP entrypoint for Prometheus to scrape.
+
+    """
+
+    instrumentation = Instrumentation()
+
+    def get_dependency(self, worker_ctx):
+        return self.instrumentation
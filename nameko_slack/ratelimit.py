@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import time
+
+import eventlet
+from eventlet.semaphore import Semaphore
+
+
+try:
+    clock = time.monotonic
+except AttributeError:  # pragma: no cover (Python 2)
+    clock = time.time
+
+
+class TokenBucket(object):
+    """ Token bucket refilled with `rate` tokens per second
+
+    Holds at most `capacity` tokens, a single one by default which spaces
+    calls out evenly without allowing any bursts.
+
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = self.capacity
+        self.updated = clock()
+
+    def refill(self):
+        now = clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    @property
+    def full(self):
+        self.refill()
+        return self.tokens >= self.capacity
+
+    def delay(self, tokens=1):
+        """ Return seconds to wait until `tokens` can be consumed
+        """
+        self.refill()
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    def consume(self, tokens=1):
+        self.refill()
+        self.tokens -= tokens
+
+
+# calls per minute allowed by Slack's rate limit tiers, ``special`` is the
+# limit of posting messages to a channel
+TIERS = {"tier1": 1, "tier2": 20, "tier3": 50, "tier4": 100, "special": 60}
+
+DEFAULT_TIER = "tier3"
+
+METHOD_TIERS = {
+    "conversations.create": "tier2",
+    "conversations.list": "tier2",
+    "emoji.list": "tier2",
+    "files.list": "tier2",
+    "reactions.list": "tier2",
+    "search.messages": "tier2",
+    "users.conversations": "tier2",
+    "users.list": "tier2",
+    "chat.delete": "tier3",
+    "chat.update": "tier3",
+    "conversations.history": "tier3",
+    "conversations.info": "tier3",
+    "conversations.join": "tier3",
+    "conversations.members": "tier3",
+    "conversations.open": "tier3",
+    "conversations.replies": "tier3",
+    "files.upload": "tier3",
+    "reactions.add": "tier3",
+    "reactions.remove": "tier3",
+    "users.lookupByEmail": "tier3",
+    "auth.test": "tier4",
+    "bots.info": "tier4",
+    "chat.getPermalink": "tier4",
+    "chat.postEphemeral": "tier4",
+    "team.info": "tier4",
+    "users.getPresence": "tier4",
+    "users.info": "tier4",
+    "users.profile.get": "tier4",
+    "chat.postMessage": "special",
+}
+
+# methods limited per channel rather than per method
+PER_CHANNEL_METHODS = frozenset(["chat.postMessage"])
+
+
+class RateLimits(object):
+    """ Token buckets spacing out Web API calls to the rate of their tier
+
+    Slack limits calls of each method by each token to the rate of the
+    method's tier, messages are limited per channel. Calls wait for their
+    turn one after the other, in the order they came, and all of them wait
+    for as long as Slack asks to once it answers a call with ``Retry-After``.
+
+    """
+
+    def __init__(self, tiers=None, method_tiers=None, burst=1):
+        self.tiers = dict(TIERS, **(tiers or {}))
+        self.method_tiers = dict(METHOD_TIERS, **(method_tiers or {}))
+        self.burst = burst
+        self.buckets = {}
+        self.locks = {}
+        self.blocked_until = {}
+
+    def tier(self, method):
+        return self.method_tiers.get(method, DEFAULT_TIER)
+
+    def key(self, token, method, channel=None):
+        if method in PER_CHANNEL_METHODS:
+            return token, method, channel
+        return token, method
+
+    def bucket(self, key, tier):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            rate = self.tiers[tier] / 60.0
+            bucket = self.buckets[key] = TokenBucket(rate, capacity=self.burst)
+        return bucket
+
+    def acquire(self, key, tier):
+        """ Wait for the turn of a call, return seconds waited
+        """
+        started = clock()
+        lock = self.locks.get(key)
+        if lock is None:
+            lock = self.locks[key] = Semaphore()
+        with lock:
+            bucket = self.bucket(key, tier)
+            while True:
+                delay = max(bucket.delay(), self.blocked_until.get(key, 0) - clock())
+                if delay <= 0:
+                    break
+                eventlet.sleep(delay)
+            bucket.consume()
+        return clock() - started
+
+    def block(self, key, seconds):
+        """ Hold calls back for `seconds`, as asked by Slack
+        """
+        until = clock() + seconds
+        self.blocked_until[key] = max(self.blocked_until.get(key, 0), until)
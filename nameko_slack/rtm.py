@@ -1,26 +1,982 @@
 # -*- coding: utf-8 -*-
+import errno
+import json
+import logging
+import random
 import re
+import socket
+import sys
+from collections import OrderedDict, defaultdict, deque
 from functools import partial
+from itertools import chain, islice
+from operator import attrgetter
 
 import eventlet
+from eventlet.event import Event
+from eventlet.greenpool import GreenPool
+from eventlet.hubs import trampoline
+from eventlet.semaphore import Semaphore
 from nameko.exceptions import ConfigurationError
-from nameko.extensions import Entrypoint, ProviderCollector, SharedExtension
+from nameko.extensions import (
+    DependencyProvider,
+    Entrypoint,
+    ProviderCollector,
+    SharedExtension,
+)
 from slackclient import SlackClient
 
-from nameko_slack import constants
+from nameko_slack import constants, socket_mode
+from nameko_slack.decoding import frame_types, get_decoder
+from nameko_slack.metrics import Instrumentation
+from nameko_slack.ratelimit import TokenBucket, clock
+from nameko_slack.sharding import HashRing, import_path
+from nameko_slack.transport import Transport, get_transport
+from nameko_slack.web import INVALIDATING_EVENTS, EntityCache
 
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # pragma: no cover (Python < 3.11)
+    import sre_constants
+    import sre_parse
+
+
+log = logging.getLogger(__name__)
 
 EVENT_TYPE_MESSAGE = "message"
 
 
+def read(client, rtm_read=None):
+    """ Read events from the client, return an empty list if there are none
+
+    Events are read by `rtm_read` if given, by the client itself otherwise.
+
+    """
+    try:
+        if rtm_read is None:
+            return client.rtm_read()
+        return rtm_read(client)
+    except socket.error as exc:
+        # plain (non-TLS) sockets signal an empty buffer by raising
+        if exc.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+            return []
+        raise
+
+
+def read_available(client, rtm_read=None):
+    """ Yield all events which can be read from the client without blocking
+    """
+    while True:
+        events = read(client, rtm_read)
+        if not events:
+            return
+        for event in events:
+            yield event
+
+
+def event_key(event):
+    """ Return a key identifying an event delivered more than once, or ``None``
+    """
+    ts = event.get("event_ts") or event.get("ts")
+    if ts is None:
+        return None
+    channel = event.get("channel")
+    if isinstance(channel, dict):
+        channel = channel.get("id")
+    return event.get("type"), event.get("subtype"), channel, ts
+
+
+class ConnectionLost(Exception):
+    pass
+
+
+class BotUnavailable(Exception):
+    pass
+
+
+class Liveness(object):
+    """ Tell when to ping an idle connection and when to give up on it
+
+    Any frame received counts as an answer to a ping. Without
+    ``pong_timeout`` the connection is pinged every ``ping_interval``
+    seconds of silence and never given up on.
+
+    """
+
+    def __init__(self, ping_interval, pong_timeout=None):
+        self.ping_interval = ping_interval
+        self.pong_timeout = pong_timeout
+        self.last_received = clock()
+        self.pinged_at = None
+
+    def received(self):
+        self.last_received = clock()
+        self.pinged_at = None
+
+    def timeout(self):
+        """ Return seconds until the connection needs checking
+        """
+        if self.pinged_at is None:
+            return max(0, self.last_received + self.ping_interval - clock())
+        wait = self.ping_interval if self.pong_timeout is None else self.pong_timeout
+        return max(0, self.pinged_at + wait - clock())
+
+    def check(self, client):
+        if self.timeout():
+            return
+        if self.pinged_at is not None and self.pong_timeout is not None:
+            raise ConnectionLost(
+                "No answer to ping in {} seconds".format(self.pong_timeout)
+            )
+        client.server.ping()
+        self.pinged_at = clock()
+
+
+class RecentEvents(object):
+    """ Keys of the last `size` events received, to spot events delivered again
+    """
+
+    def __init__(self, size, key=event_key):
+        self.size = size
+        self.key = key
+        self.keys = deque()
+        self.index = set()
+
+    def add(self, event):
+        """ Remember the event, return ``False`` if it was seen already
+        """
+        key = self.key(event)
+        if key is None:
+            return True
+        if key in self.index:
+            return False
+        self.keys.append(key)
+        self.index.add(key)
+        if len(self.keys) > self.size:
+            self.index.discard(self.keys.popleft())
+        return True
+
+
+def literal_prefix(pattern):
+    """ Return the literal text any message matched by `pattern` starts with
+    """
+    if pattern.flags & re.IGNORECASE:
+        return ""
+    parsed = list(sre_parse.parse(pattern.pattern, pattern.flags))
+    if parsed and parsed[0] == (sre_constants.AT, sre_constants.AT_BEGINNING):
+        parsed = parsed[1:]
+    prefix = []
+    for op, value in parsed:
+        if op != sre_constants.LITERAL:
+            break
+        prefix.append(u"%c" % value)
+    return u"".join(prefix)
+
+
+class MessageMatcher(object):
+    """ Combined matcher for message entrypoints of a bot
+
+    Entrypoints are kept in a trie keyed by the literal prefix of their
+    message patterns. A single walk over the message text collects the
+    entrypoints whose pattern can possibly match, so only their patterns
+    are tried instead of every pattern registered for the bot.
+
+    """
+
+    def __init__(self, providers):
+        self.providers = providers
+        self.trie = {}
+        for provider in providers:
+            node = self.trie
+            for char in provider.message_prefix:
+                node = node.setdefault(char, {})
+            node.setdefault(None, []).append(provider)
+
+    def candidates(self, text):
+        node = self.trie
+        for provider in node.get(None, ()):
+            yield provider
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                return
+            for provider in node.get(None, ()):
+                yield provider
+
+    def handle_event(self, event):
+        for provider in self.candidates(event.get("text", "")):
+            provider.handle_event(event)
+
+
+def compile_message_pattern(message_pattern):
+    """ Return the compiled pattern and its literal prefix, if there is one
+    """
+    if not message_pattern:
+        return None, u""
+    pattern = re.compile(message_pattern)
+    return pattern, literal_prefix(pattern)
+
+
+def message_arguments(message_pattern, event):
+    """ Return arguments of a worker handling the message event
+
+    Groups matched by the pattern are passed on after the event and its
+    text, named groups as keyword arguments. Returns ``None`` if the
+    pattern does not match.
+
+    """
+    text = event.get("text")
+    if not message_pattern:
+        return (event, text), {}
+    match = message_pattern.match(event.get("text", ""))
+    if not match:
+        return None
+    kwargs = match.groupdict()
+    args = () if kwargs else match.groups()
+    return (event, text) + args, kwargs
+
+
+def index_providers(providers, scope, patterned):
+    """ Index providers by their scope and the event type they listen to
+
+    Catch-all providers are stored under ``(scope, None)`` and each typed
+    route also includes the catch-all providers of its scope, so that
+    routing an event costs a single lookup. Providers `patterned` tells
+    apart are grouped into one :class:`MessageMatcher` per scope.
+
+    """
+    typed = defaultdict(list)
+    wildcards = defaultdict(list)
+    matched = defaultdict(list)
+    for provider in providers:
+        if patterned(provider):
+            matched[scope(provider)].append(provider)
+        elif provider.event_type:
+            typed[(scope(provider), provider.event_type)].append(provider)
+        else:
+            wildcards[scope(provider)].append(provider)
+    for key, providers in matched.items():
+        typed[(key, EVENT_TYPE_MESSAGE)].append(MessageMatcher(providers))
+
+    routes = {}
+    for key, providers in wildcards.items():
+        routes[(key, None)] = tuple(providers)
+    for (key, event_type), providers in typed.items():
+        routes[(key, event_type)] = tuple(providers) + tuple(wildcards.get(key, ()))
+    return routes
+
+
+def routed(routes, scope, event):
+    """ Return providers of the route the event takes
+    """
+    providers = routes.get((scope, event.get("type")))
+    if providers is None:
+        providers = routes.get((scope, None), ())
+    return providers
+
+
+def spawning(providers):
+    """ Count the providers spawning workers as soon as they handle an event
+    """
+    count = 0
+    for provider in providers:
+        if isinstance(provider, MessageMatcher):
+            count += spawning(provider.providers)
+        else:
+            count += provider.ingress is None
+    return count
+
+
+class WorkspaceSnapshot(object):
+    """ Users, channels and IMs of a bot's workspace indexed by their IDs
+
+    Loaded from the payload of ``rtm.start`` when the bot connects and kept
+    up to date by RTM events. With `lazy` set (when the bot connects with
+    ``rtm.connect`` which carries no workspace data) entities missing from
+    the snapshot are looked for in further pages of ``users.list`` and
+    ``conversations.list``, loaded on demand.
+
+    Entities are returned as they came from Slack and must not be modified.
+
+    """
+
+    page_size = 200
+
+    # lists to load lazily by the kind of entities they hold
+    lists = {
+        "users": ("users.list", "members", {}),
+        "channels": (
+            "conversations.list",
+            "channels",
+            {"types": "public_channel,private_channel,mpim,im"},
+        ),
+    }
+
+    def __init__(self, client, lazy=False):
+        self.client = client
+        self.lazy = lazy
+        self.team = None
+        self.self = None
+        self.users = {}
+        self.channels = {}
+        self.ims = {}
+        self.ims_by_user = {}
+        # cursor of the next page to load by kind, None once all are loaded
+        self.cursors = {kind: "" for kind in self.lists} if lazy else {}
+        self.locks = {kind: Semaphore() for kind in self.lists}
+
+    def load(self, login_data):
+        self.team = login_data.get("team")
+        self.self = login_data.get("self")
+        for user in login_data.get("users", ()):
+            self.add_user(user)
+        for channel in chain(
+            login_data.get("channels", ()),
+            login_data.get("groups", ()),
+            login_data.get("mpims", ()),
+            login_data.get("ims", ()),
+        ):
+            self.add_channel(channel)
+
+    def add_user(self, user):
+        self.users[user["id"]] = user
+
+    def add_channel(self, channel):
+        if channel.get("is_im"):
+            self.ims[channel["id"]] = channel
+            self.ims_by_user[channel["user"]] = channel
+        else:
+            self.channels[channel["id"]] = channel
+
+    # types of events changing the snapshot
+    event_types = frozenset(
+        [
+            "team_join",
+            "user_change",
+            "channel_created",
+            "group_joined",
+            "im_created",
+            "channel_rename",
+            "group_rename",
+            "channel_deleted",
+            "group_left",
+        ]
+    )
+
+    def update(self, event):
+        """ Apply a change announced by an RTM event
+        """
+        event_type = event.get("type")
+        if event_type in ("team_join", "user_change"):
+            self.add_user(event["user"])
+        elif event_type in ("channel_created", "group_joined"):
+            self.add_channel(dict(event["channel"], is_im=False))
+        elif event_type == "im_created":
+            self.add_channel(dict(event["channel"], user=event["user"], is_im=True))
+        elif event_type in ("channel_rename", "group_rename"):
+            channel = event["channel"]
+            self.channels.setdefault(channel["id"], {}).update(channel)
+        elif event_type in ("channel_deleted", "group_left"):
+            self.channels.pop(event["channel"], None)
+
+    def load_page(self, kind):
+        """ Load next page of entities of given kind
+
+        Returns ``False`` when there is nothing more to load.
+
+        """
+        cursor = self.cursors.get(kind)
+        if cursor is None:
+            return False
+        method, field, kwargs = self.lists[kind]
+        response = self.client.api_call(
+            method, limit=self.page_size, cursor=cursor, **kwargs
+        )
+        if not response.get("ok"):
+            return False
+        add = self.add_user if kind == "users" else self.add_channel
+        for entity in response.get(field, ()):
+            add(entity)
+        metadata = response.get("response_metadata") or {}
+        self.cursors[kind] = metadata.get("next_cursor") or None
+        return True
+
+    def lookup(self, kind, index, key):
+        with self.locks[kind]:
+            value = index.get(key)
+            while value is None and self.load_page(kind):
+                value = index.get(key)
+        return value
+
+    def user(self, user_id):
+        return self.lookup("users", self.users, user_id)
+
+    def channel(self, channel_id):
+        return self.lookup("channels", self.channels, channel_id)
+
+    def im(self, im_id):
+        return self.lookup("channels", self.ims, im_id)
+
+    def im_with(self, user_id):
+        return self.lookup("channels", self.ims_by_user, user_id)
+
+
+class OutboxFull(Exception):
+    pass
+
+
+class Outbox(object):
+    """ Rate limited queue of messages to be sent over a bot's RTM connection
+
+    Messages are sent by :meth:`run`, which is meant to be running in its own
+    thread, as soon as both the per channel and the per connection token
+    buckets allow. Messages waiting for the same channel are coalesced into
+    a single message where possible. They are sent with `send`, the client's
+    ``rtm_send_message`` unless given.
+
+    """
+
+    max_message_length = 4000
+
+    def __init__(
+        self,
+        client,
+        size=1000,
+        when_full=constants.WHEN_FULL_BLOCK,
+        channel_rate=1,
+        connection_rate=10,
+        coalesce=True,
+        send=None,
+    ):
+        self.client = client
+        self.send = send or client.rtm_send_message
+        self.size = size
+        self.when_full = when_full
+        self.channel_rate = channel_rate
+        self.coalesce = coalesce
+
+        self.pending = deque()
+        self.connection_bucket = TokenBucket(connection_rate)
+        self.channel_buckets = {}
+        self.conditions = {}
+        self.counters = {"sent": 0, "dropped": 0, "coalesced": 0, "failed": 0}
+
+    @property
+    def stats(self):
+        return dict(self.counters, depth=len(self.pending))
+
+    def wait(self, condition):
+        event = self.conditions.get(condition)
+        if event is None:
+            event = self.conditions[condition] = Event()
+        event.wait()
+
+    def notify(self, condition):
+        event = self.conditions.pop(condition, None)
+        if event is not None:
+            event.send()
+
+    def put(self, channel, message):
+        while len(self.pending) >= self.size:
+            if self.when_full == constants.WHEN_FULL_DROP_OLDEST:
+                self.pending.popleft()
+                self.counters["dropped"] += 1
+            elif self.when_full == constants.WHEN_FULL_ERROR:
+                self.counters["dropped"] += 1
+                raise OutboxFull("Outbox is full ({} messages)".format(self.size))
+            else:
+                self.wait("space")
+        self.pending.append((channel, message))
+        self.notify("messages")
+
+    def join(self, timeout=None):
+        """ Wait until all pending messages are sent
+        """
+        with eventlet.Timeout(timeout, False):
+            while self.pending:
+                self.wait("empty")
+
+    def channel_bucket(self, channel):
+        bucket = self.channel_buckets.get(channel)
+        if bucket is None:
+            bucket = self.channel_buckets[channel] = TokenBucket(self.channel_rate)
+        return bucket
+
+    def next_ready(self):
+        """ Return index of the first message which can be sent right away
+
+        Returns ``None`` together with seconds to wait if rate limits do not
+        allow sending any of the pending messages yet.
+
+        """
+        delay = self.connection_bucket.delay()
+        if delay:
+            return None, delay
+        delays = {}
+        for index, (channel, _) in enumerate(self.pending):
+            if channel not in delays:
+                delays[channel] = self.channel_bucket(channel).delay()
+                if not delays[channel]:
+                    return index, 0
+        return None, min(delays.values())
+
+    def take(self, index):
+        channel, message = self.pending[index]
+        del self.pending[index]
+        if self.coalesce:
+            messages = [message]
+            length = len(message)
+            for other_channel, other_message in list(self.pending):
+                if other_channel != channel:
+                    continue
+                length += len(other_message) + 1
+                if length > self.max_message_length:
+                    break
+                self.pending.remove((other_channel, other_message))
+                messages.append(other_message)
+            self.counters["coalesced"] += len(messages) - 1
+            message = "\n".join(messages)
+        return channel, message
+
+    def run(self):
+        while True:
+            while not self.pending:
+                self.wait("messages")
+            index, delay = self.next_ready()
+            if index is None:
+                with eventlet.Timeout(delay, False):
+                    self.wait("messages")
+                continue
+            channel, message = self.take(index)
+            self.connection_bucket.consume()
+            self.channel_bucket(channel).consume()
+            try:
+                self.send(channel, message)
+            except Exception:
+                log.warning("Failed to send message to %s", channel, exc_info=True)
+                self.counters["failed"] += 1
+            else:
+                self.counters["sent"] += 1
+            self.notify("space")
+            if not self.pending:
+                self.notify("empty")
+                self.channel_buckets = {
+                    channel: bucket
+                    for channel, bucket in self.channel_buckets.items()
+                    if not bucket.full
+                }
+
+
+class Ingress(object):
+    """ Bounded queue of events waiting for a worker of one entrypoint
+
+    Events are queued by the reader without blocking and handed over to at
+    most ``concurrency`` workers at a time by :meth:`run`, which is meant to
+    be running in its own thread. When the queue is full an event is shed
+    according to the ``overload`` policy:
+
+    ``shed_oldest``
+        drop the oldest queued event
+    ``shed_by_event_type``
+        drop the oldest queued event of one of ``shed_event_types``,
+        or the oldest queued event if there is none
+    ``fair``
+        queue events per channel and hand them over round robin, drop the
+        oldest event of the channel with most events queued
+
+    Events dropped are passed on to `on_shed` together with their job, if
+    given.
+
+    """
+
+    def __init__(
+        self,
+        size=1000,
+        concurrency=10,
+        overload=constants.OVERLOAD_SHED_OLDEST,
+        shed_event_types=(),
+        on_shed=None,
+    ):
+        self.size = size
+        self.concurrency = concurrency
+        self.overload = overload
+        self.shed_event_types = frozenset(shed_event_types)
+        self.on_shed = on_shed
+
+        # queued (event, job) pairs by channel, or all under ``None``
+        self.lanes = OrderedDict()
+        self.depth = 0
+        self.items = Semaphore(0)
+        self.slots = Semaphore(concurrency)
+        self.counters = {"queued": 0, "dropped": 0, "processed": 0}
+
+    @property
+    def stats(self):
+        return dict(self.counters, depth=self.depth)
+
+    def put(self, event, job):
+        if self.overload == constants.OVERLOAD_FAIR:
+            key = event.get("channel")
+        else:
+            key = None
+        lane = self.lanes.get(key)
+        if lane is None:
+            lane = self.lanes[key] = deque()
+        lane.append((event, job))
+        self.counters["queued"] += 1
+        if self.depth < self.size:
+            self.depth += 1
+            self.items.release()
+        else:
+            self.shed()
+
+    def shed(self):
+        if self.overload == constants.OVERLOAD_FAIR:
+            key, lane = max(self.lanes.items(), key=lambda item: len(item[1]))
+            shed = lane.popleft()
+        else:
+            key, lane = None, self.lanes[None]
+            for index, (event, job) in enumerate(lane):
+                if event.get("type") in self.shed_event_types:
+                    shed = event, job
+                    del lane[index]
+                    break
+            else:
+                shed = lane.popleft()
+        if not lane:
+            del self.lanes[key]
+        self.counters["dropped"] += 1
+        if self.on_shed is not None:
+            self.on_shed(*shed)
+
+    def take(self):
+        key, lane = next(iter(self.lanes.items()))
+        _, job = lane.popleft()
+        del self.lanes[key]
+        if lane:
+            # next turn goes to the other channels
+            self.lanes[key] = lane
+        self.depth -= 1
+        return job
+
+    def run(self, spawn_worker):
+        while True:
+            self.slots.acquire()
+            self.items.acquire()
+            args, kwargs, handle_result = self.take()
+            try:
+                spawn_worker(args, kwargs, partial(self.done, handle_result))
+            except Exception:
+                self.slots.release()
+                raise
+
+    def done(self, handle_result, worker_ctx, result, exc_info):
+        try:
+            if handle_result is not None:
+                return handle_result(worker_ctx, result, exc_info)
+            return result, exc_info
+        finally:
+            self.counters["processed"] += 1
+            self.slots.release()
+
+
+class OrderedLanes(object):
+    """ Hand over events with the same key one at a time, in order
+
+    An event is passed on to `dispatch` once the worker handling the
+    previous event with the same key is done. Events with different keys,
+    or without a key, are passed on straight away. Keys are read from the
+    ``ordered_by`` field of events, a thread is keyed by the ``ts`` of its
+    parent message.
+
+    At most `size` events wait for their turn, once there are more the
+    oldest event of the key with most events waiting is dropped.
+
+    """
+
+    def __init__(self, ordered_by, dispatch, spawn_thread, size=1000):
+        self.ordered_by = ordered_by
+        self.dispatch = dispatch
+        self.spawn_thread = spawn_thread
+        self.size = size
+        # events waiting for the running one by key, a key is present
+        # for as long as a worker handles an event with the key
+        self.waiting = {}
+        self.depth = 0
+        self.dropped = 0
+
+    def key(self, event):
+        if self.ordered_by == constants.ORDERED_BY_THREAD:
+            return event.get("thread_ts") or event.get("ts")
+        return event.get(self.ordered_by)
+
+    def put(self, event, job):
+        key = self.key(event)
+        if key is None:
+            self.dispatch(event, job)
+        elif key in self.waiting:
+            self.waiting[key].append((event, job))
+            self.depth += 1
+            if self.depth > self.size:
+                max(self.waiting.values(), key=len).popleft()
+                self.depth -= 1
+                self.dropped += 1
+        else:
+            self.waiting[key] = deque()
+            self.start(key, event, job)
+
+    def start(self, key, event, job):
+        args, kwargs, handle_result = job
+        self.dispatch(event, (args, kwargs, partial(self.done, key, handle_result)))
+
+    def done(self, key, handle_result, worker_ctx, result, exc_info):
+        try:
+            if handle_result is not None:
+                return handle_result(worker_ctx, result, exc_info)
+            return result, exc_info
+        finally:
+            # the worker calling this still holds its slot in the worker
+            # pool, the next one is started from another thread
+            self.release(key)
+
+    def shed(self, event, job):
+        """ Let the next event of a key go when the running one is dropped
+        """
+        key = self.key(event)
+        if key is not None:
+            self.release(key)
+
+    def release(self, key):
+        waiting = self.waiting[key]
+        if waiting:
+            event, job = waiting.popleft()
+            self.depth -= 1
+            self.spawn_thread(partial(self.start, key, event, job))
+        else:
+            del self.waiting[key]
+
+
+class BotScheduler(object):
+    """ Bounded event buffers of the bots, handed over to workers in fair turns
+
+    Readers put events into the buffer of their bot without ever blocking,
+    the oldest event is dropped when a buffer is full. :meth:`run`, which is
+    meant to be running in its own thread, takes turns between the bots with
+    events buffered, round robin, handing over up to the bot's weight in
+    events per turn. Bots running as many workers as their budget allows are
+    skipped until one of the workers is done, so a bot flooded with events
+    holds up neither the reading nor the handling of the other bots' events.
+
+    An event is only handed over once the workers it may spawn, as told by
+    `workers`, fit into both the bot's budget and the free slots of the
+    worker `pool`, so handing it over never waits for a worker. Workers of
+    other entrypoints free slots of the pool without telling, so the pool
+    is checked again every `poll_interval` seconds while events wait for it.
+
+    """
+
+    def __init__(
+        self,
+        size=1000,
+        weights=None,
+        budgets=None,
+        budget=10,
+        workers=None,
+        pool=None,
+        poll_interval=0.01,
+    ):
+        self.size = size
+        self.weights = weights or {}
+        self.budgets = budgets or {}
+        self.budget = budget
+        self.workers = workers or (lambda bot_name, event: 1)
+        self.pool = pool
+        self.poll_interval = poll_interval
+
+        # buffered events of bots with any, in the order of their turns
+        self.buffers = OrderedDict()
+        self.running = defaultdict(int)
+        self.changed = None
+        self.counters = defaultdict(
+            lambda: {"buffered": 0, "dropped": 0, "dispatched": 0}
+        )
+
+    @property
+    def stats(self):
+        return {
+            bot_name: dict(
+                counters,
+                depth=self.depth(bot_name),
+                running=self.running[bot_name],
+            )
+            for bot_name, counters in self.counters.items()
+        }
+
+    def depth(self, bot_name):
+        return len(self.buffers.get(bot_name, ()))
+
+    def wait(self, timeout=None):
+        # only the thread running the scheduler ever waits
+        self.changed = Event()
+        with eventlet.Timeout(timeout, False):
+            self.changed.wait()
+
+    def notify(self):
+        changed, self.changed = self.changed, None
+        if changed is not None:
+            changed.send()
+
+    def put(self, bot_name, event):
+        buffer = self.buffers.get(bot_name)
+        if buffer is None:
+            buffer = self.buffers[bot_name] = deque()
+        buffer.append(event)
+        counters = self.counters[bot_name]
+        counters["buffered"] += 1
+        if len(buffer) > self.size:
+            buffer.popleft()
+            counters["dropped"] += 1
+        self.notify()
+
+    def available(self, bot_name, event):
+        """ Tell whether workers handling the event can be spawned right away
+
+        An event needing more workers than a bot's budget, or than the pool
+        holds, goes once the bot's workers, or all workers, are done.
+
+        """
+        workers = self.workers(bot_name, event)
+        running = self.running[bot_name]
+        if running and running + workers > self.budgets.get(bot_name, self.budget):
+            return False
+        if self.pool is None:
+            return True
+        return self.pool.free() >= min(workers, self.pool.size)
+
+    def next_turn(self):
+        """ Return name of the next bot to hand events over of, if any can
+        """
+        for bot_name, buffer in self.buffers.items():
+            if self.available(bot_name, buffer[0]):
+                return bot_name
+        return None
+
+    def run(self, handle):
+        while True:
+            bot_name = self.next_turn()
+            if bot_name is None:
+                # events held up by the pool only are checked again shortly
+                self.wait(self.poll_interval if self.buffers else None)
+                continue
+            buffer = self.buffers[bot_name]
+            for _ in range(self.weights.get(bot_name, 1)):
+                if not buffer or not self.available(bot_name, buffer[0]):
+                    break
+                self.counters[bot_name]["dispatched"] += 1
+                handle(bot_name, buffer.popleft())
+            # next turn goes to the other bots
+            del self.buffers[bot_name]
+            if buffer:
+                self.buffers[bot_name] = buffer
+
+    def track(self, bot_name, handle_result):
+        """ Count a worker against the bot's budget until it is done
+
+        Returns result handler of the worker releasing its place in the
+        budget once called.
+
+        """
+        self.running[bot_name] += 1
+        return partial(self.done, bot_name, handle_result)
+
+    def release(self, bot_name):
+        self.running[bot_name] -= 1
+        self.notify()
+
+    def done(self, bot_name, handle_result, worker_ctx, result, exc_info):
+        try:
+            if handle_result is not None:
+                return handle_result(worker_ctx, result, exc_info)
+            return result, exc_info
+        finally:
+            self.release(bot_name)
+
+
 class SlackRTMClientManager(SharedExtension, ProviderCollector):
+
+    cache = EntityCache()
+    metrics = Instrumentation()
+
+    # types of events the manager itself needs to see
+    internal_event_types = (
+        frozenset(["hello", "pong", "goodbye", "reconnect_url"])
+        | frozenset(INVALIDATING_EVENTS)
+        | WorkspaceSnapshot.event_types
+    )
+
     def __init__(self):
 
         super(SlackRTMClientManager, self).__init__()
 
+        self.read_mode = constants.READ_MODE_POLL
         self.read_interval = 1
+        self.ping_interval = 30
+
+        self.connect_method = constants.CONNECT_RTM_START
+        self.connect_pool_size = 1
+        self.connect_stagger = 0
+        self.connect_wait = True
+
+        self.auto_reconnect = False
+        self.reconnect_delay = 1
+        self.max_reconnect_delay = 60
+        self.pong_timeout = None
+        self.dedupe_size = 1000
+
+        # decodes raw frames instead of the client when set
+        self.decode = None
+        self.skip_unsubscribed = False
+        self.skipped = defaultdict(int)
+
+        self.transport = Transport()
+
+        # set on start when metrics are enabled
+        self.recorder = None
+
+        # name of this instance among the ones sharing the bots, ``None``
+        # when this instance connects all of them
+        self.member = None
+        self.members = None
+        self.shard_replicas = 100
+        self.shard_interval = 10
+        self.ring = None
+
+        # app-level connections of each bot when events come over Socket
+        # Mode instead of RTM
+        self.socket_mode = False
+        self.connections = {}
+        self.envelopes = {}
 
         self.clients = {}
+        self.owned = set()
+        # reading threads by bot name, one per connection
+        self.readers = {}
+        self.ready = defaultdict(Event)
+        self.reconnect_urls = {}
+        self.recent_events = {}
+        self.workspaces = {}
+        self.outboxes = {}
+        self.drain_timeout = 10
+        # hands events over to workers in fair turns between the bots when
+        # set, readers hand them over themselves otherwise
+        self.scheduler = None
+
+        # providers by (bot name, event type), providers subscribed to any
+        # event type of a bot are stored under (bot name, None)
+        self.routes = {}
+        # workers spawned at most by the providers of each route
+        self.costs = {}
+        # event types handled by bot name, ``None`` for all of them
+        self.subscribed = {}
 
     def setup(self):
 
@@ -46,78 +1002,855 @@ class SlackRTMClientManager(SharedExtension, ProviderCollector):
                 )
             )
 
-    def start(self):
+        self.read_mode = config.get("READ_MODE", self.read_mode)
+        if self.read_mode not in constants.READ_MODES:
+            raise ConfigurationError(
+                "Unknown `READ_MODE` `{}` in `{}` config".format(
+                    self.read_mode, constants.CONFIG_KEY
+                )
+            )
+        self.read_interval = config.get("READ_INTERVAL", self.read_interval)
+        self.ping_interval = config.get("PING_INTERVAL", self.ping_interval)
+
+        self.connect_method = config.get("CONNECT_METHOD", self.connect_method)
+        if self.connect_method not in constants.CONNECT_METHODS:
+            raise ConfigurationError(
+                "Unknown `CONNECT_METHOD` `{}` in `{}` config".format(
+                    self.connect_method, constants.CONFIG_KEY
+                )
+            )
+
+        connect_pool = config.get("CONNECT_POOL", {})
+        self.connect_pool_size = connect_pool.get("SIZE", self.connect_pool_size)
+        self.connect_stagger = connect_pool.get("STAGGER", self.connect_stagger)
+        self.connect_wait = connect_pool.get("WAIT", self.connect_wait)
+
+        transport = config.get("TRANSPORT", constants.TRANSPORT_EVENTLET)
+        if transport not in constants.TRANSPORTS:
+            raise ConfigurationError(
+                "Unknown `TRANSPORT` `{}` in `{}` config".format(
+                    transport, constants.CONFIG_KEY
+                )
+            )
+        self.transport = get_transport(transport)
+        self.transport.setup()
+        for client in self.clients.values():
+            self.transport.attach(client)
+
+        sharding_config = config.get("SHARDING")
+        if sharding_config is not None:
+            self.setup_sharding(sharding_config)
+
+        decoder = config.get("DECODER")
+        self.skip_unsubscribed = config.get("SKIP_UNSUBSCRIBED", False)
+        if decoder is not None or self.skip_unsubscribed:
+            self.setup_decoder(decoder or constants.DECODER_JSON)
+
+        reconnect_config = config.get("RECONNECT")
+        if reconnect_config is not None:
+            self.setup_reconnect(reconnect_config)
+
+        socket_mode_config = config.get("SOCKET_MODE")
+        if socket_mode_config is not None:
+            self.setup_socket_mode(socket_mode_config)
+
+        outbox_config = config.get("OUTBOX")
+        if outbox_config is not None:
+            self.setup_outboxes(outbox_config)
+
+        scheduler_config = config.get("SCHEDULER")
+        if scheduler_config is not None:
+            self.setup_scheduler(scheduler_config)
+
+    def setup_decoder(self, decoder):
+        if callable(decoder):
+            self.decode = decoder
+            return
+        if decoder not in constants.DECODERS:
+            raise ConfigurationError(
+                "Unknown `DECODER` `{}` in `{}` config".format(
+                    decoder, constants.CONFIG_KEY
+                )
+            )
+        try:
+            self.decode = get_decoder(decoder)
+        except ImportError:
+            raise ConfigurationError(
+                "`{}` decoder requires the `{}` package".format(decoder, decoder)
+            )
+
+    def setup_sharding(self, config):
+        self.member = config.get("MEMBER")
+        self.members = config.get("MEMBERS")
+        if self.member is None or self.members is None:
+            raise ConfigurationError(
+                "`SHARDING` needs both `MEMBER` and `MEMBERS` in `{}` config".format(
+                    constants.CONFIG_KEY
+                )
+            )
+        if not isinstance(self.members, (list, tuple)) and not callable(self.members):
+            self.members = import_path(self.members)
+        self.shard_replicas = config.get("REPLICAS", self.shard_replicas)
+        self.shard_interval = config.get("INTERVAL", self.shard_interval)
+
+    def setup_reconnect(self, config):
+        self.auto_reconnect = True
+        self.reconnect_delay = config.get("DELAY", self.reconnect_delay)
+        self.max_reconnect_delay = config.get("MAX_DELAY", self.max_reconnect_delay)
+        self.pong_timeout = config.get("PONG_TIMEOUT", 10)
+        self.dedupe_size = config.get("DEDUPE", self.dedupe_size)
+        if self.dedupe_size:
+            for bot_name in self.clients:
+                self.recent_events[bot_name] = RecentEvents(self.dedupe_size)
+
+    def setup_socket_mode(self, config):
+        app_tokens = dict(config.get("APP_TOKENS", {}))
+        if config.get("APP_TOKEN"):
+            app_tokens[constants.DEFAULT_BOT_NAME] = config["APP_TOKEN"]
+        connections = config.get("CONNECTIONS", 2)
+        dedupe_size = config.get("DEDUPE", 1000)
+        for bot_name in self.clients:
+            app_token = app_tokens.get(bot_name)
+            if not app_token:
+                raise ConfigurationError(
+                    "No app token for `{}` bot in `SOCKET_MODE` of `{}` config".format(
+                        bot_name, constants.CONFIG_KEY
+                    )
+                )
+            self.connections[bot_name] = [
+                self.make_connection(app_token) for _ in range(connections)
+            ]
+            if dedupe_size:
+                self.envelopes[bot_name] = RecentEvents(
+                    dedupe_size, key=socket_mode.envelope_key
+                )
+        self.socket_mode = True
+        # pongs are answered below the client and cannot tell the connection
+        # is alive, so idle connections are pinged without giving up on them
+        self.pong_timeout = None
+
+    def make_connection(self, app_token):
+        client = SlackClient(app_token)
+        client.server.ping = partial(socket_mode.ping, client.server)
+        self.transport.attach(client)
+        return client
+
+    def setup_outboxes(self, config):
+        when_full = config.get("WHEN_FULL", constants.WHEN_FULL_BLOCK)
+        if when_full not in constants.WHEN_FULL_POLICIES:
+            raise ConfigurationError(
+                "Unknown `OUTBOX.WHEN_FULL` policy `{}` in `{}` config".format(
+                    when_full, constants.CONFIG_KEY
+                )
+            )
+        self.drain_timeout = config.get("DRAIN_TIMEOUT", self.drain_timeout)
         for bot_name, client in self.clients.items():
-            client.server.rtm_connect()
-            run = partial(self.run, bot_name, client)
-            self.container.spawn_managed_thread(run)
+            self.outboxes[bot_name] = Outbox(
+                client,
+                size=config.get("SIZE", 1000),
+                when_full=when_full,
+                channel_rate=config.get("CHANNEL_RATE", 1),
+                connection_rate=config.get("CONNECTION_RATE", 10),
+                coalesce=config.get("COALESCE", True),
+                send=self.sender(bot_name),
+            )
+
+    def setup_scheduler(self, config):
+        weights = config.get("WEIGHTS", {})
+        budgets = config.get("BUDGETS", {})
+        for key, bot_names in (("WEIGHTS", weights), ("BUDGETS", budgets)):
+            for bot_name in bot_names:
+                if bot_name not in self.clients:
+                    raise ConfigurationError(
+                        "Unknown `{}` bot in `SCHEDULER.{}` of `{}` config".format(
+                            bot_name, key, constants.CONFIG_KEY
+                        )
+                    )
+        # an even share of the container's workers by default, so that one
+        # bot cannot keep all of them busy
+        budget = config.get(
+            "BUDGET", max(1, self.container.max_workers // len(self.clients))
+        )
+        self.scheduler = BotScheduler(
+            size=config.get("BUFFER_SIZE", 1000),
+            weights=weights,
+            budgets=budgets,
+            budget=budget,
+            workers=self.workers,
+            pool=self.container._worker_pool,
+        )
+
+    def start(self):
+        self.transport.start()
+        self.recorder = self.metrics.recorder
+        if self.recorder is not None:
+            self.instrument_outboxes()
+            self.instrument_scheduler()
+        for outbox in self.outboxes.values():
+            self.container.spawn_managed_thread(outbox.run)
+        if self.scheduler is not None:
+            self.container.spawn_managed_thread(
+                partial(self.scheduler.run, self.handle)
+            )
+        if self.member is None:
+            self.owned = set(self.clients)
+        else:
+            self.owned = self.shard(self.get_members())
+            if callable(self.members):
+                self.container.spawn_managed_thread(self.watch_members)
+        if self.connect_wait:
+            self.connect_all()
+        else:
+            self.container.spawn_managed_thread(self.connect_all)
+
+    def instrument_outboxes(self):
+        for bot_name, outbox in self.outboxes.items():
+            outbox.send = self.sender(bot_name)
+            self.metrics.add_gauge(
+                "rtm_outbox_depth", partial(len, outbox.pending), bot=bot_name
+            )
+
+    def instrument_scheduler(self):
+        if self.scheduler is None:
+            return
+        for bot_name in self.clients:
+            self.metrics.add_gauge(
+                "rtm_buffer_depth",
+                partial(self.scheduler.depth, bot_name),
+                bot=bot_name,
+            )
+            self.metrics.add_gauge(
+                "rtm_bot_workers",
+                partial(self.scheduler.running.get, bot_name, 0),
+                bot=bot_name,
+            )
+
+    def connect_all(self, bot_names=None):
+        """ Connect all bots, at most ``connect_pool_size`` at a time
+
+        Each bot starts reading events as soon as it is connected, without
+        waiting for the others. Connects the bots of this instance's shard
+        unless given the names of the bots to connect.
+
+        """
+        if bot_names is None:
+            bot_names = self.owned
+        bots = [
+            (bot_name, client)
+            for bot_name, client in self.clients.items()
+            if bot_name in bot_names
+        ]
+        pool = GreenPool(self.connect_pool_size)
+        started = clock()
+        for _ in pool.starmap(self.start_bot, bots):
+            pass
+        elapsed = clock() - started
+        log.info("Connected %d bots to Slack RTM in %.3fs", len(bots), elapsed)
+
+    def start_bot(self, bot_name, client):
+        # spread connects of many bots over time so that they do not hit
+        # the rate limit of the connect method all at once
+        if self.connect_stagger:
+            eventlet.sleep(random.uniform(0, self.connect_stagger))
+        started = clock()
+        connections = self.bot_connections(bot_name)
+        for connection in connections:
+            self.connect(bot_name, connection)
+        log.info("Connected `%s` bot in %.3fs", bot_name, clock() - started)
+        if bot_name not in self.owned:
+            # moved to another instance while connecting
+            self.stop_bot(bot_name)
+            return
+        self.readers[bot_name] = [
+            self.container.spawn_managed_thread(partial(self.run, bot_name, connection))
+            for connection in connections
+        ]
+
+    def bot_connections(self, bot_name):
+        """ Return clients of the bot's connections
+        """
+        return self.connections.get(bot_name) or [self.clients[bot_name]]
+
+    def stop_bot(self, bot_name):
+        for reader in self.readers.pop(bot_name, ()):
+            reader.kill()
+        for connection in self.bot_connections(bot_name):
+            self.transport.disconnect(connection)
+        self.ready.pop(bot_name, None)
+        self.workspaces.pop(bot_name, None)
+        log.info("Disconnected `%s` bot", bot_name)
+
+    def get_members(self):
+        if callable(self.members):
+            return self.members()
+        return self.members
+
+    def shard(self, members):
+        """ Return names of the bots this instance connects given all members
+        """
+        self.ring = HashRing(members, self.shard_replicas)
+        if self.member not in self.ring.members:
+            log.warning("`%s` is not among shard members %s", self.member, members)
+        return {
+            bot_name
+            for bot_name in self.clients
+            if self.ring.owner(bot_name) == self.member
+        }
+
+    def watch_members(self):
+        """ Rebalance bots every ``shard_interval`` seconds
+        """
+        while True:
+            eventlet.sleep(self.shard_interval)
+            try:
+                members = self.get_members()
+            except Exception:
+                log.warning("Failed to get shard members", exc_info=True)
+                continue
+            self.rebalance(members)
+
+    def rebalance(self, members):
+        """ Take over bots moved to this instance and let go of the others
+
+        Bots moved away are disconnected straight away while bots moved here
+        are connected in the background, so a bot may be connected twice for
+        as long as it takes to connect it.
+
+        """
+        if self.ring is not None and self.ring.members == frozenset(members):
+            return
+        owned = self.shard(members)
+        gained = owned - self.owned
+        lost = self.owned - owned
+        self.owned = owned
+        for bot_name in lost:
+            self.stop_bot(bot_name)
+        if gained:
+            self.container.spawn_managed_thread(partial(self.connect_all, gained))
+        log.info(
+            "Rebalanced bots among %d members, %d gained, %d lost",
+            len(self.ring.members),
+            len(gained),
+            len(lost),
+        )
+
+    def connect(self, bot_name, client):
+        if self.socket_mode:
+            self.connect_socket(bot_name, client)
+        else:
+            self.connect_rtm(bot_name, client)
+        ready = self.ready[bot_name]
+        if not ready.ready():
+            ready.send()
+
+    def connect_rtm(self, bot_name, client):
+        use_rtm_start = self.connect_method == constants.CONNECT_RTM_START
+        client.server.rtm_connect(use_rtm_start=use_rtm_start)
+
+        workspace = WorkspaceSnapshot(client, lazy=not use_rtm_start)
+        workspace.load(client.server.login_data)
+        self.workspaces[bot_name] = workspace
+        if use_rtm_start:
+            self.seed_cache(bot_name, workspace)
+
+    def connect_socket(self, bot_name, client):
+        """ Open a Socket Mode connection of the bot
+
+        The workspace of the bot is loaded lazily with its token, as Socket
+        Mode carries no workspace data, when its first connection opens.
+
+        """
+        socket_mode.open_connection(client)
+        if bot_name not in self.workspaces:
+            bot_client = self.clients[bot_name]
+            workspace = WorkspaceSnapshot(bot_client, lazy=True)
+            workspace.load(socket_mode.load_identity(bot_client))
+            self.workspaces[bot_name] = workspace
+
+    def wait_until_ready(self, bot_name, timeout=None):
+        """ Block until the bot is connected, return whether it is
+        """
+        with eventlet.Timeout(timeout, False):
+            self.ready[bot_name].wait()
+        return self.ready[bot_name].ready()
+
+    def seed_cache(self, bot_name, workspace):
+        channels = chain(workspace.channels.values(), workspace.ims.values())
+        entries = chain(
+            [("team", None, workspace.team)],
+            (("users", user["id"], user) for user in workspace.users.values()),
+            (("channels", channel["id"], channel) for channel in channels),
+        )
+        for kind, entity_id, value in islice(entries, self.cache.size):
+            self.cache.set(bot_name, kind, entity_id, value)
+
+    def stop(self):
+        super(SlackRTMClientManager, self).stop()
+        for outbox in self.outboxes.values():
+            outbox.join(self.drain_timeout)
+        # stop reading before the transport closes the connections
+        for readers in self.readers.values():
+            for reader in readers:
+                reader.kill()
+        self.transport.stop()
 
     def run(self, bot_name, client):
+        """ Read events of the bot, reconnecting when the connection is lost
+
+        Without ``auto_reconnect`` errors reading from the connection
+        propagate and kill the container.
+
+        """
+        while True:
+            try:
+                self.read_events(bot_name, client)
+            except Exception:
+                if not self.auto_reconnect:
+                    raise
+                log.warning("Lost RTM connection of `%s` bot", bot_name, exc_info=True)
+            self.reconnect(bot_name, client)
+
+    def read_events(self, bot_name, client):
+        if self.read_mode == constants.READ_MODE_SELECT:
+            self.run_select(bot_name, client)
+        else:
+            self.run_poll(bot_name, client)
+
+    def reconnect(self, bot_name, client):
+        """ Connect the bot again, backing off exponentially between attempts
+
+        Uses the last ``reconnect_url`` announced by Slack if there is one,
+        falling back to a regular connect.
+
+        """
+        attempt = 0
         while True:
-            for event in client.rtm_read():
-                self.handle(bot_name, event)
+            delay = min(self.max_reconnect_delay, self.reconnect_delay * 2 ** attempt)
+            eventlet.sleep(random.uniform(delay / 2.0, delay))
+            started = clock()
+            url = self.reconnect_urls.pop(bot_name, None)
+            try:
+                if url:
+                    try:
+                        client.server.connect_slack_websocket(url)
+                    except Exception:
+                        log.info("Failed to resume `%s` bot connection", bot_name)
+                        self.connect(bot_name, client)
+                else:
+                    self.connect(bot_name, client)
+            except Exception:
+                attempt += 1
+                log.warning(
+                    "Failed to reconnect `%s` bot (attempt %d)",
+                    bot_name,
+                    attempt,
+                    exc_info=True,
+                )
+                continue
+            log.info("Reconnected `%s` bot in %.3fs", bot_name, clock() - started)
+            return
+
+    def frame_reader(self, bot_name):
+        """ Return function reading events of the bot, ``None`` to use the client
+        """
+        if self.socket_mode:
+            return partial(self.read_envelopes, bot_name)
+        if self.decode is None:
+            return None
+        return partial(self.read_frames, bot_name)
+
+    def read_frames(self, bot_name, client):
+        """ Read and decode frames of the bot until there are events to handle
+
+        With ``skip_unsubscribed`` frames which cannot be of any type the bot
+        is subscribed to are dropped without decoding.
+
+        """
+        if self.skip_unsubscribed:
+            subscribed = self.subscribed.get(bot_name, self.internal_event_types)
+        else:
+            subscribed = None
+        while True:
+            data = client.server.websocket_safe_read()
+            if not data:
+                return []
+            events = []
+            for frame in data.split("\n"):
+                if subscribed is not None and subscribed.isdisjoint(
+                    frame_types(frame)
+                ):
+                    self.skipped[bot_name] += 1
+                    continue
+                event = self.decode(frame)
+                client.process_changes(event)
+                events.append(event)
+            if events:
+                return events
+
+    def read_envelopes(self, bot_name, client):
+        """ Read Socket Mode envelopes of the bot until there are events
+
+        Envelopes are acknowledged as soon as they are read, before their
+        events are handled, and dropped when another connection of the bot
+        got them already. A connection which Slack is about to close is
+        replaced in place.
+
+        """
+        decode = self.decode or json.loads
+        envelopes = self.envelopes.get(bot_name)
+        while True:
+            data = client.server.websocket_safe_read()
+            if not data:
+                return []
+            events = []
+            for frame in data.split("\n"):
+                envelope = decode(frame)
+                envelope_id = envelope.get("envelope_id")
+                if envelope_id is not None:
+                    # Slack retries envelopes left unacknowledged for seconds
+                    socket_mode.ack(client, envelope_id)
+                    if envelopes is not None and not envelopes.add(envelope):
+                        log.debug("Dropped duplicate envelope %s", envelope_id)
+                        continue
+                envelope_type = envelope.get("type")
+                if envelope_type == "events_api":
+                    events.append(envelope["payload"]["event"])
+                elif envelope_type == "hello":
+                    events.append({"type": "hello"})
+                elif envelope_type == "disconnect":
+                    self.refresh(bot_name, client, envelope.get("reason"))
+                else:
+                    log.debug("Ignored `%s` envelope", envelope_type)
+            if events:
+                return events
+
+    def refresh(self, bot_name, client, reason):
+        """ Replace a Socket Mode connection of the bot Slack asks to close
+        """
+        started = clock()
+        self.connect(bot_name, client)
+        log.info(
+            "Refreshed connection of `%s` bot (%s) in %.3fs",
+            bot_name,
+            reason,
+            clock() - started,
+        )
+
+    def run_poll(self, bot_name, client):
+        liveness = Liveness(self.ping_interval, self.pong_timeout)
+        rtm_read = self.frame_reader(bot_name)
+        recorder = self.recorder
+        while True:
+            if recorder is not None:
+                started = clock()
+            events = read(client, rtm_read)
+            if events:
+                liveness.received()
+            for event in events:
+                self.receive(bot_name, event)
+            if recorder is not None and events:
+                elapsed = clock() - started
+                recorder.timing("rtm_read_loop_seconds", elapsed, bot=bot_name)
+            liveness.check(client)
             eventlet.sleep(self.read_interval)
 
+    def run_select(self, bot_name, client):
+        """ Dispatch events as soon as the websocket becomes readable
+
+        Drains every complete frame available on the socket, then parks the
+        green thread until there is more to read. When nothing arrives
+        within ``ping_interval`` seconds, a ping is sent to keep the
+        connection alive.
+
+        """
+        liveness = Liveness(self.ping_interval, self.pong_timeout)
+        rtm_read = self.frame_reader(bot_name)
+        recorder = self.recorder
+        while True:
+            if recorder is not None:
+                started = clock()
+            for event in read_available(client, rtm_read):
+                liveness.received()
+                self.receive(bot_name, event)
+            if recorder is not None:
+                elapsed = clock() - started
+                recorder.timing("rtm_read_loop_seconds", elapsed, bot=bot_name)
+            try:
+                trampoline(
+                    client.server.websocket.sock,
+                    read=True,
+                    timeout=liveness.timeout(),
+                )
+            except eventlet.Timeout:
+                liveness.check(client)
+
+    def receive(self, bot_name, event):
+        event_type = event.get("type")
+        if event_type == "pong":
+            # answers to pings of idle connections are for the reader only
+            return
+        if self.auto_reconnect:
+            if event_type == "goodbye":
+                raise ConnectionLost("Slack closes the connection")
+            if event_type == "reconnect_url":
+                self.reconnect_urls[bot_name] = event["url"]
+            recent_events = self.recent_events.get(bot_name)
+            if recent_events is not None and not recent_events.add(event):
+                log.debug("Dropped duplicate event %s", event_key(event))
+                return
+        if self.scheduler is not None:
+            self.scheduler.put(bot_name, event)
+        else:
+            self.handle(bot_name, event)
+
+    def register_provider(self, provider):
+        super(SlackRTMClientManager, self).register_provider(provider)
+        self.build_routes()
+
+    def unregister_provider(self, provider):
+        super(SlackRTMClientManager, self).unregister_provider(provider)
+        self.build_routes()
+
+    def build_routes(self):
+        """ Index providers by bot name and the event type they listen to
+
+        Message entrypoints with a pattern are grouped into one
+        :class:`MessageMatcher` per bot, see :func:`index_providers`.
+
+        """
+        routes = index_providers(
+            self._providers,
+            scope=attrgetter("bot_name"),
+            patterned=lambda provider: (
+                isinstance(provider, RTMMessageHandlerEntrypoint)
+                and provider.message_pattern
+            ),
+        )
+        subscribed = defaultdict(lambda: self.internal_event_types)
+        for bot_name, event_type in routes:
+            if event_type is None:
+                subscribed[bot_name] = None
+        for bot_name, event_type in routes:
+            if event_type is not None and subscribed[bot_name] is not None:
+                subscribed[bot_name] = subscribed[bot_name] | {event_type}
+        self.routes = routes
+        # entrypoints with a queue spawn their workers from its thread
+        self.costs = {key: spawning(providers) for key, providers in routes.items()}
+        self.subscribed = dict(subscribed)
+
     def handle(self, bot_name, event):
-        for provider in self._providers:
-            if provider.bot_name == bot_name:
-                provider.handle_event(event)
+        recorder = self.recorder
+        if recorder is None:
+            self.route(bot_name, event)
+            return
+        started = clock()
+        self.route(bot_name, event)
+        event_type = event.get("type")
+        recorder.incr("rtm_events", bot=bot_name, type=event_type)
+        recorder.timing(
+            "rtm_dispatch_seconds", clock() - started, bot=bot_name, type=event_type
+        )
+
+    def workers(self, bot_name, event):
+        """ Return how many workers routing the event spawns at most
+        """
+        workers = self.costs.get((bot_name, event.get("type")))
+        if workers is None:
+            workers = self.costs.get((bot_name, None), 0)
+        return workers
+
+    def route(self, bot_name, event):
+        self.cache.invalidate_event(bot_name, event)
+        workspace = self.workspaces.get(bot_name)
+        if workspace is not None:
+            workspace.update(event)
+        for provider in routed(self.routes, bot_name, event):
+            provider.handle_event(event)
 
     def reply(self, bot_name, event, message):
+        outbox = self.outboxes.get(bot_name)
+        if outbox is not None:
+            outbox.put(event["channel"], message)
+        else:
+            self.sender(bot_name)(event["channel"], message)
+
+    def sender(self, bot_name):
+        """ Return function sending a message as the bot
+
+        Messages cannot be sent over Socket Mode connections and are posted
+        with the Web API instead.
+
+        """
         client = self.clients[bot_name]
-        client.rtm_send_message(event["channel"], message)
+        if self.socket_mode:
+            send = partial(socket_mode.post_message, client)
+        else:
+            send = client.rtm_send_message
+        if self.recorder is not None:
+            return partial(self.send_timed, bot_name, send)
+        return send
+
+    def send_timed(self, bot_name, send, channel, message):
+        started = clock()
+        try:
+            send(channel, message)
+        except Exception:
+            self.recorder.incr("rtm_reply_errors", bot=bot_name)
+            raise
+        finally:
+            self.recorder.timing("rtm_reply_seconds", clock() - started, bot=bot_name)
+
+    def stats(self):
+        """ Return outbound queue statistics by bot name
+        """
+        return {bot_name: outbox.stats for bot_name, outbox in self.outboxes.items()}
+
+
+class Workspace(DependencyProvider):
+    """ Dependency provider exposing a :class:`WorkspaceSnapshot` of a bot
+
+    Workers wait up to `timeout` seconds for the bot to connect. Raises
+    :class:`BotUnavailable` if it does not, or if the bot is connected by
+    another instance of the service.
+
+    """
+
+    clients = SlackRTMClientManager()
+
+    def __init__(self, bot_name=None, timeout=30):
+        self.bot_name = bot_name or constants.DEFAULT_BOT_NAME
+        self.timeout = timeout
+
+    def start(self):
+        if self.bot_name not in self.clients.clients:
+            raise ConfigurationError(
+                "No token for `{}` bot in `{}` config".format(
+                    self.bot_name, constants.CONFIG_KEY
+                )
+            )
+
+    def get_dependency(self, worker_ctx):
+        if self.bot_name not in self.clients.owned:
+            raise BotUnavailable(
+                "`{}` bot is connected by another instance".format(self.bot_name)
+            )
+        if not self.clients.wait_until_ready(self.bot_name, self.timeout):
+            raise BotUnavailable(
+                "`{}` bot did not connect in {} seconds".format(
+                    self.bot_name, self.timeout
+                )
+            )
+        return self.clients.workspaces[self.bot_name]
 
 
 class RTMEventHandlerEntrypoint(Entrypoint):
 
     clients = SlackRTMClientManager()
 
-    def __init__(self, event_type=None, bot_name=None, **kwargs):
+    def __init__(
+        self,
+        event_type=None,
+        bot_name=None,
+        queue_size=None,
+        concurrency=10,
+        overload=constants.OVERLOAD_SHED_OLDEST,
+        shed_event_types=(),
+        ordered_by=None,
+        **kwargs
+    ):
         self.bot_name = bot_name or constants.DEFAULT_BOT_NAME
         self.event_type = event_type
+        self.ordered_by = ordered_by
+        self.lanes = None
+        if queue_size:
+            self.ingress = Ingress(
+                size=queue_size,
+                concurrency=concurrency,
+                overload=overload,
+                shed_event_types=shed_event_types,
+            )
+        else:
+            self.ingress = None
         super(RTMEventHandlerEntrypoint, self).__init__(**kwargs)
 
     def setup(self):
+        if self.ingress and self.ingress.overload not in constants.OVERLOAD_POLICIES:
+            raise ConfigurationError(
+                "Unknown `overload` policy `{}` of `{}` entrypoint".format(
+                    self.ingress.overload, self.method_name
+                )
+            )
+        if self.ordered_by:
+            if self.ordered_by not in constants.ORDERED_BY:
+                raise ConfigurationError(
+                    "Unknown `ordered_by` key `{}` of `{}` entrypoint".format(
+                        self.ordered_by, self.method_name
+                    )
+                )
+            self.lanes = OrderedLanes(
+                self.ordered_by,
+                self.dispatch,
+                self.container.spawn_managed_thread,
+                size=self.ingress.size if self.ingress else 1000,
+            )
+            if self.ingress:
+                self.ingress.on_shed = self.lanes.shed
         self.clients.register_provider(self)
 
+    def start(self):
+        if self.ingress:
+            run = partial(self.ingress.run, self.spawn_worker)
+            self.container.spawn_managed_thread(run)
+            self.clients.metrics.add_gauge(
+                "rtm_queue_depth",
+                partial(getattr, self.ingress, "depth"),
+                bot=self.bot_name,
+                entrypoint=self.method_name,
+            )
+
     def stop(self):
         self.clients.unregister_provider(self)
 
     def handle_event(self, event):
-        if self.event_type and event.get("type") != self.event_type:
-            return
-        args = (event,)
-        kwargs = {}
-        context_data = {}
-        self.container.spawn_worker(self, args, kwargs, context_data=context_data)
-
-
-handle_event = RTMEventHandlerEntrypoint.decorator
+        self.spawn(event, (event,), {})
 
+    def spawn(self, event, args, kwargs, handle_result=None):
+        """ Spawn a worker handling the event, or queue it if there is a queue
+        """
+        job = (args, kwargs, handle_result)
+        if self.lanes:
+            self.lanes.put(event, job)
+        else:
+            self.dispatch(event, job)
 
-class RTMMessageHandlerEntrypoint(RTMEventHandlerEntrypoint):
-    def __init__(self, message_pattern=None, **kwargs):
-        if message_pattern:
-            self.message_pattern = re.compile(message_pattern)
+    def dispatch(self, event, job):
+        if self.ingress:
+            self.ingress.put(event, job)
         else:
-            self.message_pattern = None
-        super(RTMMessageHandlerEntrypoint, self).__init__(**kwargs)
+            self.spawn_worker(*job)
 
-    def handle_event(self, event):
-        if event.get("type") == EVENT_TYPE_MESSAGE:
-            if self.message_pattern:
-                match = self.message_pattern.match(event.get("text", ""))
-                if match:
-                    kwargs = match.groupdict()
-                    args = () if kwargs else match.groups()
-                    args = (event, event.get("text")) + args
-                else:
-                    return
-            else:
-                args = (event, event.get("text"))
-                kwargs = {}
-            context_data = {}
-            handle_result = partial(self.handle_result, event)
+    def spawn_worker(self, args, kwargs, handle_result=None):
+        """ Spawn a worker, timing how long it takes to get one when measured
+        """
+        recorder = self.clients.recorder
+        if recorder is None:
+            self.start_worker(args, kwargs, handle_result)
+            return
+        started = clock()
+        self.start_worker(args, kwargs, handle_result)
+        recorder.timing(
+            "rtm_spawn_seconds",
+            clock() - started,
+            bot=self.bot_name,
+            entrypoint=self.method_name,
+        )
+
+    def start_worker(self, args, kwargs, handle_result):
+        context_data = {}
+        scheduler = self.clients.scheduler
+        if scheduler is not None:
+            handle_result = scheduler.track(self.bot_name, handle_result)
+        try:
             self.container.spawn_worker(
                 self,
                 args,
@@ -125,10 +1858,106 @@ class RTMMessageHandlerEntrypoint(RTMEventHandlerEntrypoint):
                 context_data=context_data,
                 handle_result=handle_result,
             )
+        except Exception:
+            if scheduler is not None:
+                scheduler.release(self.bot_name)
+            raise
+
+
+handle_event = RTMEventHandlerEntrypoint.decorator
+
+
+class RTMEventBatchHandlerEntrypoint(RTMEventHandlerEntrypoint):
+    """ Entrypoint handling lists of events in a single worker
+
+    A worker is spawned as soon as ``max_batch`` events are collected, or
+    ``max_wait_ms`` milliseconds after the first event of a batch arrived.
+    Events left over are handled when the container stops. Batch workers are
+    spawned directly, so the queue and ordering options of other entrypoints
+    are refused.
+
+    """
+
+    unsupported_options = (
+        "queue_size",
+        "concurrency",
+        "overload",
+        "shed_event_types",
+        "ordered_by",
+    )
+
+    def __init__(self, event_type=None, max_batch=100, max_wait_ms=1000, **kwargs):
+        for option in self.unsupported_options:
+            if option in kwargs:
+                raise TypeError(
+                    "`handle_events_batch` takes no `{}` option".format(option)
+                )
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.batch = []
+        self.timer = None
+        super(RTMEventBatchHandlerEntrypoint, self).__init__(
+            event_type=event_type, **kwargs
+        )
+
+    def stop(self):
+        super(RTMEventBatchHandlerEntrypoint, self).stop()
+        self.flush()
+
+    def kill(self):
+        self.cancel_timer()
+        self.batch = []
+
+    def handle_event(self, event):
+        self.batch.append(event)
+        if len(self.batch) >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = eventlet.spawn_after(self.max_wait_ms / 1000.0, self.expire)
+
+    def expire(self):
+        self.timer = None
+        self.flush()
+
+    def cancel_timer(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def flush(self):
+        self.cancel_timer()
+        if self.batch:
+            events, self.batch = self.batch, []
+            self.spawn_worker((events,), {})
+
+
+handle_events_batch = RTMEventBatchHandlerEntrypoint.decorator
+
+
+class RTMMessageHandlerEntrypoint(RTMEventHandlerEntrypoint):
+    def __init__(self, message_pattern=None, **kwargs):
+        self.message_pattern, self.message_prefix = compile_message_pattern(
+            message_pattern
+        )
+        # message entrypoints always listen to message events only
+        kwargs.pop("event_type", None)
+        super(RTMMessageHandlerEntrypoint, self).__init__(
+            event_type=EVENT_TYPE_MESSAGE, **kwargs
+        )
+
+    def handle_event(self, event):
+        arguments = message_arguments(self.message_pattern, event)
+        if arguments is None:
+            return
+        args, kwargs = arguments
+        self.spawn(event, args, kwargs, partial(self.handle_result, event))
 
     def handle_result(self, event, worker_ctx, result, exc_info):
         if result:
-            self.clients.reply(self.bot_name, event, result)
+            try:
+                self.clients.reply(self.bot_name, event, result)
+            except OutboxFull:
+                exc_info = sys.exc_info()
         return result, exc_info
 
 
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import hashlib
+from bisect import bisect
+from importlib import import_module
+
+
+def hash_key(key):
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+    """ Consistent hash ring assigning keys to members
+
+    Every member is placed at `replicas` points of the ring and a key belongs
+    to the member of the first point following the key's hash. All members
+    agree on the owner of a key as long as they know the same members, and
+    when one joins or leaves only the keys next to its points move.
+
+    """
+
+    def __init__(self, members, replicas=100):
+        self.members = frozenset(members)
+        points = sorted(
+            (hash_key("{}-{}".format(member, replica)), member)
+            for member in self.members
+            for replica in range(replicas)
+        )
+        self.hashes = [point for point, _ in points]
+        self.owners = [member for _, member in points]
+
+    def owner(self, key):
+        """ Return the member owning the key, ``None`` if there are no members
+        """
+        if not self.hashes:
+            return None
+        index = bisect(self.hashes, hash_key(key)) % len(self.hashes)
+        return self.owners[index]
+
+
+def import_path(path):
+    """ Return the object at ``package.module:attribute`` path
+    """
+    module, _, attribute = path.partition(":")
+    return getattr(import_module(module), attribute)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+""" Helpers for Slack's `Socket Mode`
+
+Socket Mode delivers the events of an app over websockets opened with an
+app-level token. Every event comes wrapped in an envelope which has to be
+acknowledged over the same connection, and Slack asks for connections to
+be refreshed every few hours. Replies cannot be sent over the websocket and
+are posted with the Web API instead.
+
+"""
+import json
+
+from slackclient.server import SlackConnectionError
+
+
+def envelope_key(envelope):
+    """ Return a key identifying an envelope delivered more than once
+
+    Slack may deliver an event again in a new envelope, so the event ID is
+    preferred to the envelope's own.
+
+    """
+    payload = envelope.get("payload") or {}
+    return payload.get("event_id") or envelope.get("envelope_id")
+
+
+def open_connection(client):
+    """ Open a websocket of the app, closing the previous one once replaced
+    """
+    response = client.api_call("apps.connections.open")
+    if not response.get("ok"):
+        raise SlackConnectionError(
+            message="Failed to open connection: {}".format(response.get("error"))
+        )
+    previous = client.server.websocket
+    client.server.connect_slack_websocket(response["url"])
+    if previous is not None and previous is not client.server.websocket:
+        previous.close()
+
+
+def ack(client, envelope_id):
+    client.server.websocket.send(json.dumps({"envelope_id": envelope_id}))
+
+
+def ping(server):
+    """ Send a websocket ping, the Socket Mode API has no ping message
+    """
+    server.websocket.ping()
+
+
+def post_message(client, channel, message):
+    client.api_call("chat.postMessage", channel=channel, text=message)
+
+
+def load_identity(client):
+    """ Return identity of the bot as in the payload of ``rtm.connect``
+    """
+    response = client.api_call("auth.test")
+    return {
+        "self": {"id": response.get("user_id"), "name": response.get("user")},
+        "team": {"id": response.get("team_id"), "name": response.get("team")},
+    }
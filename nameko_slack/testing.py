@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Local fake of Slack's RTM websocket endpoint and Web API
+
+Serves a websocket which greets every connection with a ``hello`` event,
+answers pings and lets tests and benchmarks publish events to the connected
+bots and observe whatever the bots send back.
+
+The same server answers Web API calls at ``/api/<method>``: ``rtm.start`` and
+``rtm.connect`` point bots at the websocket and messages posted with
+``chat.postMessage`` are observed like the ones sent over RTM. Route the
+calls of all Slack clients to it with :meth:`FakeSlack.patch_web_api`.
+
+"""
+
+import json
+from collections import Counter
+from contextlib import contextmanager
+
+import eventlet
+from eventlet import websocket, wsgi
+from requests import Session
+from slackclient.slackrequest import SlackRequest
+
+
+try:
+    from urllib.parse import parse_qsl
+except ImportError:  # pragma: no cover (Python 2)
+    from urlparse import parse_qsl
+
+
+class FakeSlack(object):
+    def __init__(self, host="127.0.0.1", port=0):
+        self.listener = eventlet.listen((host, port))
+        self.connections = set()
+        self.received = eventlet.Queue()
+        self.api_calls = Counter()
+        self.server = None
+        self.session = None
+        self.websocket_app = websocket.WebSocketWSGI(self.handle)
+
+    @property
+    def url(self):
+        host, port = self.listener.getsockname()
+        return "ws://{}:{}/".format(host, port)
+
+    @property
+    def api_url(self):
+        host, port = self.listener.getsockname()
+        return "http://{}:{}/api/".format(host, port)
+
+    def start(self):
+        self.server = eventlet.spawn(
+            wsgi.server, self.listener, self.app, log_output=False
+        )
+
+    def stop(self):
+        self.disconnect()
+        self.server.kill()
+        self.listener.close()
+        if self.session is not None:
+            self.session.close()
+
+    def disconnect(self):
+        """ Close all connections from the server's side
+        """
+        for ws in list(self.connections):
+            ws.close()
+
+    def app(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if path.startswith("/api/"):
+            method = path.split("/", 2)[2]
+            return self.api(method, environ, start_response)
+        return self.websocket_app(environ, start_response)
+
+    def handle(self, ws):
+        self.connections.add(ws)
+        try:
+            ws.send(json.dumps({"type": "hello"}))
+            while True:
+                frame = ws.wait()
+                if frame is None:
+                    break
+                message = json.loads(frame)
+                if message.get("type") == "ping":
+                    ws.send(json.dumps({"type": "pong", "reply_to": message.get("id")}))
+                else:
+                    self.received.put(message)
+        finally:
+            self.connections.discard(ws)
+
+    def publish(self, event, connection=None):
+        """ Send the event to the given connection, or to all of them
+        """
+        data = json.dumps(event)
+        connections = [connection] if connection else list(self.connections)
+        for ws in connections:
+            ws.send(data)
+
+    def api(self, method, environ, start_response):
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+        body = environ["wsgi.input"].read(length).decode("utf-8")
+        arguments = dict(parse_qsl(body))
+        self.api_calls[method] += 1
+        if method in ("rtm.start", "rtm.connect"):
+            result = {
+                "ok": True,
+                "url": self.url,
+                "self": {"id": "U0", "name": "bot"},
+                "team": {"id": "T0", "name": "Fake", "domain": "fake"},
+            }
+            if method == "rtm.start":
+                result.update(channels=[], groups=[], users=[], ims=[])
+        elif method == "auth.test":
+            result = {"ok": True, "user_id": "U0", "user": "bot", "team_id": "T0"}
+        elif method == "chat.postMessage":
+            message = {
+                "type": "message",
+                "channel": arguments.get("channel"),
+                "text": arguments.get("text"),
+            }
+            self.received.put(message)
+            result = {"ok": True, "channel": message["channel"], "message": message}
+        else:
+            result = {"ok": True}
+        start_response("200 OK", [("Content-Type", "application/json")])
+        return [json.dumps(result).encode("utf-8")]
+
+    def send_api_request(
+        self, requester, token=None, request="?", post_data=None, **kwargs
+    ):
+        """ Replaces ``SlackRequest.do`` while Web API calls are routed here
+
+        Pooled requesters keep using their own session, others share one.
+
+        """
+        session = getattr(requester, "session", None)
+        if session is None:
+            if self.session is None:
+                self.session = Session()
+            session = self.session
+        data = {
+            name: json.dumps(value) if isinstance(value, (list, dict)) else value
+            for name, value in (post_data or {}).items()
+        }
+        return session.post(
+            self.api_url + request,
+            headers={"Authorization": "Bearer {}".format(token)},
+            data=data,
+            timeout=kwargs.get("timeout"),
+        )
+
+    @contextmanager
+    def patch_web_api(self):
+        """ Route Web API calls of all Slack clients to the fake
+        """
+        fake = self
+
+        def do(requester, *args, **kwargs):
+            return fake.send_api_request(requester, *args, **kwargs)
+
+        original = SlackRequest.do
+        SlackRequest.do = do
+        try:
+            yield
+        finally:
+            SlackRequest.do = original
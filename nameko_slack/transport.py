@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from importlib import import_module
+
+from nameko_slack import constants
+
+
+class Transport(object):
+    """ Carries the websockets of RTM connections
+
+    A transport is attached to every Slack client of the client manager and
+    opens the client's websocket whenever the client connects. The websocket
+    has to look like the one of the Slack client: ``send`` and ``recv``
+    frames, ``recv`` raising ``EAGAIN`` when there is nothing to receive, and
+    a ``sock`` to wait for until there is.
+
+    The default transport leaves the websocket to the Slack client, running
+    it on the eventlet hub of the service, and only closes it when the bot
+    is disconnected.
+
+    """
+
+    def setup(self):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def attach(self, client):
+        pass
+
+    def disconnect(self, client):
+        websocket = client.server.websocket
+        if websocket is not None:
+            websocket.close()
+        client.server.connected = False
+
+
+def get_transport(name):
+    """ Return a new transport of given name
+
+    Transports other than the default one are imported on demand as they
+    depend on packages the default one does not need.
+
+    """
+    if name == constants.TRANSPORT_ASYNCIO:
+        return import_module("nameko_slack.asyncio_transport").AsyncioTransport()
+    return Transport()
@@ -1,20 +1,643 @@
 # -*- coding: utf-8 -*-
+import json
+import logging
+import sys
+from collections import Counter, OrderedDict
+from copy import deepcopy
+from functools import partial
+
+import eventlet
+from eventlet.event import Event
+from eventlet.greenpool import GreenPool
+from eventlet.semaphore import Semaphore
 from nameko.exceptions import ConfigurationError
-from nameko.extensions import DependencyProvider
+from nameko.extensions import DependencyProvider, SharedExtension
+from requests import Session
+from requests.adapters import HTTPAdapter
 from slackclient import SlackClient
+from slackclient.slackrequest import SlackRequest
 
 from nameko_slack import constants
+from nameko_slack.metrics import Instrumentation
+from nameko_slack.ratelimit import RateLimits, clock
+
+
+log = logging.getLogger(__name__)
+
+
+class PooledSlackRequest(SlackRequest):
+    """ Slack Web API requester sending requests over a shared session
+
+    Slack client's own requester opens a new connection for every call.
+    Sending them through a :class:`requests.Session` keeps connections alive
+    and reuses them across workers.
+
+    """
+
+    def __init__(self, session, proxies=None):
+        super(PooledSlackRequest, self).__init__(proxies=proxies)
+        self.session = session
+
+    def post_http_request(
+        self, token, api_method, post_data, files=None, timeout=None, domain="slack.com"
+    ):
+        if post_data is not None and "token" in post_data:
+            token = post_data["token"]
+        headers = {
+            "user-agent": self.get_user_agent(),
+            "Authorization": "Bearer {}".format(token),
+        }
+        return self.session.post(
+            "https://{0}/api/{1}".format(domain, api_method),
+            headers=headers,
+            data=post_data,
+            files=files,
+            timeout=timeout,
+            proxies=self.proxies,
+        )
+
+
+def make_session(pool_size, hosts=1, keep_alive=True, block=True):
+    """ Return a session with a pool of up to `pool_size` connections per host
+
+    With `block` set, requests wait for a free connection instead of opening
+    connections over the limit.
+
+    """
+    session = Session()
+    adapter = HTTPAdapter(
+        pool_connections=hosts, pool_maxsize=pool_size, pool_block=block
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not keep_alive:
+        session.headers["Connection"] = "close"
+    return session
+
+
+def make_client(token, session):
+    client = SlackClient(token)
+    client.server.api_requester = PooledSlackRequest(
+        session, proxies=client.server.proxies
+    )
+    return client
+
+
+# read-only Web API methods safe to share results of between callers
+COALESCED_METHODS = frozenset(
+    (
+        "auth.test",
+        "bots.info",
+        "channels.info",
+        "conversations.info",
+        "conversations.members",
+        "emoji.list",
+        "groups.info",
+        "team.info",
+        "usergroups.list",
+        "users.getPresence",
+        "users.info",
+        "users.lookupByEmail",
+        "users.profile.get",
+    )
+)
+
+USERS_LIST_PAGE_SIZE = 200
+
+
+def forward(event, fn, *args, **kwargs):
+    """ Send the result of calling `fn`, or the exception it raises, to `event`
+    """
+    try:
+        event.send(fn(*args, **kwargs))
+    except Exception:
+        event.send_exception(*sys.exc_info())
+
+
+class CoalescingClient(object):
+    """ Slack client wrapper sharing identical read calls in flight
+
+    Read calls (see :data:`COALESCED_METHODS`) with the same arguments made
+    while such call is already on its way share the one HTTP request and its
+    result. Other calls and attributes go straight to the wrapped client.
+
+    With `batch_size` set, ``users.info`` lookups issued within `batch_window`
+    seconds are grouped and, when there are at least `batch_size` of them,
+    resolved from up to `batch_pages` pages of ``users.list``. Users not found
+    there are looked up one by one.
+
+    """
+
+    def __init__(self, client, batch_window=0.01, batch_size=None, batch_pages=1):
+        self.client = client
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        self.batch_pages = batch_pages
+        self.in_flight = {}
+        self.batch = None
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def api_call(self, method, timeout=None, **kwargs):
+        if method not in COALESCED_METHODS:
+            return self.client.api_call(method, timeout=timeout, **kwargs)
+        if self.batch_size and method == "users.info" and list(kwargs) == ["user"]:
+            event = self.lookup_user(kwargs["user"], timeout)
+        else:
+            event = self.share(method, timeout, kwargs)
+        return deepcopy(event.wait())
+
+    def share(self, method, timeout, kwargs):
+        key = (method, json.dumps(kwargs, sort_keys=True, default=str))
+        event = self.in_flight.get(key)
+        if event is None:
+            event = self.in_flight[key] = Event()
+            eventlet.spawn(self.call, key, event, method, timeout, kwargs)
+        return event
+
+    def call(self, key, event, method, timeout, kwargs):
+        try:
+            forward(event, self.client.api_call, method, timeout=timeout, **kwargs)
+        finally:
+            del self.in_flight[key]
+
+    def lookup_user(self, user, timeout):
+        if self.batch is None:
+            self.batch = {}
+            eventlet.spawn_after(self.batch_window, self.flush, timeout)
+        event = self.batch.get(user)
+        if event is None:
+            event = self.batch[user] = Event()
+        return event
+
+    def flush(self, timeout):
+        batch, self.batch = self.batch, None
+        if len(batch) >= self.batch_size:
+            try:
+                self.resolve_from_users_list(batch, timeout)
+            except Exception:
+                log.warning("Failed to resolve users from users.list", exc_info=True)
+        # whatever is left is looked up one by one
+        lookups = [
+            (event, self.share("users.info", timeout, {"user": user}))
+            for user, event in batch.items()
+        ]
+        for event, lookup in lookups:
+            forward(event, lookup.wait)
+
+    def resolve_from_users_list(self, batch, timeout):
+        cursor = None
+        for _ in range(self.batch_pages):
+            page = self.client.api_call(
+                "users.list", timeout=timeout, limit=USERS_LIST_PAGE_SIZE, cursor=cursor
+            )
+            if not page.get("ok"):
+                return
+            for member in page.get("members", ()):
+                event = batch.pop(member.get("id"), None)
+                if event is not None:
+                    event.send({"ok": True, "user": member})
+            cursor = page.get("response_metadata", {}).get("next_cursor")
+            if not batch or not cursor:
+                return
+
+
+# cached Web API methods by the kind of entity they return, the argument
+# identifying the entity and the response field holding the entity
+CACHED_METHODS = {
+    "users.info": ("users", "user", "user"),
+    "conversations.info": ("channels", "channel", "channel"),
+    "channels.info": ("channels", "channel", "channel"),
+    "groups.info": ("channels", "channel", "group"),
+    "team.info": ("team", None, "team"),
+    "bots.info": ("bots", "bot", "bot"),
+}
+
+# RTM events changing a cached entity by the kind of the entity and the event
+# field holding its ID (or the entity itself)
+INVALIDATING_EVENTS = {
+    "user_change": ("users", "user"),
+    "team_join": ("users", "user"),
+    "channel_rename": ("channels", "channel"),
+    "channel_archive": ("channels", "channel"),
+    "channel_unarchive": ("channels", "channel"),
+    "channel_deleted": ("channels", "channel"),
+    "group_rename": ("channels", "channel"),
+    "group_archive": ("channels", "channel"),
+    "group_unarchive": ("channels", "channel"),
+    "member_joined_channel": ("channels", "channel"),
+    "member_left_channel": ("channels", "channel"),
+    "team_rename": ("team", None),
+    "team_domain_change": ("team", None),
+    "team_pref_change": ("team", None),
+    "bot_added": ("bots", "bot"),
+    "bot_changed": ("bots", "bot"),
+}
+
+
+class EntityCache(SharedExtension):
+    """ Container wide LRU cache of Slack users, channels, team and bot info
+
+    Entries expire after a TTL set per kind of entity and the least recently
+    used ones are evicted once the cache holds `size` entries. RTM events
+    changing an entity invalidate its entry.
+
+    """
+
+    def __init__(self):
+        super(EntityCache, self).__init__()
+        self.size = 10000
+        self.ttls = {"users": 300, "channels": 300, "team": 3600, "bots": 3600}
+        self.entries = OrderedDict()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.evictions = 0
+
+    def setup(self):
+        config = self.container.config.get(constants.CONFIG_KEY, {}).get("CACHE", {})
+        self.size = config.get("SIZE", self.size)
+        self.ttls.update(config.get("TTL", {}))
+
+    def get(self, bot_name, kind, entity_id):
+        key = (bot_name, kind, entity_id)
+        try:
+            expires_at, value = self.entries.pop(key)
+        except KeyError:
+            self.misses[kind] += 1
+            raise
+        if expires_at < clock():
+            self.misses[kind] += 1
+            raise KeyError(key)
+        self.entries[key] = expires_at, value  # most recently used goes last
+        self.hits[kind] += 1
+        return value
+
+    def set(self, bot_name, kind, entity_id, value):
+        key = (bot_name, kind, entity_id)
+        self.entries.pop(key, None)
+        self.entries[key] = clock() + self.ttls[kind], value
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, bot_name, kind, entity_id):
+        self.entries.pop((bot_name, kind, entity_id), None)
+
+    def invalidate_event(self, bot_name, event):
+        try:
+            kind, field = INVALIDATING_EVENTS[event.get("type")]
+        except KeyError:
+            return
+        entity_id = event.get(field) if field else None
+        if isinstance(entity_id, dict):
+            entity_id = entity_id.get("id")
+        self.invalidate(bot_name, kind, entity_id)
+
+    def stats(self):
+        return {
+            "size": len(self.entries),
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+            "evictions": self.evictions,
+        }
+
+
+class CachingClient(object):
+    """ Slack client wrapper answering entity lookups from :class:`EntityCache`
+
+    Calls of :data:`CACHED_METHODS` given no other argument than the ID of
+    the entity are cached. Other calls and attributes go straight to the
+    wrapped client.
+
+    """
+
+    def __init__(self, client, cache, bot_name):
+        self.client = client
+        self.cache = cache
+        self.bot_name = bot_name
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def api_call(self, method, timeout=None, **kwargs):
+        try:
+            kind, argument, field = CACHED_METHODS[method]
+        except KeyError:
+            return self.client.api_call(method, timeout=timeout, **kwargs)
+        if set(kwargs) != ({argument} if argument else set()):
+            return self.client.api_call(method, timeout=timeout, **kwargs)
+
+        # entities are cached without the response envelope, which differs
+        # between methods returning the same kind of entity
+        entity_id = kwargs.get(argument)
+        try:
+            entity = self.cache.get(self.bot_name, kind, entity_id)
+        except KeyError:
+            pass
+        else:
+            return {"ok": True, field: deepcopy(entity)}
+        result = self.client.api_call(method, timeout=timeout, **kwargs)
+        if result.get("ok") and field in result:
+            self.cache.set(self.bot_name, kind, entity_id, deepcopy(result[field]))
+        return result
+
+
+class InstrumentedClient(object):
+    """ Slack client wrapper reporting latency and errors of Web API calls
+
+    Errors are counted by method and by the exception raised or the error
+    returned by Slack. The recorder is looked up on every call as it is only
+    known once the service has started.
+
+    """
+
+    def __init__(self, client, instrumentation):
+        self.client = client
+        self.instrumentation = instrumentation
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def api_call(self, method, timeout=None, **kwargs):
+        recorder = self.instrumentation.recorder
+        if recorder is None:
+            return self.client.api_call(method, timeout=timeout, **kwargs)
+        started = clock()
+        try:
+            result = self.client.api_call(method, timeout=timeout, **kwargs)
+        except Exception as exc:
+            recorder.incr("api_call_errors", method=method, error=type(exc).__name__)
+            raise
+        finally:
+            recorder.timing("api_call_seconds", clock() - started, method=method)
+        if not result.get("ok"):
+            recorder.incr(
+                "api_call_errors", method=method, error=result.get("error", "unknown")
+            )
+        return result
+
+
+class SlackApiError(Exception):
+    """ Error returned by Slack to a call of the streaming helpers
+    """
+
+    def __init__(self, method, response):
+        super(SlackApiError, self).__init__(
+            "`{}` failed: {}".format(method, response.get("error", "unknown"))
+        )
+        self.method = method
+        self.response = response
+
+
+def retry_after(response):
+    """ Return seconds Slack asks to wait before calling again, if rate limited
+    """
+    if response.get("error") != "ratelimited":
+        return None
+    for name, value in (response.get("headers") or {}).items():
+        if name.lower() == "retry-after":
+            return float(value)
+    return 1.0
+
+
+def next_cursor(page):
+    metadata = page.get("response_metadata") or {}
+    return metadata.get("next_cursor") or None
+
+
+class RateLimiter(SharedExtension):
+    """ Container wide :class:`RateLimits` of Web API calls
+
+    Enabled by ``RATE_LIMITS`` in config, ``limits`` stays ``None`` otherwise.
+
+    """
+
+    metrics = Instrumentation()
+
+    def __init__(self):
+        super(RateLimiter, self).__init__()
+        self.limits = None
+        self.max_retries = 3
+
+    def setup(self):
+        config = self.container.config.get(constants.CONFIG_KEY, {}).get(
+            "RATE_LIMITS"
+        )
+        if config is None:
+            return
+        self.limits = RateLimits(
+            tiers=config.get("TIERS"),
+            method_tiers=config.get("METHODS"),
+            burst=config.get("BURST", 1),
+        )
+        self.max_retries = config.get("MAX_RETRIES", self.max_retries)
+
+
+class RateLimitedClient(object):
+    """ Slack client wrapper holding calls back to the rate limits of Slack
+
+    Calls wait for their turn in :class:`RateLimits` shared by all workers.
+    A call Slack answers with ``Retry-After`` holds back the other calls of
+    the method until then and is tried again, up to ``max_retries`` times,
+    before its error is returned.
+
+    """
+
+    def __init__(self, client, limiter):
+        self.client = client
+        self.limiter = limiter
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def api_call(self, method, timeout=None, **kwargs):
+        limits = self.limiter.limits
+        recorder = self.limiter.metrics.recorder
+        key = limits.key(self.client.token, method, kwargs.get("channel"))
+        tier = limits.tier(method)
+        attempt = 0
+        while True:
+            waited = limits.acquire(key, tier)
+            if recorder is not None:
+                recorder.timing("api_wait_seconds", waited, method=method, tier=tier)
+            result = self.client.api_call(method, timeout=timeout, **kwargs)
+            delay = retry_after(result)
+            if delay is None or attempt >= self.limiter.max_retries:
+                return result
+            attempt += 1
+            limits.block(key, delay)
+            if recorder is not None:
+                recorder.incr("api_rate_limited", method=method, tier=tier)
+            log.info("Rate limited calling `%s`, retrying in %ss", method, delay)
+
+
+# response fields holding the items of paginated Web API methods
+PAGINATED_FIELDS = {
+    "conversations.history": "messages",
+    "conversations.replies": "messages",
+    "conversations.members": "members",
+    "conversations.list": "channels",
+    "users.conversations": "channels",
+    "users.list": "members",
+    "files.list": "files",
+    "reactions.list": "items",
+}
+
+
+class WebClient(object):
+    """ Slack client handed to workers by the :class:`Slack` dependency
+
+    Calls and attributes go to the wrapped client. On top of those, list
+    methods paginated by cursor can be streamed page by page, with the next
+    page fetched in the background while the current one is consumed, so
+    that at most two pages are held in memory however long the list is.
+    Stop iterating to stop fetching.
+
+    The streaming helpers wait for as long as Slack asks to when rate
+    limited, up to `max_retries` times, and raise :class:`SlackApiError`
+    when a call fails instead of returning the error.
+
+    Calls can also be started without waiting for them, to make many calls
+    side by side in the green thread `pool`, shared with other clients, or
+    in a pool of their own running at most `pool_size` calls at a time.
+
+    """
+
+    def __init__(
+        self,
+        client,
+        page_size=200,
+        prefetch=True,
+        max_retries=5,
+        pool_size=10,
+        pool=None,
+    ):
+        self.client = client
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self.max_retries = max_retries
+        self.pool = GreenPool(pool_size) if pool is None else pool
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def call(self, method, timeout=None, **kwargs):
+        attempt = 0
+        while True:
+            response = self.client.api_call(method, timeout=timeout, **kwargs)
+            if response.get("ok"):
+                return response
+            delay = retry_after(response)
+            if delay is None or attempt >= self.max_retries:
+                raise SlackApiError(method, response)
+            attempt += 1
+            log.info("Rate limited calling `%s`, retrying in %ss", method, delay)
+            eventlet.sleep(delay)
+
+    def pages(self, method, timeout=None, **kwargs):
+        """ Yield responses of a paginated method one page after the other
+        """
+        kwargs.setdefault("limit", self.page_size)
+        cursor = kwargs.pop("cursor", None)
+        fetch = partial(self.call, method, timeout=timeout)
+        prefetched = None
+        try:
+            page = fetch(cursor=cursor, **kwargs)
+            while True:
+                cursor = next_cursor(page)
+                if cursor and self.prefetch:
+                    prefetched = eventlet.spawn(fetch, cursor=cursor, **kwargs)
+                yield page
+                if cursor is None:
+                    return
+                if prefetched is not None:
+                    page, prefetched = prefetched.wait(), None
+                else:
+                    page = fetch(cursor=cursor, **kwargs)
+        finally:
+            if prefetched is not None:
+                prefetched.kill()
+
+    def paginate(self, method, field=None, timeout=None, **kwargs):
+        """ Yield the items of a paginated method
+
+        Items are read from the `field` of each page, the known field of the
+        method (see :data:`PAGINATED_FIELDS`) unless given.
+
+        """
+        if field is None:
+            try:
+                field = PAGINATED_FIELDS[method]
+            except KeyError:
+                raise ValueError("Unknown items field of `{}`".format(method))
+        for page in self.pages(method, timeout=timeout, **kwargs):
+            for item in page.get(field, ()):
+                yield item
+
+    def call_async(self, method, timeout=None, **kwargs):
+        """ Start a call, return a future of its result
+
+        Waits for a free slot in the pool when `pool_size` calls are running
+        already. Call ``wait()`` on the future to get the result of the call,
+        or have it raise the exception the call raised.
+
+        """
+        return self.pool.spawn(self.client.api_call, method, timeout=timeout, **kwargs)
+
+    def gather(self, futures, return_exceptions=False):
+        """ Wait for all the futures, return their results in the same order
+
+        The first exception raised by a call is raised unless
+        `return_exceptions` is set, in which case it takes the place of the
+        call's result. Calls still running are not cancelled.
+
+        """
+        results = []
+        for future in futures:
+            try:
+                results.append(future.wait())
+            except Exception as exc:
+                if not return_exceptions:
+                    raise
+                results.append(exc)
+        return results
+
+    def iter_history(self, channel, **kwargs):
+        """ Yield messages of a conversation, latest first
+        """
+        return self.paginate("conversations.history", channel=channel, **kwargs)
+
+    def iter_members(self, channel, **kwargs):
+        """ Yield IDs of the members of a conversation
+        """
+        return self.paginate("conversations.members", channel=channel, **kwargs)
+
+    def iter_users(self, **kwargs):
+        """ Yield users of the workspace
+        """
+        return self.paginate("users.list", **kwargs)
 
 
 class Slack(DependencyProvider):
-    def __init__(self, bot_name=None):
+
+    cache = EntityCache()
+    metrics = Instrumentation()
+    rate_limiter = RateLimiter()
+
+    def __init__(self, bot_name=None, coalesce=False, cache=False):
         self.bot_name = bot_name
+        self.coalesce = coalesce
+        self.use_cache = cache
+        self.config = None
         self.client = None
+        self.session = None
+        self.pool = None
 
     def setup(self):
 
         try:
-            config = self.container.config[constants.CONFIG_KEY]
+            self.config = config = self.container.config[constants.CONFIG_KEY]
         except KeyError:
             raise ConfigurationError(
                 "`{}` config key not found".format(constants.CONFIG_KEY)
@@ -38,7 +661,186 @@ class Slack(DependencyProvider):
                 "No token provided by `{}` config".format(constants.CONFIG_KEY)
             )
 
-        self.client = SlackClient(token)
+        self.setup_pools()
+        self.client = self.build_client(
+            token, self.bot_name or constants.DEFAULT_BOT_NAME
+        )
+
+    def setup_pools(self):
+        pool_config = self.config.get("HTTP_POOL", {})
+        pool_size = pool_config.get("SIZE", self.container.max_workers)
+        self.session = make_session(
+            pool_size=pool_size,
+            hosts=pool_config.get("HOSTS", 1),
+            keep_alive=pool_config.get("KEEP_ALIVE", True),
+            block=pool_config.get("BLOCK", True),
+        )
+        # more calls at a time would only wait for a connection
+        self.pool = GreenPool(self.config.get("ASYNC_POOL", {}).get("SIZE", pool_size))
+
+    def build_client(self, token, bot_name):
+        """ Return a client calling the Web API with the token of the bot
+        """
+        config = self.config
+        client = make_client(token, self.session)
+        if "METRICS" in config:
+            client = InstrumentedClient(client, self.metrics)
+        if "RATE_LIMITS" in config:
+            client = RateLimitedClient(client, self.rate_limiter)
+
+        if self.coalesce:
+            coalesce_config = config.get("COALESCE", {})
+            client = CoalescingClient(
+                client,
+                batch_window=coalesce_config.get("BATCH_WINDOW", 0.01),
+                batch_size=coalesce_config.get("BATCH_SIZE"),
+                batch_pages=coalesce_config.get("BATCH_PAGES", 1),
+            )
+
+        if self.use_cache:
+            client = CachingClient(client, self.cache, bot_name)
+
+        pagination_config = config.get("PAGINATION", {})
+        return WebClient(
+            client,
+            page_size=pagination_config.get("PAGE_SIZE", 200),
+            prefetch=pagination_config.get("PREFETCH", True),
+            max_retries=pagination_config.get("MAX_RETRIES", 5),
+            pool=self.pool,
+        )
+
+    def stop(self):
+        self.pool.waitall()
+        self.session.close()
+
+    def kill(self):
+        for thread in list(self.pool.coroutines_running):
+            thread.kill()
+        self.session.close()
 
     def get_dependency(self, worker_ctx):
         return self.client
+
+
+class UnknownBot(LookupError):
+    pass
+
+
+class ClientPool(object):
+    """ Web API clients of many bots, created on first use and then reused
+
+    Clients are looked up by the name of their bot or by the ID of the bot's
+    team. Teams of the bots are found out with ``auth.test`` when a team is
+    looked up the first time, unless given in `teams`. Once the pool holds
+    `size` clients, the least recently used ones are let go of.
+
+    """
+
+    def __init__(self, tokens, build_client, size=100, teams=None):
+        self.tokens = tokens
+        self.build_client = build_client
+        self.size = size
+        self.teams = dict(teams or {})
+        self.clients = OrderedDict()
+        self.evictions = 0
+        # bots whose team is not known yet
+        self.unidentified = [
+            bot_name for bot_name in tokens if bot_name not in self.teams.values()
+        ]
+        self.identify_lock = Semaphore()
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def get(self, key):
+        """ Return client of the bot named `key` or of the bot of team `key`
+        """
+        bot_name = key if key in self.tokens else self.bot_of_team(key)
+        client = self.clients.pop(bot_name, None)
+        if client is None:
+            client = self.build_client(self.tokens[bot_name], bot_name)
+        self.clients[bot_name] = client  # most recently used goes last
+        while len(self.clients) > self.size:
+            self.clients.popitem(last=False)
+            self.evictions += 1
+        return client
+
+    def bot_of_team(self, team_id):
+        with self.identify_lock:
+            while team_id not in self.teams and self.unidentified:
+                self.identify(self.unidentified.pop(0))
+        try:
+            return self.teams[team_id]
+        except KeyError:
+            raise UnknownBot(
+                "No bot named or of team `{}` in `{}` config".format(
+                    team_id, constants.CONFIG_KEY
+                )
+            )
+
+    def identify(self, bot_name):
+        try:
+            identity = self.get(bot_name).api_call("auth.test")
+        except Exception:
+            log.warning("Failed to identify `%s` bot", bot_name, exc_info=True)
+            self.unidentified.append(bot_name)
+            raise
+        if identity.get("ok"):
+            self.teams.setdefault(identity["team_id"], bot_name)
+        else:
+            log.warning(
+                "Failed to identify `%s` bot: %s", bot_name, identity.get("error")
+            )
+
+    def stats(self):
+        return {
+            "size": len(self.clients),
+            "teams": len(self.teams),
+            "evictions": self.evictions,
+        }
+
+
+class SlackPool(Slack):
+    """ Dependency provider exposing a :class:`ClientPool` of all bots
+
+    Serves bots of ``BOTS`` and ``TOKEN`` in config, with clients sharing
+    the HTTP connection pool and the green thread pool of asynchronous calls.
+
+    """
+
+    def __init__(self, coalesce=False, cache=False):
+        super(SlackPool, self).__init__(coalesce=coalesce, cache=cache)
+
+    def setup(self):
+
+        try:
+            self.config = config = self.container.config[constants.CONFIG_KEY]
+        except KeyError:
+            raise ConfigurationError(
+                "`{}` config key not found".format(constants.CONFIG_KEY)
+            )
+
+        tokens = dict(config.get("BOTS", {}))
+        if config.get("TOKEN"):
+            tokens.setdefault(constants.DEFAULT_BOT_NAME, config["TOKEN"])
+        if not tokens:
+            raise ConfigurationError(
+                "No token provided by `{}` config".format(constants.CONFIG_KEY)
+            )
+
+        pool_config = config.get("CLIENT_POOL", {})
+        for bot_name in pool_config.get("TEAMS", {}).values():
+            if bot_name not in tokens:
+                raise ConfigurationError(
+                    "Unknown `{}` bot in `CLIENT_POOL.TEAMS` of `{}` config".format(
+                        bot_name, constants.CONFIG_KEY
+                    )
+                )
+
+        self.setup_pools()
+        self.client = ClientPool(
+            tokens,
+            self.build_client,
+            size=pool_config.get("SIZE", 100),
+            teams=pool_config.get("TEAMS"),
+        )
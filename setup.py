@@ -13,8 +13,12 @@ setup(
     author_email="ondrej.kohout@gmail.com",
     url="http://github.com/iky/nameko-slack",
     packages=find_packages(exclude=["test", "test.*"]),
-    install_requires=["nameko>=2.7.0", "slackclient>=1.0.4,<2"],
-    extras_require={"dev": ["coverage", "pre-commit", "pylint", "pytest"]},
+    install_requires=["nameko>=2.7.0", "requests", "slackclient>=1.3.0,<2"],
+    extras_require={
+        "asyncio": ['websockets; python_version>="3.6"'],
+        "dev": ["coverage", "pre-commit", "pylint", "pytest"],
+        "orjson": ["orjson"],
+    },
     dependency_links=[],
     zip_safe=True,
     license="Apache License, Version 2.0",
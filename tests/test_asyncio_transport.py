@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+import errno
+import json
+
+import pytest
+from eventlet import sleep
+from eventlet.event import Event
+from mock import patch
+from slackclient import SlackClient
+from slackclient.server import Server, SlackConnectionError
+from websocket import WebSocketConnectionClosedException
+
+from nameko_slack import constants, rtm
+from nameko_slack.testing import FakeSlack
+
+pytest.importorskip("websockets")
+
+from nameko_slack.asyncio_transport import AsyncioTransport, Waker  # noqa: E402
+
+
+@pytest.fixture
+def fake_slack():
+    fake_slack = FakeSlack()
+    fake_slack.start()
+    yield fake_slack
+    fake_slack.stop()
+
+
+@pytest.fixture
+def transport():
+    transport = AsyncioTransport()
+    transport.setup()
+    transport.start()
+    yield transport
+    transport.stop()
+
+
+@pytest.fixture
+def client(transport):
+    client = SlackClient("abc-123")
+    transport.attach(client)
+    return client
+
+
+def wait_for(condition, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        sleep(0.01)
+    raise AssertionError("Timed out")
+
+
+def test_get_transport():
+    assert isinstance(rtm.get_transport("asyncio"), AsyncioTransport)
+
+
+def test_stop_before_start():
+    AsyncioTransport().stop()
+
+
+def test_waker():
+    waker = Waker()
+
+    # more than a pipe holds
+    for _ in range(100000):
+        waker.wake()
+    waker.wait()
+    waker.wake()
+    waker.wait()
+
+    waker.close()
+
+
+class TestWebSocket(object):
+    def test_connect(self, client, fake_slack, transport):
+        client.server.connect_slack_websocket(fake_slack.url)
+
+        assert client.server.connected is True
+        assert client.server.websocket in transport.websockets
+
+        wait_for(lambda: client.server.websocket.frames)
+        assert client.rtm_read() == [{"type": "hello"}]
+
+    def test_receive_nothing(self, client, fake_slack):
+        client.server.connect_slack_websocket(fake_slack.url)
+        wait_for(lambda: client.server.websocket.frames)
+        client.rtm_read()
+
+        with pytest.raises(OSError) as exc:
+            client.server.websocket.recv()
+        assert exc.value.errno == errno.EAGAIN
+
+    def test_send(self, client, fake_slack):
+        client.server.connect_slack_websocket(fake_slack.url)
+
+        client.rtm_send_message("C1", "spam")
+
+        message = fake_slack.received.get(timeout=5)
+        assert message["channel"] == "C1"
+        assert message["text"] == "spam"
+
+    def test_ping(self, client, fake_slack):
+        client.server.connect_slack_websocket(fake_slack.url)
+
+        client.server.ping()
+
+        wait_for(lambda: len(client.server.websocket.frames) == 2)
+        assert client.rtm_read() == [{"type": "hello"}]
+        assert client.rtm_read() == [{"type": "pong", "reply_to": None}]
+
+    def test_websocket_ping(self, client, fake_slack):
+        client.server.connect_slack_websocket(fake_slack.url)
+        websocket = client.server.websocket
+
+        websocket.ping()
+        client.server.send_to_websocket({"type": "ping"})
+
+        wait_for(lambda: len(websocket.frames) == 2)
+        assert not websocket.closed
+
+        websocket.close()
+        with pytest.raises(WebSocketConnectionClosedException):
+            websocket.ping()
+
+    def test_close_twice(self, client, fake_slack):
+        client.server.connect_slack_websocket(fake_slack.url)
+        websocket = client.server.websocket
+        wait_for(lambda: fake_slack.connections)
+
+        websocket.close()
+        websocket.close()
+
+        wait_for(lambda: not fake_slack.connections)
+        wait_for(lambda: websocket.users == 0)
+        sleep(0.05)
+        assert websocket.users == 0
+
+    def test_closed_by_server(self, client, fake_slack):
+        client.server.connect_slack_websocket(fake_slack.url)
+        websocket = client.server.websocket
+        wait_for(lambda: fake_slack.connections)
+
+        fake_slack.disconnect()
+        wait_for(lambda: websocket.closed)
+
+        websocket.recv()  # the hello event
+        with pytest.raises(WebSocketConnectionClosedException):
+            websocket.recv()
+        with pytest.raises(WebSocketConnectionClosedException):
+            websocket.send(json.dumps({"type": "ping"}))
+
+    def test_reconnect_closes_previous_websocket(self, client, fake_slack, transport):
+        client.server.connect_slack_websocket(fake_slack.url)
+        websocket = client.server.websocket
+
+        client.server.connect_slack_websocket(fake_slack.url)
+
+        assert websocket.closed
+        assert transport.websockets == {client.server.websocket}
+        wait_for(lambda: len(fake_slack.connections) == 1)
+
+    def test_disconnect(self, client, fake_slack, transport):
+        client.server.connect_slack_websocket(fake_slack.url)
+        websocket = client.server.websocket
+
+        transport.disconnect(client)
+        transport.disconnect(client)
+
+        assert websocket.closed
+        assert client.server.connected is False
+        assert transport.websockets == set()
+        wait_for(lambda: not fake_slack.connections)
+
+    def test_connection_refused(self, client, fake_slack, transport):
+        url = fake_slack.url
+        fake_slack.stop()
+
+        with pytest.raises(SlackConnectionError):
+            client.server.connect_slack_websocket(url)
+
+        assert client.server.connected is False
+        assert transport.websockets == set()
+        fake_slack.start = fake_slack.stop = lambda: None
+
+    def test_stop_closes_connections(self, client, fake_slack, transport):
+        client.server.connect_slack_websocket(fake_slack.url)
+        wait_for(lambda: fake_slack.connections)
+
+        transport.stop()
+
+        assert transport.loop is None
+        assert client.server.websocket.closed
+        wait_for(lambda: not fake_slack.connections)
+
+
+class TestService(object):
+    @pytest.fixture
+    def run_service(self, container_factory, fake_slack):
+        def rtm_connect(server, **kwargs):
+            server.login_data = {"ok": True}
+            server.connect_slack_websocket(fake_slack.url)
+
+        def run(service_class, **config):
+            config = {
+                constants.CONFIG_KEY: dict(config, TOKEN="abc-123", TRANSPORT="asyncio")
+            }
+            container = container_factory(service_class, config)
+            container.start()
+            wait_for(lambda: fake_slack.connections)
+            return container
+
+        with patch.object(Server, "rtm_connect", rtm_connect):
+            yield run
+
+    @pytest.mark.parametrize("read_mode", constants.READ_MODES)
+    def test_replies(self, run_service, fake_slack, read_mode):
+        class Service(object):
+            name = "sample"
+
+            @rtm.handle_message("^ping")
+            def pong(self, event, message):
+                return "pong"
+
+        run_service(Service, READ_MODE=read_mode, READ_INTERVAL=0.01)
+        fake_slack.publish({"type": "message", "channel": "C1", "text": "ping"})
+
+        reply = fake_slack.received.get(timeout=5)
+        assert reply["channel"] == "C1"
+        assert reply["text"] == "pong"
+
+    def test_reconnects(self, run_service, fake_slack):
+        handled = Event()
+
+        class Service(object):
+            name = "sample"
+
+            @rtm.handle_message
+            def handle(self, event, message):
+                handled.send(message)
+
+        run_service(Service, RECONNECT={"DELAY": 0.01})
+        lost = set(fake_slack.connections)
+        fake_slack.disconnect()
+        wait_for(lambda: fake_slack.connections - lost)
+        fake_slack.publish({"type": "message", "channel": "C1", "text": "spam"})
+
+        assert handled.wait() == "spam"
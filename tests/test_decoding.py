@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+from mock import patch
+
+from nameko_slack.decoding import frame_types, get_decoder
+
+
+@pytest.mark.parametrize("name", ("json", "orjson", "auto"))
+def test_get_decoder(name):
+    pytest.importorskip("orjson")
+
+    decode = get_decoder(name)
+
+    assert decode('{"type": "hello"}') == {"type": "hello"}
+
+
+def test_auto_decoder_falls_back_to_json():
+    with patch("nameko_slack.decoding.import_module", side_effect=ImportError):
+        assert get_decoder("auto") is json.loads
+
+
+def test_missing_library():
+    with patch("nameko_slack.decoding.import_module", side_effect=ImportError):
+        with pytest.raises(ImportError):
+            get_decoder("ujson")
+
+
+def test_frame_types():
+    frame = json.dumps(
+        {
+            "type": "message",
+            "text": 'an escaped "type": "spam"',
+            "attachments": [{"type": "section"}],
+        }
+    )
+
+    assert frame_types(frame) == {"message", "section"}
+    assert frame_types('{"type" : "hello"}') == {"hello"}
+    assert frame_types("{}") == set()
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+
+import pytest
+from eventlet import sleep
+from eventlet.event import Event
+from mock import Mock, call, patch
+from nameko.exceptions import ConfigurationError
+from nameko.testing.utils import get_extension
+from nameko.web.server import WebServer
+from werkzeug.test import Client
+
+from nameko_slack import constants, events
+
+
+SIGNING_SECRET = "8f742231b10e8888abcd99yyyzzz85a5"
+
+
+@pytest.fixture
+def config(web_config):
+    web_config[constants.CONFIG_KEY] = {
+        "SIGNING_SECRET": SIGNING_SECRET,
+        "TOKEN": "xoxb-abc",
+    }
+    return web_config
+
+
+@pytest.fixture
+def containers():
+    return []
+
+
+@pytest.fixture
+def post(containers):
+    """ Post requests to the web server of the last container started
+    """
+
+    def post(payload, timestamp=None, signature=None, body=None):
+        if body is None:
+            body = json.dumps(payload).encode("utf-8")
+        timestamp = str(int(time.time()) if timestamp is None else timestamp)
+        if signature is None:
+            signature = events.sign(SIGNING_SECRET, timestamp, body)
+        server = get_extension(containers[-1], WebServer)
+        return Client(server.get_wsgi_app()).post(
+            "/slack/events",
+            data=body,
+            headers={
+                "X-Slack-Request-Timestamp": timestamp,
+                "X-Slack-Signature": signature,
+                "Content-Type": "application/json",
+            },
+        )
+
+    return post
+
+
+def event_callback(event, event_id="Ev1"):
+    return {"type": "event_callback", "event_id": event_id, "event": event}
+
+
+def test_sign():
+    # example from Slack's documentation on verifying requests
+    body = (
+        b"token=xyzz0WbapA4vBCDEFasx0q6G&team_id=T1DC2JH3J&team_domain=testteamnow"
+        b"&channel_id=G8PSS9T3V&channel_name=foobar&user_id=U2CERLKJA"
+        b"&user_name=roadrunner&command=%2Fwebhook-collect&text="
+        b"&response_url=https%3A%2F%2Fhooks.slack.com%2Fcommands%2FT1DC2JH3J"
+        b"%2F397700885554%2F96rGlfmibIGlgcZRskXaIFfN"
+        b"&trigger_id=398738663015.47445629121.803a0bc887a14d10d2c447fce8b6703c"
+    )
+
+    assert events.sign(SIGNING_SECRET, 1531420618, body) == (
+        "v0=a2114d57b48eac39b9ad189dd8316235a7b4a8d21a10bd27519666489c69b503"
+    )
+
+
+class TestSetup:
+    def test_missing_config_key(self):
+        dispatcher = events.SlackEventsDispatcher()
+        dispatcher.container = Mock(config={})
+
+        with pytest.raises(ConfigurationError) as exc:
+            dispatcher.setup()
+
+        assert str(exc.value) == "`SLACK` config key not found"
+
+    def test_missing_signing_secret(self):
+        dispatcher = events.SlackEventsDispatcher()
+        dispatcher.container = Mock(config={"SLACK": {"TOKEN": "xoxb-abc"}})
+
+        with pytest.raises(ConfigurationError) as exc:
+            dispatcher.setup()
+
+        assert str(exc.value) == "`SIGNING_SECRET` must be provided in `SLACK` config"
+
+    def test_setup(self):
+        config = {
+            "SLACK": {
+                "SIGNING_SECRET": SIGNING_SECRET,
+                "EVENTS_API": {"URL": "/events", "MAX_AGE": 60, "DEDUPE": 0},
+            }
+        }
+        dispatcher = events.SlackEventsDispatcher()
+        dispatcher.container = Mock(config=config)
+        dispatcher.server = Mock()
+
+        dispatcher.setup()
+
+        assert dispatcher.url == "/events"
+        assert dispatcher.max_age == 60
+        assert dispatcher.recent_events is None
+        assert dispatcher.client is None
+        assert dispatcher.server.register_provider.call_args == call(dispatcher)
+
+
+class TestRequests:
+    @pytest.fixture
+    def handled(self):
+        return []
+
+    @pytest.fixture
+    def container(self, container_factory, config, containers, handled):
+        class Service(object):
+            name = "sample"
+
+            @events.handle_event
+            def handle_any(self, event):
+                handled.append(("any", event))
+
+            @events.handle_event("reaction_added")
+            def handle_reaction(self, event):
+                handled.append(("reaction", event))
+
+        container = container_factory(Service, config)
+        container.start()
+        containers.append(container)
+        return container
+
+    def test_url_verification(self, container, post):
+        response = post({"type": "url_verification", "challenge": "3eZbrw1aB"})
+
+        assert response.status_code == 200
+        assert response.data == b"3eZbrw1aB"
+        assert response.headers["Content-Type"].startswith("text/plain")
+
+    def test_routes_events(self, container, post, handled):
+        reaction = {"type": "reaction_added", "event_ts": "1.1"}
+        user_change = {"type": "user_change", "event_ts": "1.2"}
+
+        assert post(event_callback(reaction, "Ev1")).status_code == 200
+        assert post(event_callback(user_change, "Ev2")).status_code == 200
+        sleep(0.1)
+
+        assert sorted(handled, key=repr) == sorted(
+            [("reaction", reaction), ("any", reaction), ("any", user_change)],
+            key=repr,
+        )
+
+    def test_acks_before_spawning_workers(self, container, post, handled):
+        with patch.object(container, "spawn_worker") as spawn_worker:
+            response = post(event_callback({"type": "reaction_added"}))
+            assert response.status_code == 200
+            assert not spawn_worker.called
+            sleep(0.1)
+            assert spawn_worker.called
+
+    def test_drops_retried_events(self, container, post, handled):
+        event = {"type": "reaction_added"}
+
+        post(event_callback(event, "Ev1"))
+        post(event_callback(event, "Ev1"))
+        post(event_callback(event, "Ev2"))
+        sleep(0.1)
+
+        assert len(handled) == 4
+        dispatcher = get_extension(container, events.SlackEventsDispatcher)
+        assert dispatcher.stats() == {"received": 2, "duplicate": 1, "rejected": 0}
+
+    @pytest.mark.parametrize(
+        ("timestamp", "signature"),
+        (
+            (None, "v0=spam"),
+            ("spam", None),
+            (int(time.time()) - 600, None),
+            (int(time.time()) + 600, None),
+        ),
+    )
+    def test_rejects_unsigned_requests(
+        self, container, post, handled, timestamp, signature
+    ):
+        response = post(
+            event_callback({"type": "reaction_added"}),
+            timestamp=timestamp,
+            signature=signature,
+        )
+
+        assert response.status_code == 401
+        sleep(0.1)
+        assert handled == []
+        dispatcher = get_extension(container, events.SlackEventsDispatcher)
+        assert dispatcher.stats()["rejected"] == 1
+
+    def test_rejects_invalid_payload(self, container, post):
+        response = post(None, body=b"spam")
+
+        assert response.status_code == 400
+
+    def test_ignores_other_payloads(self, container, post, handled):
+        response = post({"type": "app_rate_limited"})
+
+        assert response.status_code == 200
+        sleep(0.1)
+        assert handled == []
+
+
+class TestMessages:
+    @pytest.fixture
+    def api_call(self):
+        with patch("nameko_slack.web.SlackClient.api_call") as api_call:
+            yield api_call
+
+    @pytest.fixture
+    def run(self, container_factory, config, containers):
+        def run(service_class, config=config):
+            container = container_factory(service_class, config)
+            container.start()
+            containers.append(container)
+            return container
+
+        return run
+
+    def test_handle_message(self, run, post, api_call):
+        replied = Event()
+        api_call.side_effect = lambda *args, **kwargs: replied.send(kwargs)
+        handled = []
+
+        class Service(object):
+            name = "sample"
+
+            @events.handle_message
+            def any_message(self, event, message):
+                handled.append(("any", message))
+
+            @events.handle_message("^ping (?P<seq>\\d+)")
+            def named(self, event, message, seq):
+                handled.append(("named", seq))
+                return "pong {}".format(seq)
+
+            @events.handle_message("^ping (\\d+)")
+            def positional(self, event, message, seq):
+                handled.append(("positional", seq))
+
+            @events.handle_message("^pong")
+            def other(self, event, message):
+                handled.append(("other", message))
+
+        run(Service)
+        message = {"type": "message", "channel": "C1", "text": "ping 1"}
+        post(event_callback(message))
+
+        assert replied.wait() == {"channel": "C1", "text": "pong 1"}
+        assert sorted(handled) == [
+            ("any", "ping 1"),
+            ("named", "1"),
+            ("positional", "1"),
+        ]
+        assert api_call.call_args[0] == ("chat.postMessage",)
+
+    def test_pattern_not_matching(self, run, post, api_call):
+        handled = []
+
+        class Service(object):
+            name = "sample"
+
+            @events.handle_message("^ping (\\d+)")
+            def ping(self, event, message, seq):
+                handled.append(seq)
+
+        run(Service)
+        post(event_callback({"type": "message", "channel": "C1", "text": "ping x"}))
+        sleep(0.1)
+
+        assert handled == []
+
+    def test_reply_without_token(self, run, post, config):
+        del config["SLACK"]["TOKEN"]
+        failed = Event()
+
+        class Service(object):
+            name = "sample"
+
+            @events.handle_message
+            def echo(self, event, message):
+                return message
+
+        container = run(Service)
+        entrypoint = get_extension(container, events.MessageHandlerEntrypoint)
+        handle_result = entrypoint.handle_result
+
+        def check_result(*args):
+            result, exc_info = handle_result(*args)
+            failed.send(exc_info)
+            return result, exc_info
+
+        with patch.object(entrypoint, "handle_result", check_result):
+            post(event_callback({"type": "message", "channel": "C1", "text": "a"}))
+            exc_info = failed.wait()
+
+        assert exc_info[0] is ConfigurationError
+        assert str(exc_info[1]) == "`TOKEN` must be provided in `SLACK` config to reply"
+
+    def test_message_without_reply(self, run, post, api_call):
+        handled = Event()
+
+        class Service(object):
+            name = "sample"
+
+            @events.handle_message(event_type="reaction_added")
+            def handle(self, event, message):
+                handled.send(message)
+
+        container = run(Service)
+        post(event_callback({"type": "message", "channel": "C1", "text": "a"}))
+
+        assert handled.wait() == "a"
+        sleep(0.1)
+        assert not api_call.called
+        entrypoint = get_extension(container, events.MessageHandlerEntrypoint)
+        assert entrypoint.event_type == "message"
+
+
+def test_lifecycle(container_factory, config):
+    class Service(object):
+        name = "sample"
+
+        @events.handle_event
+        def handle(self, event):
+            pass
+
+    container = container_factory(Service, config)
+    container.start()
+    dispatcher = get_extension(container, events.SlackEventsDispatcher)
+    server = get_extension(container, WebServer)
+    assert server._providers == {dispatcher}
+    assert dispatcher.routes[(None, None)]
+
+    container.stop()
+
+    assert dispatcher.routes == {}
+    assert server._providers == set()
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+import pytest
+from eventlet import sleep, spawn
+from eventlet.green import socket
+from mock import Mock, call, patch
+from nameko.exceptions import ConfigurationError
+from nameko.testing.utils import get_extension
+
+from nameko_slack import metrics, rtm
+
+
+class TestRecorders:
+    def test_recorder_ignores_all(self):
+        recorder = metrics.Recorder()
+
+        recorder.incr("spam")
+        recorder.timing("spam", 0.1)
+        recorder.gauge("spam", 1)
+
+    def test_passes_on_to_all(self):
+        one, other = Mock(), Mock()
+        recorder = metrics.Recorders([one, other])
+
+        recorder.incr("events", 2, bot="Alice")
+        recorder.timing("dispatch", 0.1, bot="Alice")
+        recorder.gauge("depth", 3, bot="Alice")
+
+        for mock in (one, other):
+            assert mock.incr.call_args == call("events", 2, bot="Alice")
+            assert mock.timing.call_args == call("dispatch", 0.1, bot="Alice")
+            assert mock.gauge.call_args == call("depth", 3, bot="Alice")
+
+
+class TestPrometheusRecorder:
+    def test_render(self):
+        recorder = metrics.PrometheusRecorder()
+        recorder.buckets = (0.01, 0.1)
+
+        recorder.incr("rtm_events", bot="Alice", type="message")
+        recorder.incr("rtm_events", 2, bot="Alice", type="message")
+        recorder.incr("rtm_events", bot="Bob", type="hello")
+        recorder.gauge("rtm_outbox_depth", 3, bot="Alice")
+        recorder.gauge("rtm_outbox_depth", 5, bot="Alice")
+        recorder.timing("api_call_seconds", 0.005, method="chat.postMessage")
+        recorder.timing("api_call_seconds", 0.05, method="chat.postMessage")
+        recorder.timing("api_call_seconds", 0.5, method="chat.postMessage")
+
+        assert recorder.render() == (
+            "# TYPE nameko_slack_rtm_events_total counter\n"
+            'nameko_slack_rtm_events_total{bot="Alice",type="message"} 3\n'
+            'nameko_slack_rtm_events_total{bot="Bob",type="hello"} 1\n'
+            "# TYPE nameko_slack_rtm_outbox_depth gauge\n"
+            'nameko_slack_rtm_outbox_depth{bot="Alice"} 5\n'
+            "# TYPE nameko_slack_api_call_seconds histogram\n"
+            'nameko_slack_api_call_seconds_bucket{method="chat.postMessage",le="0.01"} 1\n'  # noqa: E501
+            'nameko_slack_api_call_seconds_bucket{method="chat.postMessage",le="0.1"} 2\n'  # noqa: E501
+            'nameko_slack_api_call_seconds_bucket{method="chat.postMessage",le="+Inf"} 3\n'  # noqa: E501
+            'nameko_slack_api_call_seconds_sum{method="chat.postMessage"} 0.555\n'
+            'nameko_slack_api_call_seconds_count{method="chat.postMessage"} 3\n'
+        )
+
+    def test_render_without_namespace_or_labels(self):
+        recorder = metrics.PrometheusRecorder(namespace=None)
+
+        recorder.incr("spam")
+
+        assert recorder.render() == "# TYPE spam_total counter\nspam_total 1\n"
+
+    def test_escapes_labels(self):
+        recorder = metrics.PrometheusRecorder()
+
+        recorder.incr("spam", error='a "b"\\c\nd')
+
+        assert recorder.render().splitlines()[1] == (
+            'nameko_slack_spam_total{error="a \\"b\\"\\\\c\\nd"} 1'
+        )
+
+    def test_render_nothing(self):
+        assert metrics.PrometheusRecorder().render() == "\n"
+
+
+class TestStatsdRecorder:
+    @pytest.fixture
+    def server(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(("127.0.0.1", 0))
+        server.settimeout(1)
+        yield server
+        server.close()
+
+    def received(self, server, count):
+        return [server.recv(1024).decode("utf-8") for _ in range(count)]
+
+    def test_sends(self, server):
+        recorder = metrics.StatsdRecorder("127.0.0.1", server.getsockname()[1])
+
+        recorder.incr("api_call_errors", method="chat.postMessage", error="Timeout")
+        recorder.timing("rtm_dispatch_seconds", 0.0125, bot="Alice", type="message")
+        recorder.gauge("rtm_outbox_depth", 3, bot="Al ice")
+
+        assert self.received(server, 3) == [
+            "nameko_slack.api_call_errors.Timeout.chat_postMessage:1|c",
+            "nameko_slack.rtm_dispatch_seconds.Alice.message:12.5|ms",
+            "nameko_slack.rtm_outbox_depth.Al_ice:3|g",
+        ]
+
+    def test_without_prefix(self, server):
+        recorder = metrics.StatsdRecorder(
+            "127.0.0.1", server.getsockname()[1], prefix=None
+        )
+
+        recorder.incr("spam")
+
+        assert self.received(server, 1) == ["spam:1|c"]
+
+    def test_send_failure(self):
+        recorder = metrics.StatsdRecorder("127.0.0.1", 8125)
+        recorder.sock = Mock()
+        recorder.sock.sendto.side_effect = socket.error("Unreachable")
+
+        recorder.incr("spam")
+
+
+class TestInstrumentation:
+    def make(self, config):
+        instrumentation = metrics.Instrumentation()
+        instrumentation.container = Mock(config=config)
+        instrumentation.container.spawn_managed_thread.side_effect = spawn
+        instrumentation.setup()
+        return instrumentation
+
+    @pytest.mark.parametrize("config", ({}, {"SLACK": {}}, {"SLACK": {"METRICS": {}}}))
+    def test_disabled(self, config):
+        instrumentation = self.make(config)
+
+        assert instrumentation.recorder is None
+        instrumentation.start()
+        assert not instrumentation.container.spawn_managed_thread.called
+
+    def test_prometheus(self):
+        instrumentation = self.make(
+            {"SLACK": {"METRICS": {"PROMETHEUS": True, "NAMESPACE": "bots"}}}
+        )
+
+        assert isinstance(instrumentation.recorder, metrics.PrometheusRecorder)
+        assert instrumentation.recorder is instrumentation.prometheus
+        assert instrumentation.prometheus.namespace == "bots"
+
+    def test_statsd(self):
+        instrumentation = self.make(
+            {"SLACK": {"METRICS": {"STATSD": {"HOST": "127.0.0.1", "PREFIX": "bots"}}}}
+        )
+
+        recorder = instrumentation.recorder
+        assert isinstance(recorder, metrics.StatsdRecorder)
+        assert recorder.address == ("127.0.0.1", 8125)
+        assert recorder.prefix == "bots"
+
+    @patch("nameko_slack.metrics.import_path")
+    def test_custom_recorders(self, import_path):
+        factory = Mock()
+        instrumentation = self.make(
+            {
+                "SLACK": {
+                    "METRICS": {
+                        "PROMETHEUS": True,
+                        "RECORDERS": ["service.metrics:Recorder", factory],
+                    }
+                }
+            }
+        )
+
+        recorder = instrumentation.recorder
+        assert isinstance(recorder, metrics.Recorders)
+        assert recorder.recorders == [
+            instrumentation.prometheus,
+            import_path.return_value.return_value,
+            factory.return_value,
+        ]
+        assert import_path.call_args == call("service.metrics:Recorder")
+
+    def test_reports_gauges(self):
+        recorder = Mock()
+        instrumentation = self.make(
+            {"SLACK": {"METRICS": {"RECORDERS": [lambda: recorder], "INTERVAL": 0.01}}}
+        )
+        depth = Mock(return_value=3)
+        instrumentation.add_gauge("rtm_queue_depth", depth, bot="Alice")
+
+        instrumentation.start()
+        sleep(0.05)
+
+        assert depth.call_count > 1
+        assert recorder.gauge.call_args == call("rtm_queue_depth", 3, bot="Alice")
+
+    def test_render(self):
+        instrumentation = self.make({"SLACK": {"METRICS": {"PROMETHEUS": True}}})
+        instrumentation.add_gauge("rtm_outbox_depth", lambda: 2, bot="Alice")
+
+        assert instrumentation.render() == (
+            "# TYPE nameko_slack_rtm_outbox_depth gauge\n"
+            'nameko_slack_rtm_outbox_depth{bot="Alice"} 2\n'
+        )
+
+    def test_render_without_prometheus(self):
+        instrumentation = self.make({"SLACK": {"METRICS": {"RECORDERS": [Mock]}}})
+
+        with pytest.raises(ConfigurationError) as exc:
+            instrumentation.render()
+
+        assert str(exc.value) == (
+            "`METRICS.PROMETHEUS` must be enabled in `SLACK` config"
+        )
+
+
+@patch("nameko_slack.rtm.SlackClient")
+def test_service_metrics(SlackClient, container_factory):
+    events = [
+        {"type": "message", "channel": "D1", "text": "spam"},
+        {"type": "message", "channel": "D2", "text": "ham"},
+    ]
+
+    def rtm_read():
+        return [events.pop(0)] if events else []
+
+    SlackClient.return_value.rtm_read.side_effect = rtm_read
+
+    class Service:
+
+        name = "sample"
+
+        metrics = metrics.Metrics()
+
+        @rtm.handle_message(queue_size=10)
+        def handle_message(self, event, message):
+            return message
+
+    config = {
+        "SLACK": {
+            "TOKEN": "abc-123",
+            "READ_INTERVAL": 0.01,
+            "OUTBOX": {"CONNECTION_RATE": 100},
+            "METRICS": {"PROMETHEUS": True},
+        }
+    }
+    container = container_factory(Service, config)
+    container.start()
+    sleep(0.1)
+
+    dependency = get_extension(container, metrics.Metrics)
+    text = dependency.get_dependency(Mock()).render()
+
+    assert 'nameko_slack_rtm_events_total{bot="default",type="message"} 2' in text
+    assert 'nameko_slack_rtm_outbox_depth{bot="default"} 0' in text
+    assert (
+        'nameko_slack_rtm_queue_depth{bot="default",entrypoint="handle_message"} 0'
+        in text
+    )
+    for name in (
+        "rtm_read_loop_seconds",
+        "rtm_dispatch_seconds",
+        "rtm_spawn_seconds",
+        "rtm_reply_seconds",
+    ):
+        assert "# TYPE nameko_slack_{} histogram".format(name) in text
+    assert SlackClient.return_value.rtm_send_message.call_args_list == [
+        call("D1", "spam"),
+        call("D2", "ham"),
+    ]
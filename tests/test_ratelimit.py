@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+from eventlet import spawn
+from mock import patch
+
+from nameko_slack.ratelimit import RateLimits, TokenBucket
+
+
+@pytest.fixture
+def clock():
+    with patch("nameko_slack.ratelimit.clock") as clock:
+        clock.return_value = 100.0
+        yield clock
+
+
+def test_capacity_defaults_to_single_token(clock):
+    assert TokenBucket(5).capacity == 1
+    assert TokenBucket(5, capacity=2).capacity == 2
+
+
+def test_consume_and_refill(clock):
+    bucket = TokenBucket(2, capacity=2)
+
+    assert bucket.full
+    assert bucket.delay() == 0
+
+    bucket.consume()
+    bucket.consume()
+    assert not bucket.full
+    assert bucket.delay() == 0.5
+    assert bucket.delay(2) == 1
+
+    clock.return_value = 100.25
+    assert bucket.delay() == 0.25
+
+    clock.return_value = 110.0
+    assert bucket.full
+    assert bucket.tokens == 2
+
+
+class TestRateLimits:
+    def test_tiers(self):
+        limits = RateLimits(tiers={"tier2": 40}, method_tiers={"users.list": "tier4"})
+
+        assert limits.tier("users.info") == "tier4"
+        assert limits.tier("users.list") == "tier4"
+        assert limits.tier("spam.ham") == "tier3"
+        assert limits.tiers["tier2"] == 40
+
+    def test_keys(self):
+        limits = RateLimits()
+
+        assert limits.key("xoxb-1", "users.info", "C1") == ("xoxb-1", "users.info")
+        assert limits.key("xoxb-1", "chat.postMessage", "C1") == (
+            "xoxb-1",
+            "chat.postMessage",
+            "C1",
+        )
+
+    def test_spaces_calls_to_tier_rate(self):
+        limits = RateLimits(tiers={"tier4": 6000}, burst=2)
+        key = ("xoxb-1", "users.info")
+        started = time.time()
+
+        waits = [limits.acquire(key, "tier4") for _ in range(4)]
+
+        # two calls of the burst go straight away, the others every 10ms
+        assert waits[:2] == [pytest.approx(0, abs=0.005)] * 2
+        assert time.time() - started == pytest.approx(0.02, abs=0.01)
+        assert limits.buckets[key].rate == 100
+
+    def test_calls_queue_in_order(self):
+        limits = RateLimits(tiers={"tier4": 6000})
+        key = ("xoxb-1", "users.info")
+        order = []
+
+        def call(index):
+            limits.acquire(key, "tier4")
+            order.append(index)
+
+        threads = [spawn(call, index) for index in range(5)]
+        for thread in threads:
+            thread.wait()
+
+        assert order == [0, 1, 2, 3, 4]
+
+    def test_block(self):
+        limits = RateLimits(tiers={"tier4": 60000})
+        key = ("xoxb-1", "users.info")
+        limits.block(key, 0.02)
+        limits.block(key, 0.01)
+
+        assert limits.acquire(key, "tier4") == pytest.approx(0.02, abs=0.01)
+        assert limits.acquire(("xoxb-2", "users.info"), "tier4") < 0.005
@@ -1,12 +1,23 @@
 # -*- coding: utf-8 -*-
+import errno
+import json
+import re
+import time
+from itertools import chain, repeat
+
 import pytest
-from eventlet import sleep
+from eventlet import sleep, spawn
+from eventlet.green import socket
 from eventlet.event import Event
+from eventlet.greenpool import GreenPool
 from mock import Mock, call, patch
 from nameko.exceptions import ConfigurationError
 from nameko.testing.utils import get_extension
+from slackclient.server import SlackConnectionError
 
-from nameko_slack import constants, rtm
+from nameko_slack import constants, rtm, socket_mode
+from nameko_slack.metrics import Instrumentation
+from nameko_slack.web import EntityCache
 
 
 def test_client_manager_setup_missing_config_key():
@@ -35,6 +46,19 @@ def test_client_manager_setup_missing_mandatory_connection_keys():
     assert str(exc.value) == "At least one token must be provided in `SLACK` config"
 
 
+def test_client_manager_setup_unknown_read_mode():
+
+    config = {"SLACK": {"TOKEN": "abc-123", "READ_MODE": "spam"}}
+
+    client_manager = rtm.SlackRTMClientManager()
+    client_manager.container = Mock(config=config)
+
+    with pytest.raises(ConfigurationError) as exc:
+        client_manager.setup()
+
+    assert str(exc.value) == "Unknown `READ_MODE` `spam` in `SLACK` config"
+
+
 @pytest.mark.parametrize(
     "config",
     (
@@ -77,6 +101,168 @@ def test_client_manager_setup_with_multiple_bot_tokens(mocked_slack_client):
     assert call("def-456") in mocked_slack_client.call_args_list
 
 
+class TestRoutes:
+    @pytest.fixture
+    def client_manager(self):
+        return rtm.SlackRTMClientManager()
+
+    @pytest.fixture
+    def make_provider(self):
+        def make(bot_name="default", event_type=None):
+            return Mock(bot_name=bot_name, event_type=event_type)
+
+        return make
+
+    def test_routes_by_bot_and_event_type(self, client_manager, make_provider):
+        any_event = make_provider()
+        presence = make_provider(event_type="presence_change")
+        message = make_provider(event_type="message")
+        bobs_any_event = make_provider(bot_name="Bob")
+
+        for provider in (any_event, presence, message, bobs_any_event):
+            client_manager.register_provider(provider)
+
+        assert client_manager.routes == {
+            ("default", None): (any_event,),
+            ("default", "presence_change"): (presence, any_event),
+            ("default", "message"): (message, any_event),
+            ("Bob", None): (bobs_any_event,),
+        }
+
+        client_manager.unregister_provider(any_event)
+
+        assert client_manager.routes == {
+            ("default", "presence_change"): (presence,),
+            ("default", "message"): (message,),
+            ("Bob", None): (bobs_any_event,),
+        }
+
+    def test_message_entrypoints_with_pattern_share_a_matcher(
+        self, client_manager, make_provider
+    ):
+        message = make_provider(event_type="message")
+        spam = rtm.RTMMessageHandlerEntrypoint("^spam")
+        ham = rtm.RTMMessageHandlerEntrypoint("ham")
+        bobs_spam = rtm.RTMMessageHandlerEntrypoint("^spam", bot_name="Bob")
+
+        for provider in (message, spam, ham, bobs_spam):
+            client_manager.register_provider(provider)
+
+        providers, matcher = client_manager.routes[("default", "message")]
+        assert providers == message
+        assert isinstance(matcher, rtm.MessageMatcher)
+        assert set(matcher.candidates("spam ham")) == {spam}
+        assert set(matcher.candidates("ham spam")) == {ham}
+        assert set(matcher.candidates("egg")) == set()
+
+        (bobs_matcher,) = client_manager.routes[("Bob", "message")]
+        assert set(bobs_matcher.candidates("spam ham")) == {bobs_spam}
+
+    def test_message_entrypoints_ignore_event_type(self):
+        entrypoint = rtm.RTMMessageHandlerEntrypoint("^spam", event_type="hello")
+
+        assert entrypoint.event_type == "message"
+
+    def test_handle(self, client_manager, make_provider):
+        any_event = make_provider()
+        presence = make_provider(event_type="presence_change")
+        bobs_presence = make_provider(bot_name="Bob", event_type="presence_change")
+
+        for provider in (any_event, presence, bobs_presence):
+            client_manager.register_provider(provider)
+
+        client_manager.handle("default", {"type": "presence_change"})
+        client_manager.handle("default", {"type": "user_typing"})
+        client_manager.handle("Bob", {"type": "user_typing"})
+        client_manager.handle("Alice", {"type": "presence_change"})
+
+        assert any_event.handle_event.call_args_list == [
+            call({"type": "presence_change"}),
+            call({"type": "user_typing"}),
+        ]
+        assert presence.handle_event.call_args_list == [
+            call({"type": "presence_change"})
+        ]
+        assert bobs_presence.handle_event.call_args_list == []
+
+    def test_handle_invalidates_cached_entities(self, client_manager):
+        with patch.object(client_manager, "cache") as cache:
+            client_manager.handle("default", {"type": "user_change"})
+
+        assert cache.invalidate_event.call_args_list == [
+            call("default", {"type": "user_change"})
+        ]
+
+
+@pytest.mark.parametrize(
+    ("pattern", "prefix"),
+    (
+        ("", ""),
+        ("^spam", "spam"),
+        ("spam", "spam"),
+        ("^spam (\\d+)", "spam "),
+        ("^spam (?P<ham>\\d+)", "spam "),
+        ("^spam?", "spa"),
+        ("^spam*", "spa"),
+        ("^spam+", "spa"),
+        ("^\\.spam", ".spam"),
+        ("^\\w+", ""),
+        ("^(spam)", ""),
+        ("^spam|ham", ""),
+        ("(?i)spam", ""),
+        ("(?x) s p a m", "spam"),
+        ("^šunka", "šunka"),
+    ),
+)
+def test_literal_prefix(pattern, prefix):
+    assert rtm.literal_prefix(re.compile(pattern)) == prefix
+
+
+class TestMessageMatcher:
+    @pytest.fixture
+    def make_provider(self):
+        def make(pattern):
+            message_pattern = re.compile(pattern)
+            return Mock(
+                message_pattern=message_pattern,
+                message_prefix=rtm.literal_prefix(message_pattern),
+            )
+
+        return make
+
+    def test_candidates(self, make_provider):
+        spam = make_provider("^spam")
+        spam_ham = make_provider("^spam ham")
+        sp = make_provider("^sp[ae]")
+        anything = make_provider("(\\w+)")
+
+        matcher = rtm.MessageMatcher([spam, spam_ham, sp, anything])
+
+        assert list(matcher.candidates("spam ham egg")) == [
+            anything,
+            sp,
+            spam,
+            spam_ham,
+        ]
+        assert list(matcher.candidates("spam egg")) == [anything, sp, spam]
+        assert list(matcher.candidates("spe")) == [anything, sp]
+        assert list(matcher.candidates("ham")) == [anything]
+        assert list(matcher.candidates("")) == [anything]
+
+    def test_handle_event(self, make_provider):
+        spam = make_provider("^spam")
+        ham = make_provider("^ham")
+
+        matcher = rtm.MessageMatcher([spam, ham])
+        matcher.handle_event({"type": "message", "text": "spam"})
+        matcher.handle_event({"type": "message"})
+
+        assert spam.handle_event.call_args_list == [
+            call({"type": "message", "text": "spam"})
+        ]
+        assert ham.handle_event.call_args_list == []
+
+
 @pytest.fixture
 def tracker():
     yield Mock()
@@ -317,6 +503,7 @@ class TestMultipleBotAccounts:
     def make_client(self):
         def make(bot_name, token, events):
             client = Mock(bot_name=bot_name, token=token)
+            client.server.login_data = {}
             client.rtm_read.return_value = events
             return client
 
@@ -498,6 +685,2442 @@ def test_handlers_do_not_block(SlackClient, container_factory, config, tracker):
             work_2.send()
 
 
+class TestSelectReadMode:
+    @pytest.fixture
+    def config(self):
+        return {
+            constants.CONFIG_KEY: {
+                "TOKEN": "abc-123",
+                "READ_MODE": "select",
+                "PING_INTERVAL": 0.05,
+            }
+        }
+
+    @pytest.fixture
+    def sockets(self):
+        bot_side, slack_side = socket.socketpair()
+        bot_side.setblocking(0)
+        yield bot_side, slack_side
+        bot_side.close()
+        slack_side.close()
+
+    @pytest.fixture
+    def client(self, sockets):
+        """ Mocked Slack client reading newline separated events from a socket
+        """
+        bot_side, _ = sockets
+
+        def rtm_read():
+            data = bot_side.recv(4096)  # raises EAGAIN once drained
+            return [json.loads(line) for line in data.decode().splitlines()]
+
+        with patch("nameko_slack.rtm.SlackClient") as SlackClient:
+            client = SlackClient.return_value
+            client.server.websocket.sock = bot_side
+            client.rtm_read.side_effect = rtm_read
+            yield client
+
+    @pytest.fixture
+    def publish(self, sockets):
+        _, slack_side = sockets
+
+        def _publish(*events):
+            data = "".join(json.dumps(event) + "\n" for event in events)
+            slack_side.sendall(data.encode())
+
+        return _publish
+
+    def test_handles_events_as_soon_as_readable(
+        self, client, config, container_factory, publish, tracker
+    ):
+        class Service:
+
+            name = "sample"
+
+            @rtm.handle_event
+            def handle_event(self, event):
+                tracker.handle_event(event)
+
+        container = container_factory(Service, config)
+        container.start()
+
+        publish({"type": "hello"})
+        sleep(0.01)
+        assert tracker.handle_event.call_args_list == [call({"type": "hello"})]
+
+        publish({"type": "spam"}, {"type": "ham"})
+        sleep(0.01)
+        assert tracker.handle_event.call_args_list == [
+            call({"type": "hello"}),
+            call({"type": "spam"}),
+            call({"type": "ham"}),
+        ]
+
+    def test_reports_read_loop_time(
+        self, client, config, container_factory, publish
+    ):
+        class Service:
+
+            name = "sample"
+
+            @rtm.handle_event
+            def handle_event(self, event):
+                pass
+
+        config[constants.CONFIG_KEY]["METRICS"] = {"PROMETHEUS": True}
+        container = container_factory(Service, config)
+        container.start()
+
+        publish({"type": "hello"})
+        sleep(0.01)
+
+        recorder = get_extension(container, Instrumentation).recorder
+        assert (("bot", "default"),) in recorder.histograms["rtm_read_loop_seconds"]
+
+    def test_pings_when_idle(self, client, config, container_factory):
+        class Service:
+
+            name = "sample"
+
+            @rtm.handle_event
+            def handle_event(self, event):
+                pass
+
+        container = container_factory(Service, config)
+        container.start()
+
+        assert not client.server.ping.called
+        sleep(0.07)
+        assert client.server.ping.called
+
+    def test_read_available_stops_on_empty_read(self):
+        client = Mock()
+        client.rtm_read.side_effect = [[{"type": "hello"}], [], [{"type": "spam"}]]
+
+        assert list(rtm.read_available(client)) == [{"type": "hello"}]
+
+    def test_read_errors_are_raised(self):
+        client = Mock()
+        client.rtm_read.side_effect = socket.error(errno.ECONNRESET, "reset")
+
+        with pytest.raises(socket.error):
+            list(rtm.read_available(client))
+
+
+@pytest.fixture
+def login_data():
+    return {
+        "ok": True,
+        "url": "wss://example.com/",
+        "self": {"id": "U0", "name": "bot"},
+        "team": {"id": "T1", "name": "Spam"},
+        "users": [{"id": "U1", "name": "alice"}, {"id": "U2", "name": "bob"}],
+        "channels": [{"id": "C1", "name": "general"}],
+        "groups": [{"id": "G1", "name": "secret"}],
+        "mpims": [{"id": "G2", "name": "mpdm-alice--bob-1"}],
+        "ims": [{"id": "D1", "user": "U1", "is_im": True}],
+    }
+
+
+class TestWorkspaceSnapshot:
+    @pytest.fixture
+    def workspace(self, login_data):
+        workspace = rtm.WorkspaceSnapshot(Mock())
+        workspace.load(login_data)
+        return workspace
+
+    def test_load(self, workspace):
+        assert workspace.team == {"id": "T1", "name": "Spam"}
+        assert workspace.self == {"id": "U0", "name": "bot"}
+        assert workspace.user("U1") == {"id": "U1", "name": "alice"}
+        assert workspace.user("U3") is None
+        assert workspace.channel("C1") == {"id": "C1", "name": "general"}
+        assert workspace.channel("G1") == {"id": "G1", "name": "secret"}
+        assert workspace.channel("G2") == {"id": "G2", "name": "mpdm-alice--bob-1"}
+        assert workspace.channel("D1") is None
+        assert workspace.im("D1") == {"id": "D1", "user": "U1", "is_im": True}
+        assert workspace.im_with("U1") == {"id": "D1", "user": "U1", "is_im": True}
+        assert workspace.client.api_call.call_count == 0
+
+    @pytest.mark.parametrize(
+        ("event", "lookup", "expected"),
+        (
+            (
+                {"type": "team_join", "user": {"id": "U3", "name": "carol"}},
+                ("user", "U3"),
+                {"id": "U3", "name": "carol"},
+            ),
+            (
+                {"type": "user_change", "user": {"id": "U1", "name": "alicia"}},
+                ("user", "U1"),
+                {"id": "U1", "name": "alicia"},
+            ),
+            (
+                {"type": "channel_created", "channel": {"id": "C2", "name": "ham"}},
+                ("channel", "C2"),
+                {"id": "C2", "name": "ham", "is_im": False},
+            ),
+            (
+                {
+                    "type": "im_created",
+                    "user": "U2",
+                    "channel": {"id": "D2"},
+                },
+                ("im_with", "U2"),
+                {"id": "D2", "user": "U2", "is_im": True},
+            ),
+            (
+                {"type": "channel_rename", "channel": {"id": "C1", "name": "random"}},
+                ("channel", "C1"),
+                {"id": "C1", "name": "random"},
+            ),
+            ({"type": "channel_deleted", "channel": "C1"}, ("channel", "C1"), None),
+            (
+                {"type": "user_typing", "channel": "C1"},
+                ("user", "U1"),
+                {"id": "U1", "name": "alice"},
+            ),
+        ),
+    )
+    def test_update(self, workspace, event, lookup, expected):
+        workspace.update(event)
+
+        method, key = lookup
+        assert getattr(workspace, method)(key) == expected
+
+    def test_lazy_loading(self):
+        pages = {
+            ("users.list", ""): {
+                "ok": True,
+                "members": [{"id": "U1"}],
+                "response_metadata": {"next_cursor": "next"},
+            },
+            ("users.list", "next"): {
+                "ok": True,
+                "members": [{"id": "U2"}],
+                "response_metadata": {"next_cursor": ""},
+            },
+            ("conversations.list", ""): {"ok": False, "error": "ratelimited"},
+        }
+        client = Mock()
+        client.api_call.side_effect = lambda method, cursor, **kwargs: pages[
+            (method, cursor)
+        ]
+        workspace = rtm.WorkspaceSnapshot(client, lazy=True)
+        workspace.load({"self": {"id": "U0"}, "team": {"id": "T1"}})
+
+        assert workspace.user("U1") == {"id": "U1"}
+        assert client.api_call.call_count == 1
+
+        assert workspace.user("U3") is None
+        assert workspace.user("U2") == {"id": "U2"}
+        assert client.api_call.call_count == 2
+
+        assert workspace.channel("C1") is None
+        assert client.api_call.call_args_list[-1] == call(
+            "conversations.list",
+            limit=200,
+            cursor="",
+            types="public_channel,private_channel,mpim,im",
+        )
+
+
+class TestConnect:
+    @pytest.fixture
+    def client(self, login_data):
+        client = Mock()
+        client.server.login_data = login_data
+        return client
+
+    @pytest.fixture
+    def client_manager(self):
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.cache = EntityCache()
+        return client_manager
+
+    def test_connect_with_rtm_start(self, client, client_manager, login_data):
+        client_manager.connect("Alice", client)
+
+        assert client.server.rtm_connect.call_args == call(use_rtm_start=True)
+        assert client.server.login_data == login_data
+
+        workspace = client_manager.workspaces["Alice"]
+        assert workspace.lazy is False
+        assert workspace.user("U2") == {"id": "U2", "name": "bob"}
+
+        cache = client_manager.cache
+        assert cache.get("Alice", "team", None) == {"id": "T1", "name": "Spam"}
+        assert cache.get("Alice", "users", "U1") == {"id": "U1", "name": "alice"}
+        assert cache.get("Alice", "channels", "D1") == {
+            "id": "D1",
+            "user": "U1",
+            "is_im": True,
+        }
+
+    def test_connect_again(self, client, client_manager):
+        client_manager.connect("Alice", client)
+        client_manager.connect("Alice", client)
+
+        assert client_manager.wait_until_ready("Alice", timeout=0)
+
+    def test_seeding_respects_cache_size(self, client, client_manager):
+        client_manager.cache.size = 3
+        client_manager.connect("Alice", client)
+
+        assert client_manager.cache.stats()["size"] == 3
+        assert client_manager.cache.stats()["evictions"] == 0
+
+    def test_connect_with_rtm_connect(self, client, client_manager):
+        client_manager.connect_method = "rtm.connect"
+        client.server.login_data = {"ok": True, "self": {"id": "U0"}}
+
+        client_manager.connect("Alice", client)
+
+        assert client.server.rtm_connect.call_args == call(use_rtm_start=False)
+        assert client_manager.workspaces["Alice"].lazy is True
+        assert client_manager.cache.stats()["size"] == 0
+
+    def test_handle_updates_workspace(self, client, client_manager):
+        client_manager.connect("Alice", client)
+        client_manager.handle("Alice", {"type": "user_change", "user": {"id": "U1"}})
+
+        assert client_manager.workspaces["Alice"].user("U1") == {"id": "U1"}
+
+    def test_unknown_connect_method(self):
+        config = {"SLACK": {"TOKEN": "abc-123", "CONNECT_METHOD": "spam"}}
+
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.container = Mock(config=config)
+
+        with pytest.raises(ConfigurationError) as exc:
+            client_manager.setup()
+
+        assert str(exc.value) == "Unknown `CONNECT_METHOD` `spam` in `SLACK` config"
+
+
+class TestConnectPool:
+    @pytest.fixture
+    def clients(self):
+        def rtm_connect(use_rtm_start):
+            sleep(0.1)
+
+        clients = {}
+        for bot_name in ("Alice", "Bob", "Carol", "Dave"):
+            client = Mock()
+            client.server.login_data = {}
+            client.server.rtm_connect.side_effect = rtm_connect
+            clients[bot_name] = client
+        return clients
+
+    @pytest.fixture
+    def client_manager(self, clients):
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.container = Mock()
+        client_manager.cache = EntityCache()
+        client_manager.clients = clients
+        return client_manager
+
+    @patch("nameko_slack.rtm.SlackClient")
+    def test_setup(self, SlackClient):
+        config = {
+            "SLACK": {
+                "TOKEN": "abc-123",
+                "CONNECT_POOL": {"SIZE": 10, "STAGGER": 2.5, "WAIT": False},
+            }
+        }
+
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.container = Mock(config=config)
+        client_manager.setup()
+
+        assert client_manager.connect_pool_size == 10
+        assert client_manager.connect_stagger == 2.5
+        assert client_manager.connect_wait is False
+
+    def test_connects_bots_concurrently(self, client_manager, clients):
+        client_manager.connect_pool_size = 2
+
+        started = time.time()
+        client_manager.start()
+
+        # two rounds of two connects rather than four in a row
+        assert 0.2 <= time.time() - started < 0.3
+        for bot_name, client in clients.items():
+            assert client_manager.wait_until_ready(bot_name, timeout=0)
+            assert bot_name in client_manager.workspaces
+        spawned = client_manager.container.spawn_managed_thread.call_args_list
+        assert sorted(thread.args for ((thread,), _) in spawned) == sorted(
+            (bot_name, client) for bot_name, client in clients.items()
+        )
+
+    @patch("nameko_slack.rtm.random.uniform", return_value=0.01)
+    def test_staggers_connects(self, uniform, client_manager, clients):
+        client_manager.connect_pool_size = 4
+        client_manager.connect_stagger = 1
+
+        client_manager.start()
+
+        assert uniform.call_args_list == [call(0, 1)] * 4
+
+    def test_start_without_waiting(self, client_manager, clients):
+        client_manager.connect_wait = False
+
+        client_manager.start()
+
+        assert client_manager.wait_until_ready("Alice", timeout=0) is False
+        ((connect_all,), _) = client_manager.container.spawn_managed_thread.call_args
+        spawn(connect_all)
+        assert client_manager.wait_until_ready("Alice", timeout=1) is True
+
+    def test_connect_failure_fails_start(self, client_manager, clients):
+        clients["Bob"].server.rtm_connect.side_effect = socket.error("Refused")
+
+        with pytest.raises(socket.error):
+            client_manager.start()
+
+        assert client_manager.wait_until_ready("Bob", timeout=0) is False
+
+
+class TestSharding:
+    @pytest.fixture
+    def clients(self):
+        clients = {}
+        for bot_name in ("Alice", "Bob", "Carol", "Dave", "Eve", "Frank"):
+            client = Mock()
+            client.server.login_data = {}
+            client.rtm_read.return_value = []
+            clients[bot_name] = client
+        return clients
+
+    @pytest.fixture
+    def client_manager(self, clients):
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.container = Mock()
+        client_manager.container.spawn_managed_thread.side_effect = spawn
+        client_manager.cache = EntityCache()
+        client_manager.clients = clients
+        client_manager.member = "one"
+        client_manager.members = ["one", "two"]
+        yield client_manager
+        for readers in list(client_manager.readers.values()):
+            for reader in readers:
+                reader.kill()
+
+    def owner(self, client_manager, bot_name):
+        return client_manager.ring.owner(bot_name)
+
+    @patch("nameko_slack.rtm.SlackClient")
+    def test_setup(self, SlackClient):
+        config = {
+            "SLACK": {
+                "TOKEN": "abc-123",
+                "SHARDING": {
+                    "MEMBER": "one",
+                    "MEMBERS": ["one", "two"],
+                    "REPLICAS": 10,
+                    "INTERVAL": 5,
+                },
+            }
+        }
+
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.container = Mock(config=config)
+        client_manager.setup()
+
+        assert client_manager.member == "one"
+        assert client_manager.members == ["one", "two"]
+        assert client_manager.shard_replicas == 10
+        assert client_manager.shard_interval == 5
+
+    @patch("nameko_slack.rtm.import_path")
+    @patch("nameko_slack.rtm.SlackClient")
+    def test_setup_members_hook(self, SlackClient, import_path):
+        config = {
+            "SLACK": {
+                "TOKEN": "abc-123",
+                "SHARDING": {"MEMBER": "one", "MEMBERS": "service.cluster:members"},
+            }
+        }
+
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.container = Mock(config=config)
+        client_manager.setup()
+
+        assert import_path.call_args == call("service.cluster:members")
+        assert client_manager.members == import_path.return_value
+
+    @pytest.mark.parametrize(
+        "sharding", ({"MEMBER": "one"}, {"MEMBERS": ["one", "two"]})
+    )
+    @patch("nameko_slack.rtm.SlackClient")
+    def test_setup_incomplete(self, SlackClient, sharding):
+        config = {"SLACK": {"TOKEN": "abc-123", "SHARDING": sharding}}
+
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.container = Mock(config=config)
+
+        with pytest.raises(ConfigurationError) as exc:
+            client_manager.setup()
+
+        assert str(exc.value) == (
+            "`SHARDING` needs both `MEMBER` and `MEMBERS` in `SLACK` config"
+        )
+
+    def test_connects_own_shard_only(self, client_manager, clients):
+        client_manager.start()
+
+        owned = {
+            bot_name
+            for bot_name in clients
+            if self.owner(client_manager, bot_name) == "one"
+        }
+        assert owned
+        assert owned != set(clients)
+        assert client_manager.owned == owned
+        assert set(client_manager.readers) == owned
+        for bot_name, client in clients.items():
+            assert client.server.rtm_connect.called is (bot_name in owned)
+
+    def test_other_members_connect_the_rest(self, client_manager, clients):
+        client_manager.start()
+
+        other = rtm.SlackRTMClientManager()
+        other.container = Mock()
+        other.clients = clients
+        other.member = "two"
+        other.members = ["two", "one"]
+
+        assert other.shard(other.members) == set(clients) - client_manager.owned
+
+    def test_not_a_member(self, client_manager, clients):
+        client_manager.member = "three"
+
+        client_manager.start()
+
+        assert client_manager.owned == set()
+        assert client_manager.readers == {}
+
+    def test_rebalance(self, client_manager, clients):
+        client_manager.start()
+        before = set(client_manager.owned)
+        readers = dict(client_manager.readers)
+
+        # the other member leaves
+        client_manager.rebalance(["one"])
+        assert client_manager.owned == set(clients)
+        while len(client_manager.readers) < len(clients):
+            sleep(0.01)
+        assert set(client_manager.readers) == set(clients)
+        for bot_name in before:
+            assert client_manager.readers[bot_name] is readers[bot_name]
+
+        # and comes back
+        client_manager.rebalance(["one", "two"])
+        assert client_manager.owned == before
+        assert set(client_manager.readers) == before
+        for bot_name, client in clients.items():
+            assert client.server.websocket.close.called is (bot_name not in before)
+
+    def test_rebalance_with_same_members(self, client_manager, clients):
+        client_manager.start()
+        ring = client_manager.ring
+
+        client_manager.rebalance(["two", "one"])
+
+        assert client_manager.ring is ring
+
+    def test_bot_moved_away_while_connecting(self, client_manager, clients):
+        client_manager.owned = set()
+
+        client_manager.start_bot("Alice", clients["Alice"])
+
+        assert client_manager.readers == {}
+        assert clients["Alice"].server.websocket.close.called
+
+    def test_watches_members(self, client_manager, clients):
+        members = Mock(
+            side_effect=chain(
+                [["one", "two"], ValueError("Unavailable")], repeat(["one"])
+            )
+        )
+        client_manager.members = members
+        client_manager.shard_interval = 0.01
+
+        client_manager.start()
+        assert client_manager.owned != set(clients)
+
+        sleep(0.05)
+        assert client_manager.owned == set(clients)
+        assert members.call_count > 3
+
+
+class TestSocketMode:
+    @pytest.fixture
+    def clients(self):
+        clients = {}
+        for bot_name in ("Alice", "Bob"):
+            client = Mock()
+            client.api_call.return_value = {
+                "ok": True,
+                "user_id": "U{}".format(bot_name),
+                "user": bot_name.lower(),
+                "team_id": "T1",
+                "team": "Spam",
+            }
+            clients[bot_name] = client
+        return clients
+
+    @pytest.fixture
+    def connections(self, clients):
+        connections = {}
+        for bot_name in clients:
+            connections[bot_name] = []
+            for index in range(2):
+                connection = Mock()
+                connection.api_call.return_value = {
+                    "ok": True,
+                    "url": "wss://{}/{}".format(bot_name, index),
+                }
+                connection.server.websocket_safe_read.return_value = ""
+                connections[bot_name].append(connection)
+        return connections
+
+    @pytest.fixture
+    def client_manager(self, clients, connections):
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.container = Mock()
+        client_manager.container.spawn_managed_thread.side_effect = spawn
+        client_manager.cache = EntityCache()
+        client_manager.clients = clients
+        client_manager.connections = connections
+        client_manager.envelopes = {
+            bot_name: rtm.RecentEvents(10, key=socket_mode.envelope_key)
+            for bot_name in clients
+        }
+        client_manager.socket_mode = True
+        yield client_manager
+        for readers in list(client_manager.readers.values()):
+            for reader in readers:
+                reader.kill()
+
+    def envelope(self, envelope_id, event_id=None, **event):
+        return json.dumps(
+            {
+                "envelope_id": envelope_id,
+                "type": "events_api",
+                "payload": {"event_id": event_id or envelope_id, "event": event},
+            }
+        )
+
+    def acks(self, connection):
+        return [
+            json.loads(data)["envelope_id"]
+            for (data,), _ in connection.server.websocket.send.call_args_list
+        ]
+
+    @patch("nameko_slack.rtm.SlackClient")
+    def test_setup(self, SlackClient):
+        config = {
+            "SLACK": {
+                "TOKEN": "xoxb-123",
+                "RECONNECT": {"PONG_TIMEOUT": 5},
+                "SOCKET_MODE": {"APP_TOKEN": "xapp-123", "CONNECTIONS": 3},
+            }
+        }
+
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.container = Mock(config=config)
+        client_manager.setup()
+
+        assert client_manager.socket_mode is True
+        assert len(client_manager.connections["default"]) == 3
+        assert SlackClient.call_args_list == [call("xoxb-123")] + [
+            call("xapp-123")
+        ] * 3
+        assert client_manager.envelopes["default"].size == 1000
+        assert client_manager.pong_timeout is None
+
+        # liveness pings are websocket pings
+        connection = client_manager.connections["default"][0]
+        connection.server.ping()
+        assert connection.server.websocket.ping.called
+
+    @patch("nameko_slack.rtm.SlackClient")
+    def test_setup_multiple_bots(self, SlackClient):
+        config = {
+            "SLACK": {
+                "BOTS": {"Alice": "xoxb-1", "Bob": "xoxb-2"},
+                "SOCKET_MODE": {
+                    "APP_TOKENS": {"Alice": "xapp-1", "Bob": "xapp-2"},
+                    "DEDUPE": 0,
+                },
+            }
+        }
+
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.container = Mock(config=config)
+        client_manager.setup()
+
+        assert set(client_manager.connections) == {"Alice", "Bob"}
+        assert len(client_manager.connections["Alice"]) == 2
+        assert client_manager.envelopes == {}
+
+    @patch("nameko_slack.rtm.SlackClient")
+    def test_setup_missing_app_token(self, SlackClient):
+        config = {
+            "SLACK": {
+                "BOTS": {"Alice": "xoxb-1", "Bob": "xoxb-2"},
+                "SOCKET_MODE": {"APP_TOKENS": {"Alice": "xapp-1"}},
+            }
+        }
+
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.container = Mock(config=config)
+
+        with pytest.raises(ConfigurationError) as exc:
+            client_manager.setup()
+
+        assert str(exc.value) == (
+            "No app token for `Bob` bot in `SOCKET_MODE` of `SLACK` config"
+        )
+
+    def test_start(self, client_manager, clients, connections):
+        client_manager.start()
+
+        for bot_name, client in clients.items():
+            assert len(client_manager.readers[bot_name]) == 2
+            for index, connection in enumerate(connections[bot_name]):
+                assert connection.api_call.call_args == call("apps.connections.open")
+                assert connection.server.connect_slack_websocket.call_args == call(
+                    "wss://{}/{}".format(bot_name, index)
+                )
+            # the workspace is loaded once with the bot's token
+            assert client.api_call.call_args_list == [call("auth.test")]
+            workspace = client_manager.workspaces[bot_name]
+            assert workspace.self == {"id": "U" + bot_name, "name": bot_name.lower()}
+            assert workspace.team == {"id": "T1", "name": "Spam"}
+            assert client_manager.wait_until_ready(bot_name, timeout=0)
+
+    def test_open_connection_failure(self, client_manager, connections):
+        connections["Alice"][1].api_call.return_value = {
+            "ok": False,
+            "error": "invalid_auth",
+        }
+
+        with pytest.raises(SlackConnectionError) as exc:
+            client_manager.connect("Alice", connections["Alice"][1])
+
+        assert str(exc.value) == "Failed to open connection: invalid_auth"
+
+    def test_stop_bot(self, client_manager, connections):
+        client_manager.owned = {"Alice"}
+        client_manager.connect_all()
+
+        client_manager.stop_bot("Alice")
+
+        assert client_manager.readers == {}
+        for connection in connections["Alice"]:
+            assert connection.server.websocket.close.called
+
+    def test_reads_events_and_acks_envelopes(self, client_manager, connections):
+        connection = connections["Alice"][0]
+        connection.server.websocket_safe_read.side_effect = [
+            "\n".join(
+                [
+                    json.dumps({"type": "hello", "num_connections": 2}),
+                    self.envelope("E1", type="message", text="spam"),
+                    self.envelope("E2", type="reaction_added"),
+                ]
+            )
+        ]
+
+        events = client_manager.read_envelopes("Alice", connection)
+
+        assert events == [
+            {"type": "hello"},
+            {"type": "message", "text": "spam"},
+            {"type": "reaction_added"},
+        ]
+        assert self.acks(connection) == ["E1", "E2"]
+
+    def test_drops_envelopes_delivered_twice(self, client_manager, connections):
+        one, other = connections["Alice"]
+        one.server.websocket_safe_read.side_effect = [
+            self.envelope("E1", type="message", text="spam")
+        ]
+        other.server.websocket_safe_read.side_effect = [
+            "\n".join(
+                [
+                    self.envelope("E1", type="message", text="spam"),
+                    self.envelope("E2", "E1", type="message", text="spam"),
+                ]
+            ),
+            "",
+        ]
+
+        assert client_manager.read_envelopes("Alice", one) == [
+            {"type": "message", "text": "spam"}
+        ]
+        assert client_manager.read_envelopes("Alice", other) == []
+        # duplicates are acknowledged all the same
+        assert self.acks(other) == ["E1", "E2"]
+
+    def test_keeps_duplicates_without_dedupe(self, client_manager, connections):
+        client_manager.envelopes = {}
+        connection = connections["Alice"][0]
+        connection.server.websocket_safe_read.side_effect = [
+            "\n".join([self.envelope("E1", type="message")] * 2)
+        ]
+
+        events = client_manager.read_envelopes("Alice", connection)
+
+        assert events == [{"type": "message"}] * 2
+
+    def test_ignores_other_envelopes(self, client_manager, connections):
+        connection = connections["Alice"][0]
+        connection.server.websocket_safe_read.side_effect = [
+            json.dumps(
+                {"envelope_id": "E1", "type": "slash_commands", "payload": {}}
+            ),
+            "",
+        ]
+
+        assert client_manager.read_envelopes("Alice", connection) == []
+        assert self.acks(connection) == ["E1"]
+
+    def test_refreshes_connection(self, client_manager, connections):
+        connection = connections["Alice"][0]
+        previous = connection.server.websocket
+        replacement = Mock()
+
+        def connect(url):
+            connection.server.websocket = replacement
+
+        connection.server.connect_slack_websocket.side_effect = connect
+        connection.server.websocket_safe_read.side_effect = [
+            json.dumps({"type": "disconnect", "reason": "refresh_requested"}),
+            self.envelope("E1", type="message"),
+        ]
+
+        events = client_manager.read_envelopes("Alice", connection)
+
+        assert events == [{"type": "message"}]
+        assert connection.api_call.call_args == call("apps.connections.open")
+        assert previous.close.called
+        assert not previous.send.called
+        assert replacement.send.call_args == call(json.dumps({"envelope_id": "E1"}))
+
+    def test_custom_decoder(self, client_manager, connections):
+        client_manager.decode = Mock(side_effect=json.loads)
+        connection = connections["Alice"][0]
+        connection.server.websocket_safe_read.side_effect = [
+            self.envelope("E1", type="message")
+        ]
+
+        client_manager.read_envelopes("Alice", connection)
+
+        assert client_manager.decode.called
+
+    def test_dispatches_to_rtm_handlers(self, client_manager, connections):
+        provider = Mock(bot_name="Alice", event_type="message")
+        client_manager.routes = {("Alice", "message"): (provider,)}
+        connection = connections["Alice"][0]
+        connection.server.websocket_safe_read.side_effect = chain(
+            [self.envelope("E1", type="message", text="spam")], repeat("")
+        )
+        client_manager.read_interval = 0.01
+        client_manager.owned = {"Alice"}
+
+        client_manager.connect_all()
+        sleep(0.05)
+
+        assert provider.handle_event.call_args == call(
+            {"type": "message", "text": "spam"}
+        )
+
+    def test_replies_over_web_api(self, client_manager, clients):
+        client_manager.reply("Alice", {"channel": "C1"}, "ham")
+
+        assert clients["Alice"].api_call.call_args == call(
+            "chat.postMessage", channel="C1", text="ham"
+        )
+        assert not clients["Alice"].rtm_send_message.called
+
+    def test_outbox_replies_over_web_api(self, client_manager, clients):
+        client_manager.setup_outboxes({})
+        outbox = client_manager.outboxes["Alice"]
+        thread = spawn(outbox.run)
+
+        client_manager.reply("Alice", {"channel": "C1"}, "ham")
+        sleep(0.01)
+        thread.kill()
+
+        assert clients["Alice"].api_call.call_args == call(
+            "chat.postMessage", channel="C1", text="ham"
+        )
+
+
+class TestLiveness:
+    def test_pings_idle_connection(self):
+        client = Mock()
+        liveness = rtm.Liveness(ping_interval=0.02)
+
+        liveness.check(client)
+        assert not client.server.ping.called
+        sleep(0.02)
+        liveness.check(client)
+        assert client.server.ping.call_count == 1
+
+        # pings again after another interval without an answer
+        assert 0.01 < liveness.timeout() <= 0.02
+        sleep(0.02)
+        liveness.check(client)
+        assert client.server.ping.call_count == 2
+
+    def test_gives_up_on_unanswered_ping(self):
+        client = Mock()
+        liveness = rtm.Liveness(ping_interval=0.01, pong_timeout=0.02)
+
+        sleep(0.01)
+        liveness.check(client)
+        assert client.server.ping.call_count == 1
+        sleep(0.02)
+
+        with pytest.raises(rtm.ConnectionLost) as exc:
+            liveness.check(client)
+        assert str(exc.value) == "No answer to ping in 0.02 seconds"
+
+    def test_any_frame_answers_ping(self):
+        client = Mock()
+        liveness = rtm.Liveness(ping_interval=0.01, pong_timeout=0.01)
+
+        sleep(0.01)
+        liveness.check(client)
+        liveness.received()
+        sleep(0.01)
+        liveness.check(client)
+
+        assert client.server.ping.call_count == 2
+
+
+class TestRecentEvents:
+    def test_spots_events_delivered_again(self):
+        recent_events = rtm.RecentEvents(size=2)
+        message = {"type": "message", "channel": "C1", "ts": "1.1"}
+
+        assert recent_events.add(message) is True
+        assert recent_events.add(dict(message)) is False
+        assert recent_events.add(dict(message, channel="C2")) is True
+        assert recent_events.add({"type": "hello"}) is True
+        assert recent_events.add({"type": "hello"}) is True
+
+    def test_remembers_the_last_events_only(self):
+        recent_events = rtm.RecentEvents(size=2)
+        for ts in ("1.1", "1.2", "1.3"):
+            recent_events.add({"type": "message", "ts": ts})
+
+        assert recent_events.add({"type": "message", "ts": "1.1"}) is True
+        assert recent_events.add({"type": "message", "ts": "1.3"}) is False
+
+    def test_event_key(self):
+        event = {
+            "type": "channel_created",
+            "channel": {"id": "C1", "name": "spam"},
+            "event_ts": "1.1",
+        }
+
+        assert rtm.event_key(event) == ("channel_created", None, "C1", "1.1")
+
+
+class TestReconnect:
+    @pytest.fixture
+    def client(self):
+        client = Mock()
+        client.server.login_data = {}
+        return client
+
+    @pytest.fixture
+    def client_manager(self, client):
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.container = Mock(
+            config={"SLACK": {"TOKEN": "abc-123", "RECONNECT": {"DELAY": 0.001}}}
+        )
+        with patch("nameko_slack.rtm.SlackClient", return_value=client):
+            client_manager.setup()
+        client_manager.cache = EntityCache()
+        client_manager.read_interval = 0.001
+        client_manager.handle = Mock()
+        return client_manager
+
+    @pytest.fixture
+    def run(self, client_manager, client):
+        threads = []
+
+        def run():
+            threads.append(spawn(client_manager.run, "default", client))
+            sleep(0.05)
+
+        yield run
+
+        for thread in threads:
+            thread.kill()
+
+    def handled(self, client_manager):
+        return [event for ((_, event), _) in client_manager.handle.call_args_list]
+
+    def test_setup(self, client_manager):
+        assert client_manager.auto_reconnect is True
+        assert client_manager.reconnect_delay == 0.001
+        assert client_manager.max_reconnect_delay == 60
+        assert client_manager.pong_timeout == 10
+        assert client_manager.recent_events["default"].size == 1000
+
+    def test_setup_without_dedupe(self, client_manager):
+        client_manager.recent_events = {}
+        client_manager.setup_reconnect({"DEDUPE": 0, "PONG_TIMEOUT": 5})
+
+        assert client_manager.pong_timeout == 5
+        assert client_manager.recent_events == {}
+
+        message = {"type": "message", "channel": "C1", "ts": "1.1"}
+        client_manager.receive("default", message)
+        client_manager.receive("default", message)
+        assert self.handled(client_manager) == [message, message]
+
+    def test_errors_propagate_without_reconnect(self, client_manager, client):
+        client_manager.auto_reconnect = False
+        client.rtm_read.side_effect = socket.error("Connection reset")
+
+        with pytest.raises(socket.error):
+            client_manager.run("default", client)
+
+    def test_reconnects_on_read_error(self, client_manager, client, run):
+        client.rtm_read.side_effect = chain(
+            [[{"type": "hello"}], socket.error("Connection reset")], repeat([])
+        )
+
+        run()
+
+        assert client.server.rtm_connect.call_count == 1
+        assert self.handled(client_manager) == [{"type": "hello"}]
+
+    def test_reconnects_on_goodbye(self, client_manager, client, run):
+        client.rtm_read.side_effect = chain(
+            [[{"type": "goodbye"}], [{"type": "hello"}]], repeat([])
+        )
+
+        run()
+
+        assert client.server.rtm_connect.call_count == 1
+        assert self.handled(client_manager) == [{"type": "hello"}]
+
+    def test_resumes_with_reconnect_url(self, client_manager, client, run):
+        client.rtm_read.side_effect = chain(
+            [[{"type": "reconnect_url", "url": "wss://spam"}, {"type": "goodbye"}]],
+            repeat([]),
+        )
+
+        run()
+
+        assert client.server.connect_slack_websocket.call_args == call("wss://spam")
+        assert not client.server.rtm_connect.called
+
+    def test_connects_when_resume_fails(self, client_manager, client, run):
+        client.server.connect_slack_websocket.side_effect = socket.error("Refused")
+        client.rtm_read.side_effect = chain(
+            [[{"type": "reconnect_url", "url": "wss://spam"}, {"type": "goodbye"}]],
+            repeat([]),
+        )
+
+        run()
+
+        assert client.server.rtm_connect.call_count == 1
+
+    @patch("nameko_slack.rtm.random.uniform", return_value=0)
+    def test_backs_off_between_attempts(self, uniform, client_manager, client, run):
+        client_manager.reconnect_delay = 1
+        client_manager.max_reconnect_delay = 3
+        client.server.rtm_connect.side_effect = chain(
+            [socket.error("Refused")] * 3, repeat(None)
+        )
+        client.rtm_read.side_effect = chain([[{"type": "goodbye"}]], repeat([]))
+
+        run()
+
+        assert client.server.rtm_connect.call_count == 4
+        assert uniform.call_args_list == [
+            call(0.5, 1),
+            call(1.0, 2),
+            call(1.5, 3),
+            call(1.5, 3),
+        ]
+
+    def test_drops_events_delivered_again(self, client_manager, client, run):
+        message = {"type": "message", "channel": "C1", "ts": "1.1", "text": "spam"}
+        client.rtm_read.side_effect = chain(
+            [[message], socket.error("Connection reset"), [message]], repeat([])
+        )
+
+        run()
+
+        assert self.handled(client_manager) == [message]
+
+    def test_reconnects_when_ping_is_not_answered(self, client_manager, client, run):
+        client_manager.ping_interval = 0.01
+        client_manager.pong_timeout = 0.01
+        client.rtm_read.return_value = []
+
+        run()
+
+        assert client.server.ping.called
+        assert client.server.rtm_connect.called
+
+    def test_select_mode_gives_up_on_unanswered_ping(self, client_manager, client):
+        client_manager.ping_interval = 0.01
+        client_manager.pong_timeout = 0.01
+        client_manager.read_mode = "select"
+        bot_side, slack_side = socket.socketpair()
+        client.server.websocket.sock = bot_side
+        client.rtm_read.return_value = []
+
+        with pytest.raises(rtm.ConnectionLost):
+            client_manager.read_events("default", client)
+
+        assert client.server.ping.call_count == 1
+        bot_side.close()
+        slack_side.close()
+
+
+class TestIngress:
+    def queued(self, ingress):
+        return [event for lane in ingress.lanes.values() for event, _ in lane]
+
+    def test_sheds_oldest(self):
+        ingress = rtm.Ingress(size=2)
+        for text in ("spam", "ham", "egg"):
+            ingress.put({"type": "message", "text": text}, None)
+
+        assert [event["text"] for event in self.queued(ingress)] == ["ham", "egg"]
+        assert ingress.stats == {"queued": 3, "dropped": 1, "processed": 0, "depth": 2}
+
+    def test_sheds_by_event_type(self):
+        ingress = rtm.Ingress(
+            size=2, overload="shed_by_event_type", shed_event_types=["user_typing"]
+        )
+        ingress.put({"type": "message"}, None)
+        ingress.put({"type": "user_typing"}, None)
+        ingress.put({"type": "message"}, None)
+        assert self.queued(ingress) == [{"type": "message"}, {"type": "message"}]
+
+        # falls back to the oldest event
+        ingress.put({"type": "reaction_added"}, None)
+        assert self.queued(ingress) == [{"type": "message"}, {"type": "reaction_added"}]
+        assert ingress.stats["dropped"] == 2
+
+    def test_fair_sheds_from_the_busiest_channel(self):
+        ingress = rtm.Ingress(size=3, overload="fair")
+        for channel, ts in (("C1", "1"), ("C1", "2"), ("C2", "3"), ("C1", "4")):
+            ingress.put({"channel": channel, "ts": ts}, None)
+
+        assert [event["ts"] for event in self.queued(ingress)] == ["2", "4", "3"]
+        assert ingress.stats["dropped"] == 1
+
+    def test_fair_sheds_whole_channel(self):
+        ingress = rtm.Ingress(size=1, overload="fair")
+        ingress.put({"channel": "C1"}, None)
+        ingress.put({"channel": "C2"}, None)
+
+        assert list(ingress.lanes) == ["C2"]
+
+    @pytest.mark.parametrize("overload", ("shed_oldest", "shed_by_event_type"))
+    def test_passes_shed_events_on(self, overload):
+        on_shed = Mock()
+        ingress = rtm.Ingress(size=1, overload=overload, on_shed=on_shed)
+        ingress.put({"type": "message", "text": "spam"}, "job")
+        ingress.put({"type": "message", "text": "ham"}, None)
+
+        assert on_shed.call_args_list == [
+            call({"type": "message", "text": "spam"}, "job")
+        ]
+
+    def test_fair_takes_turns_between_channels(self):
+        ingress = rtm.Ingress(size=10, overload="fair")
+        for channel, ts in (("C1", "1"), ("C1", "2"), ("C1", "3"), ("C2", "4")):
+            ingress.put({"channel": channel, "ts": ts}, ts)
+
+        assert [ingress.take() for _ in range(4)] == ["1", "4", "2", "3"]
+        assert ingress.lanes == {}
+
+    def test_runs_limited_number_of_workers(self):
+        ingress = rtm.Ingress(concurrency=2)
+        finish = Event()
+        handled = []
+
+        def spawn_worker(args, kwargs, handle_result):
+            def work():
+                handled.append(args)
+                finish.wait()
+                handle_result(Mock(), "result", None)
+
+            spawn(work)
+
+        thread = spawn(ingress.run, spawn_worker)
+        for text in ("spam", "ham", "egg"):
+            ingress.put({"type": "message"}, ((text,), {}, None))
+        sleep(0.01)
+        assert handled == [("spam",), ("ham",)]
+        assert ingress.stats["depth"] == 1
+
+        finish.send()
+        sleep(0.01)
+        assert handled == [("spam",), ("ham",), ("egg",)]
+        assert ingress.stats == {"queued": 3, "dropped": 0, "processed": 3, "depth": 0}
+        thread.kill()
+
+    def test_failing_spawn_frees_its_slot(self):
+        ingress = rtm.Ingress(concurrency=1)
+        ingress.put({}, ((), {}, None))
+        spawn_worker = Mock(side_effect=RuntimeError("Container killed"))
+
+        with pytest.raises(RuntimeError):
+            ingress.run(spawn_worker)
+
+        assert ingress.slots.balance == 1
+
+    def test_result_handler_of_entrypoint(self):
+        ingress = rtm.Ingress()
+        handle_result = Mock(return_value=("result", None))
+        worker_ctx = Mock()
+
+        assert ingress.done(handle_result, worker_ctx, "spam", None) == ("result", None)
+        assert handle_result.call_args == call(worker_ctx, "spam", None)
+        assert ingress.stats["processed"] == 1
+
+
+class TestEntrypointQueue:
+    @pytest.fixture
+    def run_service(self, container_factory, config):
+        def run(service_class):
+            with patch("nameko_slack.rtm.SlackClient") as SlackClient:
+                SlackClient.return_value.rtm_read.return_value = []
+                container = container_factory(service_class, config)
+                container.start()
+            return container, SlackClient.return_value
+
+        return run
+
+    def test_reader_is_not_held_up_by_busy_workers(self, run_service, tracker):
+        finish = Event()
+
+        class Service:
+
+            name = "sample"
+
+            @rtm.handle_event("spam", queue_size=2, concurrency=1)
+            def handle_spam(self, event):
+                tracker.handle_spam(event)
+                finish.wait()
+
+            @rtm.handle_event("ham")
+            def handle_ham(self, event):
+                tracker.handle_ham(event)
+
+        container, _ = run_service(Service)
+        client_manager = get_extension(container, rtm.SlackRTMClientManager)
+        client_manager.handle("default", {"type": "spam", "ts": "1"})
+        sleep(0.01)
+        for ts in ("2", "3", "4"):
+            client_manager.handle("default", {"type": "spam", "ts": ts})
+        client_manager.handle("default", {"type": "ham"})
+        sleep(0.01)
+
+        assert tracker.handle_spam.call_args_list == [call({"type": "spam", "ts": "1"})]
+        assert tracker.handle_ham.call_args_list == [call({"type": "ham"})]
+        entrypoint = get_extension(
+            container, rtm.RTMEventHandlerEntrypoint, method_name="handle_spam"
+        )
+        assert entrypoint.ingress.stats == {
+            "queued": 4,
+            "dropped": 1,
+            "processed": 0,
+            "depth": 2,
+        }
+
+        finish.send()
+        sleep(0.01)
+        assert tracker.handle_spam.call_args_list == [
+            call({"type": "spam", "ts": "1"}),
+            call({"type": "spam", "ts": "3"}),
+            call({"type": "spam", "ts": "4"}),
+        ]
+        assert entrypoint.ingress.stats["processed"] == 3
+
+    def test_queued_message_handlers_reply(self, run_service, make_message_event):
+        class Service:
+
+            name = "sample"
+
+            @rtm.handle_message("^spam", queue_size=10, overload="fair")
+            def handle_message(self, event, message):
+                return "ham"
+
+        container, client = run_service(Service)
+        client_manager = get_extension(container, rtm.SlackRTMClientManager)
+        client_manager.handle("default", make_message_event(text="spam"))
+        client_manager.handle("default", make_message_event(text="egg"))
+        sleep(0.01)
+
+        assert client.rtm_send_message.call_args_list == [call("D11", "ham")]
+
+    def test_unknown_overload_policy(self, container_factory, config):
+        class Service:
+
+            name = "sample"
+
+            @rtm.handle_event(queue_size=10, overload="spam")
+            def handle_event(self, event):
+                pass
+
+        container = container_factory(Service, config)
+
+        with pytest.raises(ConfigurationError) as exc:
+            container.start()
+
+        assert str(exc.value) == (
+            "Unknown `overload` policy `spam` of `handle_event` entrypoint"
+        )
+
+
+class TestOrderedLanes:
+    @pytest.fixture
+    def dispatch(self):
+        return Mock()
+
+    @pytest.fixture
+    def make_lanes(self, dispatch):
+        def make(ordered_by, size=1000):
+            spawn_thread = Mock(side_effect=lambda fn: fn())
+            return rtm.OrderedLanes(ordered_by, dispatch, spawn_thread, size)
+
+        return make
+
+    def dispatched(self, dispatch):
+        return [event["ts"] for ((event, _), _) in dispatch.call_args_list]
+
+    def finish(self, dispatch, index):
+        (_, (_, _, handle_result)), _ = dispatch.call_args_list[index]
+        return handle_result(Mock(), None, None)
+
+    def test_one_event_per_key_at_a_time(self, make_lanes, dispatch):
+        lanes = make_lanes("channel")
+        lanes.put({"channel": "C1", "ts": "1"}, ((), {}, None))
+        lanes.put({"channel": "C1", "ts": "2"}, ((), {}, None))
+        lanes.put({"channel": "C2", "ts": "3"}, ((), {}, None))
+        lanes.put({"ts": "4"}, ((), {}, None))
+
+        assert self.dispatched(dispatch) == ["1", "3", "4"]
+
+        assert self.finish(dispatch, 0) == (None, None)
+        assert self.dispatched(dispatch) == ["1", "3", "4", "2"]
+
+        self.finish(dispatch, 1)
+        self.finish(dispatch, 3)
+        assert lanes.waiting == {}
+
+    def test_threads_are_keyed_by_parent_message(self, make_lanes, dispatch):
+        lanes = make_lanes("thread_ts")
+        lanes.put({"ts": "1"}, ((), {}, None))
+        lanes.put({"ts": "2", "thread_ts": "1"}, ((), {}, None))
+
+        assert self.dispatched(dispatch) == ["1"]
+
+    def test_result_handler_of_entrypoint(self, make_lanes, dispatch):
+        lanes = make_lanes("user")
+        handle_result = Mock(return_value=("result", None))
+        lanes.put({"user": "U1", "ts": "1"}, ((), {}, handle_result))
+
+        assert self.finish(dispatch, 0) == ("result", None)
+        assert lanes.waiting == {}
+
+    def test_sheds_oldest_event_of_the_busiest_key(self, make_lanes, dispatch):
+        lanes = make_lanes("channel", size=2)
+        for channel, ts in (("C1", "1"), ("C2", "2"), ("C1", "3"), ("C1", "4")):
+            lanes.put({"channel": channel, "ts": ts}, ((), {}, None))
+        lanes.put({"channel": "C2", "ts": "5"}, ((), {}, None))
+
+        assert [
+            [event["ts"] for event, _ in waiting]
+            for waiting in lanes.waiting.values()
+        ] == [["4"], ["5"]]
+        assert (lanes.depth, lanes.dropped) == (2, 1)
+
+    def test_event_shed_by_ingress_releases_its_key(self, make_lanes):
+        ingress = rtm.Ingress(size=1)
+        lanes = make_lanes("channel")
+        lanes.dispatch = ingress.put
+        ingress.on_shed = lanes.shed
+
+        lanes.put({"channel": "C1", "ts": "1"}, ((), {}, None))
+        lanes.put({"channel": "C1", "ts": "2"}, ((), {}, None))
+        lanes.put({"ts": "3"}, ((), {}, None))
+
+        # the first event of C1 is shed by the ingress queue, the keyless
+        # one after it shed in turn by the second event of C1
+        assert [event["ts"] for event, _ in ingress.lanes[None]] == ["2"]
+        assert ingress.stats["dropped"] == 2
+        assert list(lanes.waiting) == ["C1"]
+        assert lanes.depth == 0
+
+        ingress.take()[2](Mock(), None, None)
+        assert lanes.waiting == {}
+
+
+class TestOrderedEntrypoints:
+    @pytest.fixture
+    def run_service(self, container_factory, config):
+        def run(service_class):
+            with patch("nameko_slack.rtm.SlackClient") as SlackClient:
+                SlackClient.return_value.rtm_read.return_value = []
+                config["max_workers"] = 2
+                container = container_factory(service_class, config)
+                container.start()
+            return get_extension(container, rtm.SlackRTMClientManager)
+
+        return run
+
+    def test_handles_messages_of_a_channel_in_order(
+        self, run_service, make_message_event, tracker
+    ):
+        class Service:
+
+            name = "sample"
+
+            @rtm.handle_message(ordered_by="channel")
+            def handle_message(self, event, message):
+                # earlier messages take longer
+                sleep(0.03 - 0.01 * int(message))
+                tracker.handle_message(event["channel"], message)
+
+        client_manager = run_service(Service)
+        for channel, message in (("C1", "0"), ("C1", "1"), ("C2", "2"), ("C1", "2")):
+            event = make_message_event(channel=channel, text=message)
+            client_manager.handle("default", event)
+        sleep(0.1)
+
+        assert tracker.handle_message.call_args_list == [
+            call("C2", "2"),
+            call("C1", "0"),
+            call("C1", "1"),
+            call("C1", "2"),
+        ]
+
+    def test_messages_shed_by_queue_do_not_hold_up_their_channel(
+        self, run_service, make_message_event, tracker
+    ):
+        class Service:
+
+            name = "sample"
+
+            @rtm.handle_message(ordered_by="channel", queue_size=1, concurrency=1)
+            def handle_message(self, event, message):
+                sleep(0.02)
+                tracker.handle_message(event["channel"], message)
+
+        client_manager = run_service(Service)
+        for channel, message in (("C1", "0"), ("C2", "1"), ("C2", "2"), ("C3", "3")):
+            event = make_message_event(channel=channel, text=message)
+            client_manager.handle("default", event)
+            sleep(0.005)
+        sleep(0.06)
+
+        # C2 "1" is shed for C3 "3", which is shed for C2 "2" let go in turn
+        assert tracker.handle_message.call_args_list == [
+            call("C1", "0"),
+            call("C2", "2"),
+        ]
+        client_manager.handle("default", make_message_event(channel="C2", text="4"))
+        sleep(0.04)
+        assert tracker.handle_message.call_args_list[-1] == call("C2", "4")
+
+    def test_unknown_ordered_by(self, container_factory, config):
+        class Service:
+
+            name = "sample"
+
+            @rtm.handle_message(ordered_by="spam")
+            def handle_message(self, event, message):
+                pass
+
+        container = container_factory(Service, config)
+
+        with pytest.raises(ConfigurationError) as exc:
+            container.start()
+
+        assert str(exc.value) == (
+            "Unknown `ordered_by` key `spam` of `handle_message` entrypoint"
+        )
+
+
+class TestBotScheduler:
+    def buffered(self, scheduler):
+        return {
+            bot_name: [event["ts"] for event in buffer]
+            for bot_name, buffer in scheduler.buffers.items()
+        }
+
+    def run(self, scheduler, handle):
+        thread = spawn(scheduler.run, handle)
+        sleep(0.01)
+        thread.kill()
+
+    def test_drops_oldest_event_of_full_buffer(self):
+        scheduler = rtm.BotScheduler(size=2)
+        for ts in ("1", "2", "3"):
+            scheduler.put("Alice", {"ts": ts})
+        scheduler.put("Bob", {"ts": "4"})
+
+        assert self.buffered(scheduler) == {"Alice": ["2", "3"], "Bob": ["4"]}
+        assert scheduler.stats == {
+            "Alice": {
+                "buffered": 3,
+                "dropped": 1,
+                "dispatched": 0,
+                "depth": 2,
+                "running": 0,
+            },
+            "Bob": {
+                "buffered": 1,
+                "dropped": 0,
+                "dispatched": 0,
+                "depth": 1,
+                "running": 0,
+            },
+        }
+
+    def test_takes_weighted_turns(self):
+        scheduler = rtm.BotScheduler(weights={"Alice": 2})
+        for ts in ("1", "2", "3", "4", "5"):
+            scheduler.put("Alice", {"ts": ts})
+        for ts in ("6", "7"):
+            scheduler.put("Bob", {"ts": ts})
+        handled = []
+
+        self.run(scheduler, lambda bot_name, event: handled.append(event["ts"]))
+
+        assert handled == ["1", "2", "6", "3", "4", "7", "5"]
+        assert scheduler.buffers == {}
+        assert scheduler.stats["Alice"]["dispatched"] == 5
+
+    def test_skips_bots_out_of_budget(self):
+        scheduler = rtm.BotScheduler(budget=2, budgets={"Bob": 1})
+        results = {}
+
+        def handle(bot_name, event):
+            results[event["ts"]] = scheduler.track(bot_name, None)
+
+        for ts in ("1", "2", "3"):
+            scheduler.put("Alice", {"ts": ts})
+        for ts in ("4", "5"):
+            scheduler.put("Bob", {"ts": ts})
+        thread = spawn(scheduler.run, handle)
+        sleep(0.01)
+
+        assert sorted(results) == ["1", "2", "4"]
+        assert self.buffered(scheduler) == {"Alice": ["3"], "Bob": ["5"]}
+        assert scheduler.stats["Alice"]["running"] == 2
+
+        # a worker done makes room for another event of its bot
+        assert results["4"](Mock(), "result", None) == ("result", None)
+        sleep(0.01)
+        assert sorted(results) == ["1", "2", "4", "5"]
+        assert self.buffered(scheduler) == {"Alice": ["3"]}
+
+        results["1"](Mock(), "result", None)
+        sleep(0.01)
+        assert sorted(results) == ["1", "2", "3", "4", "5"]
+        thread.kill()
+
+    def test_counts_every_worker_of_an_event(self):
+        scheduler = rtm.BotScheduler(
+            budget=2, workers=lambda bot_name, event: event["workers"]
+        )
+        results = []
+
+        def handle(bot_name, event):
+            for _ in range(event["workers"]):
+                results.append(scheduler.track(bot_name, None))
+
+        scheduler.put("Alice", {"ts": "1", "workers": 2})
+        scheduler.put("Alice", {"ts": "2", "workers": 1})
+        scheduler.put("Alice", {"ts": "3", "workers": 3})
+        thread = spawn(scheduler.run, handle)
+        sleep(0.01)
+
+        assert self.buffered(scheduler) == {"Alice": ["2", "3"]}
+        assert scheduler.running["Alice"] == 2
+
+        results.pop()(Mock(), None, None)
+        sleep(0.01)
+        assert self.buffered(scheduler) == {"Alice": ["3"]}
+
+        # an event needing more workers than the budget waits for all of them
+        results.pop()(Mock(), None, None)
+        sleep(0.01)
+        assert self.buffered(scheduler) == {"Alice": ["3"]}
+        results.pop()(Mock(), None, None)
+        sleep(0.01)
+        assert scheduler.buffers == {}
+        assert scheduler.running["Alice"] == 3
+        thread.kill()
+
+    def test_waits_for_free_slots_of_the_pool(self):
+        pool = GreenPool(2)
+        scheduler = rtm.BotScheduler(
+            pool=pool, workers=lambda bot_name, event: 5, poll_interval=0.005
+        )
+        handled = []
+        finish = Event()
+        pool.spawn(finish.wait)
+
+        scheduler.put("Alice", {"ts": "1"})
+        thread = spawn(scheduler.run, lambda bot_name, event: handled.append(event))
+        sleep(0.01)
+        assert handled == []
+
+        # slots freed by workers the scheduler knows nothing of
+        finish.send()
+        sleep(0.02)
+        assert handled == [{"ts": "1"}]
+        thread.kill()
+
+    def test_result_handler_of_entrypoint(self):
+        scheduler = rtm.BotScheduler()
+        handle_result = Mock(return_value=("result", None))
+        worker_ctx = Mock()
+
+        done = scheduler.track("Alice", handle_result)
+        assert scheduler.running["Alice"] == 1
+
+        assert done(worker_ctx, "spam", None) == ("result", None)
+        assert handle_result.call_args == call(worker_ctx, "spam", None)
+        assert scheduler.running["Alice"] == 0
+
+
+class TestScheduledDispatch:
+    @pytest.fixture
+    def config(self):
+        return {
+            "max_workers": 4,
+            constants.CONFIG_KEY: {
+                "BOTS": {"Alice": "aaa-111", "Bob": "bbb-222"},
+                "SCHEDULER": {"BUFFER_SIZE": 10},
+            },
+        }
+
+    @pytest.fixture
+    def run_service(self, container_factory, config):
+        def run(service_class):
+            with patch("nameko_slack.rtm.SlackClient") as SlackClient:
+                SlackClient.return_value.rtm_read.return_value = []
+                container = container_factory(service_class, config)
+                container.start()
+            return get_extension(container, rtm.SlackRTMClientManager)
+
+        return run
+
+    def test_busy_bot_does_not_hold_up_others(self, run_service, tracker):
+        finish = Event()
+
+        class Service:
+
+            name = "sample"
+
+            @rtm.handle_event("spam", bot_name="Alice")
+            def handle_alice(self, event):
+                tracker.handle_alice(event["ts"])
+                finish.wait()
+
+            @rtm.handle_event("spam", bot_name="Bob")
+            def handle_bob(self, event):
+                tracker.handle_bob(event["ts"])
+
+        client_manager = run_service(Service)
+        for ts in ("1", "2", "3"):
+            client_manager.receive("Alice", {"type": "spam", "ts": ts})
+        client_manager.receive("Bob", {"type": "spam", "ts": "4"})
+        sleep(0.01)
+
+        # Alice's budget is half of the container's workers
+        assert tracker.handle_alice.call_args_list == [call("1"), call("2")]
+        assert tracker.handle_bob.call_args_list == [call("4")]
+        assert client_manager.scheduler.stats["Alice"]["depth"] == 1
+
+        finish.send()
+        sleep(0.01)
+        assert tracker.handle_alice.call_args_list == [call("1"), call("2"), call("3")]
+        assert client_manager.scheduler.running == {"Alice": 0, "Bob": 0}
+
+    def test_does_not_wait_for_workers_of_the_container(
+        self, run_service, config, tracker
+    ):
+        config["max_workers"] = 1
+        finish = Event()
+
+        class Service:
+
+            name = "sample"
+
+            @rtm.handle_event("spam", bot_name="Alice")
+            def handle_alice(self, event):
+                finish.wait()
+
+            @rtm.handle_event("spam", bot_name="Bob")
+            def handle_bob(self, event):
+                tracker.handle_bob(event["ts"])
+
+        client_manager = run_service(Service)
+        client_manager.receive("Alice", {"type": "spam", "ts": "1"})
+        client_manager.receive("Bob", {"type": "spam", "ts": "2"})
+        sleep(0.01)
+
+        # both bots have a budget of one worker, but there is a single one
+        assert tracker.handle_bob.call_args_list == []
+        assert client_manager.scheduler.stats["Bob"]["depth"] == 1
+
+        finish.send()
+        sleep(0.03)
+        assert tracker.handle_bob.call_args_list == [call("2")]
+
+    def test_workers_of_an_event(self, run_service):
+        class Service:
+
+            name = "sample"
+
+            @rtm.handle_event("spam", bot_name="Alice")
+            def handle_spam(self, event):
+                pass
+
+            @rtm.handle_event("spam", bot_name="Alice", queue_size=10)
+            def queue_spam(self, event):
+                pass
+
+            @rtm.handle_event(bot_name="Alice")
+            def handle_any(self, event):
+                pass
+
+            @rtm.handle_message("^ham", bot_name="Alice")
+            def handle_ham(self, event, message):
+                pass
+
+        client_manager = run_service(Service)
+
+        assert client_manager.workers("Alice", {"type": "spam"}) == 2
+        assert client_manager.workers("Alice", {"type": "message"}) == 2
+        assert client_manager.workers("Alice", {"type": "egg"}) == 1
+        assert client_manager.workers("Bob", {"type": "spam"}) == 0
+
+    def test_budgets(self, container_factory, config):
+        config[constants.CONFIG_KEY]["SCHEDULER"] = {
+            "BUDGET": 3,
+            "BUDGETS": {"Bob": 1},
+            "WEIGHTS": {"Alice": 2},
+        }
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.container = Mock(config=config, max_workers=10)
+
+        with patch("nameko_slack.rtm.SlackClient"):
+            client_manager.setup()
+
+        scheduler = client_manager.scheduler
+        assert (scheduler.size, scheduler.budget) == (1000, 3)
+        assert scheduler.budgets == {"Bob": 1}
+        assert scheduler.weights == {"Alice": 2}
+
+    @pytest.mark.parametrize("key", ("WEIGHTS", "BUDGETS"))
+    def test_unknown_bot(self, container_factory, config, key):
+        config[constants.CONFIG_KEY]["SCHEDULER"] = {key: {"Carol": 1}}
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.container = Mock(config=config, max_workers=10)
+
+        with patch("nameko_slack.rtm.SlackClient"):
+            with pytest.raises(ConfigurationError) as exc:
+                client_manager.setup()
+
+        assert str(exc.value) == (
+            "Unknown `Carol` bot in `SCHEDULER.{}` of `SLACK` config".format(key)
+        )
+
+    def test_failing_spawn_releases_budget(self, run_service):
+        class Service:
+
+            name = "sample"
+
+            @rtm.handle_event("spam", bot_name="Alice")
+            def handle_alice(self, event):
+                pass
+
+        client_manager = run_service(Service)
+        entrypoint = get_extension(
+            client_manager.container, rtm.RTMEventHandlerEntrypoint
+        )
+        entrypoint.container = Mock()
+        entrypoint.container.spawn_worker.side_effect = RuntimeError("Killed")
+
+        with pytest.raises(RuntimeError):
+            entrypoint.handle_event({"type": "spam"})
+
+        assert client_manager.scheduler.running["Alice"] == 0
+
+        client_manager.scheduler = None
+        with pytest.raises(RuntimeError):
+            entrypoint.handle_event({"type": "spam"})
+
+    def test_metrics(self, run_service, config):
+        config[constants.CONFIG_KEY]["METRICS"] = {"PROMETHEUS": True}
+
+        class Service:
+
+            name = "sample"
+
+            @rtm.handle_event("spam", bot_name="Alice")
+            def handle_alice(self, event):
+                sleep(1)
+
+        client_manager = run_service(Service)
+        client_manager.receive("Alice", {"type": "spam"})
+        sleep(0.01)
+
+        text = client_manager.metrics.render()
+        assert 'nameko_slack_rtm_bot_workers{bot="Alice"} 1' in text
+        assert 'nameko_slack_rtm_bot_workers{bot="Bob"} 0' in text
+        assert 'nameko_slack_rtm_buffer_depth{bot="Alice"} 0' in text
+
+
+class TestHandleEventsBatch:
+    @pytest.fixture
+    def make_container(self, container_factory, config):
+        def make(service_class):
+            with patch("nameko_slack.rtm.SlackClient") as SlackClient:
+                SlackClient.return_value.rtm_read.return_value = []
+                container = container_factory(service_class, config)
+                container.start()
+            return container
+
+        return make
+
+    @pytest.fixture
+    def service_class(self, tracker):
+        class Service:
+
+            name = "sample"
+
+            @rtm.handle_events_batch("message", max_batch=3, max_wait_ms=20)
+            def handle_messages(self, events):
+                tracker.handle_messages([event["ts"] for event in events])
+
+        return Service
+
+    @pytest.mark.parametrize(
+        "option",
+        ("queue_size", "concurrency", "overload", "shed_event_types", "ordered_by"),
+    )
+    def test_refuses_queue_and_ordering_options(self, option):
+        with pytest.raises(TypeError) as exc:
+            rtm.RTMEventBatchHandlerEntrypoint("message", **{option: 10})
+
+        assert str(exc.value) == (
+            "`handle_events_batch` takes no `{}` option".format(option)
+        )
+
+    def publish(self, container, *timestamps):
+        client_manager = get_extension(container, rtm.SlackRTMClientManager)
+        for ts in timestamps:
+            client_manager.handle("default", {"type": "message", "ts": ts})
+
+    def test_flushes_full_batches(self, make_container, service_class, tracker):
+        container = make_container(service_class)
+        self.publish(container, "1", "2", "3", "4")
+        sleep(0.01)
+
+        assert tracker.handle_messages.call_args_list == [call(["1", "2", "3"])]
+
+        sleep(0.02)
+        assert tracker.handle_messages.call_args_list == [
+            call(["1", "2", "3"]),
+            call(["4"]),
+        ]
+
+    def test_flushes_after_max_wait(self, make_container, service_class, tracker):
+        container = make_container(service_class)
+        self.publish(container, "1")
+        sleep(0.01)
+        self.publish(container, "2")
+        sleep(0.005)
+
+        assert not tracker.handle_messages.called
+        sleep(0.01)
+        assert tracker.handle_messages.call_args_list == [call(["1", "2"])]
+
+    def test_flushes_on_stop(self, make_container, service_class, tracker):
+        container = make_container(service_class)
+        self.publish(container, "1")
+        container.stop()
+
+        assert tracker.handle_messages.call_args_list == [call(["1"])]
+
+    def test_stop_without_events(self, make_container, service_class, tracker):
+        container = make_container(service_class)
+        container.stop()
+
+        assert not tracker.handle_messages.called
+
+    def test_drops_batch_on_kill(self, make_container, service_class, tracker):
+        container = make_container(service_class)
+        self.publish(container, "1")
+        container.kill()
+        sleep(0.03)
+
+        assert not tracker.handle_messages.called
+
+
+class TestDecoding:
+    @pytest.fixture
+    def client(self):
+        frames = []
+
+        client = Mock()
+        client.server.websocket_safe_read.side_effect = (
+            lambda: frames.pop(0) if frames else ""
+        )
+        client.frames = frames
+        return client
+
+    @pytest.fixture
+    def client_manager(self):
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.decode = json.loads
+        return client_manager
+
+    @pytest.fixture
+    def make_provider(self):
+        def make(event_type=None, bot_name="default", message_pattern=None):
+            if message_pattern:
+                provider = rtm.RTMMessageHandlerEntrypoint(
+                    message_pattern, bot_name=bot_name
+                )
+            else:
+                provider = rtm.RTMEventHandlerEntrypoint(event_type, bot_name=bot_name)
+            provider.method_name = "spam"
+            return provider
+
+        return make
+
+    @pytest.mark.parametrize(
+        ("config", "decoder", "skip_unsubscribed"),
+        (
+            ({}, None, False),
+            ({"DECODER": "json"}, json.loads, False),
+            ({"SKIP_UNSUBSCRIBED": True}, json.loads, True),
+        ),
+    )
+    @patch("nameko_slack.rtm.SlackClient")
+    def test_setup(self, SlackClient, config, decoder, skip_unsubscribed):
+        config = {"SLACK": dict(config, TOKEN="abc-123")}
+
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.container = Mock(config=config)
+        client_manager.setup()
+
+        assert client_manager.decode is decoder
+        assert client_manager.skip_unsubscribed is skip_unsubscribed
+
+    @patch("nameko_slack.rtm.SlackClient")
+    def test_setup_custom_decoder(self, SlackClient):
+        decode = Mock()
+        config = {"SLACK": {"TOKEN": "abc-123", "DECODER": decode}}
+
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.container = Mock(config=config)
+        client_manager.setup()
+
+        assert client_manager.decode is decode
+
+    @pytest.mark.parametrize(
+        ("decoder", "error"),
+        (
+            ("spam", "Unknown `DECODER` `spam` in `SLACK` config"),
+            ("ujson", "`ujson` decoder requires the `ujson` package"),
+        ),
+    )
+    @patch("nameko_slack.rtm.SlackClient")
+    @patch("nameko_slack.decoding.import_module", side_effect=ImportError)
+    def test_setup_unknown_decoder(self, import_module, SlackClient, decoder, error):
+        config = {"SLACK": {"TOKEN": "abc-123", "DECODER": decoder}}
+
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.container = Mock(config=config)
+
+        with pytest.raises(ConfigurationError) as exc:
+            client_manager.setup()
+
+        assert str(exc.value) == error
+
+    def test_reads_with_client_without_decoder(self):
+        client_manager = rtm.SlackRTMClientManager()
+
+        assert client_manager.frame_reader("default") is None
+
+    def test_decodes_frames(self, client_manager, client):
+        client.frames.append('{"type": "hello"}\n{"type": "spam"}')
+
+        events = rtm.read(client, client_manager.frame_reader("default"))
+
+        assert events == [{"type": "hello"}, {"type": "spam"}]
+        assert client.process_changes.call_args_list == [
+            call({"type": "hello"}),
+            call({"type": "spam"}),
+        ]
+
+    def test_skips_unsubscribed_frames(
+        self, client_manager, client, make_provider
+    ):
+        client_manager.skip_unsubscribed = True
+        client_manager.register_provider(make_provider("reaction_added"))
+        client_manager.register_provider(make_provider(message_pattern="^spam"))
+        client.frames.extend(
+            [
+                '{"type": "user_typing", "channel": "C1"}',
+                '{"type": "presence_change"}\n{"type": "message", "text": "ham"}',
+                '{"type": "reaction_added"}\n{"type": "user_typing"}',
+            ]
+        )
+
+        events = list(
+            rtm.read_available(client, client_manager.frame_reader("default"))
+        )
+
+        assert events == [
+            {"type": "message", "text": "ham"},
+            {"type": "reaction_added"},
+        ]
+        assert client_manager.skipped == {"default": 3}
+
+    def test_keeps_frames_the_manager_needs(self, client_manager, client):
+        client_manager.skip_unsubscribed = True
+        client.frames.append(
+            '{"type": "goodbye"}\n{"type": "user_change", "user": {"id": "U1"}}'
+            '\n{"type": "spam"}'
+        )
+
+        events = rtm.read(client, client_manager.frame_reader("default"))
+
+        assert [event["type"] for event in events] == ["goodbye", "user_change"]
+
+    def test_catch_all_providers_subscribe_to_everything(
+        self, client_manager, client, make_provider
+    ):
+        client_manager.skip_unsubscribed = True
+        client_manager.register_provider(make_provider("reaction_added"))
+        client_manager.register_provider(make_provider())
+        client_manager.register_provider(make_provider("spam", bot_name="Bob"))
+        client.frames.append('{"type": "user_typing"}')
+
+        events = rtm.read(client, client_manager.frame_reader("default"))
+
+        assert events == [{"type": "user_typing"}]
+        assert client_manager.subscribed["default"] is None
+        assert "spam" in client_manager.subscribed["Bob"]
+
+    def test_poll_mode_reads_frames(self, client_manager, client):
+        client_manager.read_interval = 0.001
+        client_manager.handle = Mock()
+        client.frames.append('{"type": "hello"}')
+
+        thread = spawn(client_manager.run_poll, "default", client)
+        sleep(0.01)
+        thread.kill()
+
+        assert client_manager.handle.call_args == call("default", {"type": "hello"})
+
+    def test_answers_to_pings_are_not_routed(self, client_manager, client):
+        client_manager.read_interval = 0.001
+        client_manager.handle = Mock()
+        client.frames.extend(['{"type": "pong", "reply_to": 1}', '{"type": "spam"}'])
+
+        thread = spawn(client_manager.run_poll, "default", client)
+        sleep(0.01)
+        thread.kill()
+
+        assert client_manager.handle.call_args_list == [
+            call("default", {"type": "spam"})
+        ]
+
+
+class TestWorkspaceProvider:
+    @pytest.fixture
+    def make_provider(self, container_factory, config):
+        def make(bot_name=None):
+            class Service:
+
+                name = "sample"
+
+                workspace = rtm.Workspace(bot_name)
+
+            container = container_factory(Service, config)
+            return get_extension(container, rtm.Workspace)
+
+        return make
+
+    @patch("nameko_slack.rtm.SlackClient")
+    def test_get_dependency(self, SlackClient, make_provider, login_data):
+        SlackClient.return_value.server.login_data = login_data
+
+        provider = make_provider()
+        client_manager = provider.clients
+        client_manager.setup()
+        client_manager.connect(
+            constants.DEFAULT_BOT_NAME,
+            client_manager.clients[constants.DEFAULT_BOT_NAME],
+        )
+        client_manager.owned = {constants.DEFAULT_BOT_NAME}
+        provider.start()
+
+        workspace = provider.get_dependency(Mock())
+        assert workspace is client_manager.workspaces[constants.DEFAULT_BOT_NAME]
+        assert workspace.user("U1") == {"id": "U1", "name": "alice"}
+
+    @patch("nameko_slack.rtm.SlackClient")
+    def test_bot_of_another_instance(self, SlackClient, make_provider):
+        provider = make_provider()
+        provider.clients.setup()
+
+        with pytest.raises(rtm.BotUnavailable) as exc:
+            provider.get_dependency(Mock())
+
+        assert str(exc.value) == "`default` bot is connected by another instance"
+
+    @patch("nameko_slack.rtm.SlackClient")
+    def test_bot_not_connected_in_time(self, SlackClient, make_provider):
+        provider = make_provider()
+        provider.timeout = 0.01
+        provider.clients.setup()
+        provider.clients.owned = {constants.DEFAULT_BOT_NAME}
+
+        with pytest.raises(rtm.BotUnavailable) as exc:
+            provider.get_dependency(Mock())
+
+        assert str(exc.value) == "`default` bot did not connect in 0.01 seconds"
+
+    @patch("nameko_slack.rtm.SlackClient")
+    def test_stopped_bot_is_no_longer_ready(
+        self, SlackClient, make_provider, login_data
+    ):
+        SlackClient.return_value.server.login_data = login_data
+        provider = make_provider()
+        client_manager = provider.clients
+        client_manager.setup()
+        client_manager.connect("default", client_manager.clients["default"])
+
+        client_manager.stop_bot("default")
+
+        assert "default" not in client_manager.workspaces
+        assert client_manager.wait_until_ready("default", 0) is False
+
+    @patch("nameko_slack.rtm.SlackClient")
+    def test_unknown_bot(self, SlackClient, make_provider):
+        provider = make_provider("Bob")
+        provider.clients.setup()
+
+        with pytest.raises(ConfigurationError) as exc:
+            provider.start()
+
+        assert str(exc.value) == "No token for `Bob` bot in `SLACK` config"
+
+
+class TestReplyMetrics:
+    @pytest.fixture
+    def client_manager(self):
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.clients = {"Alice": Mock()}
+        client_manager.recorder = Mock()
+        return client_manager
+
+    def test_times_replies(self, client_manager):
+        client_manager.reply("Alice", {"channel": "C1"}, "spam")
+
+        client = client_manager.clients["Alice"]
+        assert client.rtm_send_message.call_args == call("C1", "spam")
+        ((name, _), labels) = client_manager.recorder.timing.call_args
+        assert (name, labels) == ("rtm_reply_seconds", {"bot": "Alice"})
+
+    def test_counts_failed_replies(self, client_manager):
+        client = client_manager.clients["Alice"]
+        client.rtm_send_message.side_effect = socket.error("Closed")
+
+        with pytest.raises(socket.error):
+            client_manager.reply("Alice", {"channel": "C1"}, "spam")
+
+        assert client_manager.recorder.incr.call_args == call(
+            "rtm_reply_errors", bot="Alice"
+        )
+        assert client_manager.recorder.timing.called
+
+
+class TestOutbox:
+    @pytest.fixture
+    def client(self):
+        return Mock()
+
+    @pytest.fixture
+    def make_outbox(self, client):
+        threads = []
+
+        def make(**options):
+            options.setdefault("connection_rate", 1000)
+            outbox = rtm.Outbox(client, **options)
+            threads.append(spawn(outbox.run))
+            return outbox
+
+        yield make
+
+        for thread in threads:
+            thread.kill()
+
+    def test_sends_messages(self, client, make_outbox):
+        outbox = make_outbox()
+        outbox.put("C1", "spam")
+        outbox.put("C2", "ham")
+        sleep(0.01)
+
+        assert client.rtm_send_message.call_args_list == [
+            call("C1", "spam"),
+            call("C2", "ham"),
+        ]
+        assert outbox.stats == {
+            "depth": 0,
+            "sent": 2,
+            "dropped": 0,
+            "coalesced": 0,
+            "failed": 0,
+        }
+
+    def test_keeps_sending_after_a_failed_send(self, client, make_outbox):
+        client.rtm_send_message.side_effect = [IOError("Broken pipe"), None]
+        outbox = make_outbox()
+        outbox.put("C1", "spam")
+        outbox.put("C2", "ham")
+        sleep(0.01)
+
+        assert client.rtm_send_message.call_args_list == [
+            call("C1", "spam"),
+            call("C2", "ham"),
+        ]
+        assert outbox.stats == {
+            "depth": 0,
+            "sent": 1,
+            "dropped": 0,
+            "coalesced": 0,
+            "failed": 1,
+        }
+
+    def test_coalesces_messages_waiting_for_the_same_channel(self, client, make_outbox):
+        outbox = make_outbox(channel_rate=10)
+        for message in ("spam", "ham", "egg"):
+            outbox.put("C1", message)
+        outbox.put("C1", "x" * outbox.max_message_length)
+        outbox.put("C2", "spam")
+        sleep(0.01)
+
+        assert client.rtm_send_message.call_args_list == [
+            call("C1", "spam\nham\negg"),
+            call("C2", "spam"),
+        ]
+        sleep(0.1)
+        assert client.rtm_send_message.call_args_list[-1] == call(
+            "C1", "x" * outbox.max_message_length
+        )
+        assert outbox.stats["coalesced"] == 2
+
+    def test_paces_messages_per_channel(self, client, make_outbox):
+        outbox = make_outbox(channel_rate=20, coalesce=False)
+        for message in ("spam", "ham", "egg"):
+            outbox.put("C1", message)
+        outbox.put("C2", "spam")
+        sleep(0.01)
+
+        # throttled channel does not hold up others
+        assert client.rtm_send_message.call_args_list == [
+            call("C1", "spam"),
+            call("C2", "spam"),
+        ]
+        sleep(0.11)
+        assert client.rtm_send_message.call_args_list[2:] == [
+            call("C1", "ham"),
+            call("C1", "egg"),
+        ]
+
+    def test_paces_messages_per_connection(self, client, make_outbox):
+        outbox = make_outbox(connection_rate=20)
+        for channel in ("C1", "C2", "C3"):
+            outbox.put(channel, "spam")
+        sleep(0.01)
+
+        assert client.rtm_send_message.call_count == 1
+        sleep(0.11)
+        assert client.rtm_send_message.call_count == 3
+
+    def test_drop_oldest_when_full(self, client):
+        outbox = rtm.Outbox(client, size=2, when_full="drop_oldest")
+        for message in ("spam", "ham", "egg"):
+            outbox.put("C1", message)
+
+        assert list(outbox.pending) == [("C1", "ham"), ("C1", "egg")]
+        assert outbox.stats["dropped"] == 1
+
+    def test_error_when_full(self, client):
+        outbox = rtm.Outbox(client, size=2, when_full="error")
+        outbox.put("C1", "spam")
+        outbox.put("C1", "ham")
+
+        with pytest.raises(rtm.OutboxFull) as exc:
+            outbox.put("C1", "egg")
+
+        assert str(exc.value) == "Outbox is full (2 messages)"
+        assert list(outbox.pending) == [("C1", "spam"), ("C1", "ham")]
+        assert outbox.stats["dropped"] == 1
+
+    def test_block_when_full(self, client, make_outbox):
+        outbox = make_outbox(size=1, channel_rate=20, coalesce=False)
+        outbox.put("C1", "spam")
+        outbox.put("C1", "ham")
+        blocked = spawn(outbox.put, "C1", "egg")
+        sleep(0.01)
+
+        assert not blocked.dead
+        assert list(outbox.pending) == [("C1", "ham")]
+
+        sleep(0.05)
+        assert blocked.dead
+        assert list(outbox.pending) == [("C1", "egg")]
+
+    def test_join(self, client, make_outbox):
+        outbox = make_outbox(channel_rate=50, coalesce=False)
+        for message in ("spam", "ham", "egg"):
+            outbox.put("C1", message)
+
+        outbox.join()
+
+        assert client.rtm_send_message.call_count == 3
+        assert set(outbox.channel_buckets) == {"C1"}
+
+        # idle buckets are forgotten
+        sleep(0.05)
+        outbox.put("C2", "spam")
+        outbox.join()
+
+        assert set(outbox.channel_buckets) == {"C2"}
+
+
+class TestOutboxConfig:
+    @pytest.fixture
+    def make_config(self):
+        def make(**outbox):
+            return {
+                constants.CONFIG_KEY: {
+                    "BOTS": {"Alice": "aaa-111", "Bob": "bbb-222"},
+                    "OUTBOX": outbox,
+                }
+            }
+
+        return make
+
+    @patch("nameko_slack.rtm.SlackClient")
+    def test_setup(self, SlackClient, make_config):
+        config = make_config(SIZE=10, WHEN_FULL="error", CHANNEL_RATE=2)
+
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.container = Mock(config=config)
+        client_manager.setup()
+
+        assert set(client_manager.outboxes) == {"Alice", "Bob"}
+        outbox = client_manager.outboxes["Alice"]
+        assert outbox.size == 10
+        assert outbox.when_full == "error"
+        assert outbox.channel_rate == 2
+        assert outbox.connection_bucket.rate == 10
+        assert outbox.coalesce is True
+
+        empty = {"depth": 0, "sent": 0, "dropped": 0, "coalesced": 0, "failed": 0}
+        assert client_manager.stats() == {"Alice": empty, "Bob": empty}
+
+    @patch("nameko_slack.rtm.SlackClient")
+    def test_setup_unknown_policy(self, SlackClient, make_config):
+        config = make_config(WHEN_FULL="spam")
+
+        client_manager = rtm.SlackRTMClientManager()
+        client_manager.container = Mock(config=config)
+
+        with pytest.raises(ConfigurationError) as exc:
+            client_manager.setup()
+
+        assert str(exc.value) == (
+            "Unknown `OUTBOX.WHEN_FULL` policy `spam` in `SLACK` config"
+        )
+
+    @patch("nameko_slack.rtm.SlackClient")
+    def test_replies_through_outbox(
+        self, SlackClient, container_factory, events, make_config
+    ):
+        class Service:
+
+            name = "sample"
+
+            @rtm.handle_message
+            def handle_message(self, event, message):
+                return "sure, {}".format(message)
+
+        config = make_config()
+        config[constants.CONFIG_KEY]["TOKEN"] = "abc-123"
+        SlackClient.return_value.rtm_read.return_value = events
+        container = container_factory(Service, config)
+        container.start()
+        sleep(0.1)
+
+        assert SlackClient.return_value.rtm_send_message.call_args_list == [
+            call("D11", "sure, spam ham\nsure, ham spam\nsure, spam egg")
+        ]
+
+        container.stop()
+
+    @patch("nameko_slack.rtm.SlackClient")
+    def test_full_outbox_fails_worker(
+        self, SlackClient, container_factory, make_message_event, make_config
+    ):
+        class Service:
+
+            name = "sample"
+
+            @rtm.handle_message
+            def handle_message(self, event, message):
+                return "sure, {}".format(message)
+
+        config = make_config(SIZE=1, WHEN_FULL="error")
+        config[constants.CONFIG_KEY]["TOKEN"] = "abc-123"
+        SlackClient.return_value.rtm_read.return_value = [make_message_event()]
+        container = container_factory(Service, config)
+
+        entrypoint = get_extension(container, rtm.RTMMessageHandlerEntrypoint)
+        with patch.object(
+            entrypoint.clients, "reply", side_effect=rtm.OutboxFull("full")
+        ):
+            result, exc_info = entrypoint.handle_result(
+                make_message_event(), Mock(), "sure", None
+            )
+
+        assert result == "sure"
+        assert exc_info[0] is rtm.OutboxFull
+
+
 @patch.object(rtm.RTMEventHandlerEntrypoint, "clients")
 def test_entrypoints_lifecycle(clients, container_factory, config):
     class Service:
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from collections import Counter
+
+from nameko_slack.sharding import HashRing, import_path
+
+
+BOTS = ["bot-{}".format(index) for index in range(1000)]
+
+
+def owners(ring):
+    return {bot_name: ring.owner(bot_name) for bot_name in BOTS}
+
+
+def test_owner_is_deterministic():
+    ring = HashRing(["a", "b", "c"])
+
+    assert owners(ring) == owners(HashRing(["c", "b", "a"]))
+
+
+def test_keys_are_spread_over_members():
+    ring = HashRing(["a", "b", "c", "d"])
+
+    counts = Counter(owners(ring).values())
+
+    assert sorted(counts) == ["a", "b", "c", "d"]
+    assert min(counts.values()) > 150
+
+
+def test_joining_member_takes_keys_from_others_only():
+    before = owners(HashRing(["a", "b", "c"]))
+    after = owners(HashRing(["a", "b", "c", "d"]))
+
+    moved = [bot_name for bot_name in BOTS if before[bot_name] != after[bot_name]]
+
+    assert moved
+    assert all(after[bot_name] == "d" for bot_name in moved)
+    assert len(moved) < len(BOTS) / 3
+
+
+def test_leaving_member_hands_over_its_keys_only():
+    before = owners(HashRing(["a", "b", "c"]))
+    after = owners(HashRing(["a", "c"]))
+
+    moved = [bot_name for bot_name in BOTS if before[bot_name] != after[bot_name]]
+
+    assert all(before[bot_name] == "b" for bot_name in moved)
+    assert "b" not in after.values()
+
+
+def test_empty_ring():
+    assert HashRing([]).owner("bot-1") is None
+
+
+def test_import_path():
+    assert import_path("nameko_slack.sharding:HashRing") is HashRing
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+from mock import Mock, call
+from slackclient.server import SlackConnectionError
+
+from nameko_slack import socket_mode
+
+
+@pytest.mark.parametrize(
+    ("envelope", "key"),
+    (
+        ({"envelope_id": "E1", "payload": {"event_id": "Ev1"}}, "Ev1"),
+        ({"envelope_id": "E1", "payload": {}}, "E1"),
+        ({"envelope_id": "E1"}, "E1"),
+        ({"type": "hello"}, None),
+    ),
+)
+def test_envelope_key(envelope, key):
+    assert socket_mode.envelope_key(envelope) == key
+
+
+class TestOpenConnection:
+    @pytest.fixture
+    def client(self):
+        client = Mock()
+        client.api_call.return_value = {"ok": True, "url": "wss://spam"}
+        return client
+
+    def test_open(self, client):
+        socket_mode.open_connection(client)
+
+        assert client.api_call.call_args == call("apps.connections.open")
+        assert client.server.connect_slack_websocket.call_args == call("wss://spam")
+        # the transport kept the websocket
+        assert not client.server.websocket.close.called
+
+    def test_closes_replaced_websocket(self, client):
+        previous = client.server.websocket
+
+        def connect(url):
+            client.server.websocket = Mock()
+
+        client.server.connect_slack_websocket.side_effect = connect
+
+        socket_mode.open_connection(client)
+
+        assert previous.close.called
+        assert not client.server.websocket.close.called
+
+    def test_first_connection(self, client):
+        client.server.websocket = None
+
+        socket_mode.open_connection(client)
+
+        assert client.server.connect_slack_websocket.called
+
+    def test_failure(self, client):
+        client.api_call.return_value = {"ok": False, "error": "invalid_auth"}
+
+        with pytest.raises(SlackConnectionError) as exc:
+            socket_mode.open_connection(client)
+
+        assert str(exc.value) == "Failed to open connection: invalid_auth"
+        assert not client.server.connect_slack_websocket.called
+
+
+def test_ack():
+    client = Mock()
+
+    socket_mode.ack(client, "E1")
+
+    assert client.server.websocket.send.call_args == call(
+        json.dumps({"envelope_id": "E1"})
+    )
+
+
+def test_ping():
+    server = Mock()
+
+    socket_mode.ping(server)
+
+    assert server.websocket.ping.called
+
+
+def test_post_message():
+    client = Mock()
+
+    socket_mode.post_message(client, "C1", "spam")
+
+    assert client.api_call.call_args == call(
+        "chat.postMessage", channel="C1", text="spam"
+    )
+
+
+def test_load_identity():
+    client = Mock()
+    client.api_call.return_value = {
+        "ok": True,
+        "user_id": "U1",
+        "user": "bot",
+        "team_id": "T1",
+        "team": "Spam",
+    }
+
+    assert socket_mode.load_identity(client) == {
+        "self": {"id": "U1", "name": "bot"},
+        "team": {"id": "T1", "name": "Spam"},
+    }
+    assert client.api_call.call_args == call("auth.test")
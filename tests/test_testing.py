@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+from mock import Mock, call, patch
+from slackclient.slackrequest import SlackRequest
+from werkzeug.test import Client
+
+from nameko_slack.testing import FakeSlack
+
+
+@pytest.fixture
+def fake_slack():
+    fake_slack = FakeSlack()
+    fake_slack.start()
+    yield fake_slack
+    fake_slack.stop()
+
+
+@pytest.fixture
+def api(fake_slack):
+    client = Client(fake_slack.app)
+
+    def call_api(method, **arguments):
+        response = client.post("/api/{}".format(method), data=arguments)
+        assert response.status_code == 200
+        return json.loads(response.get_data(as_text=True))
+
+    return call_api
+
+
+class TestWebApi:
+    @pytest.mark.parametrize("method", ("rtm.connect", "rtm.start"))
+    def test_connect(self, api, fake_slack, method):
+        result = api(method)
+
+        assert result["ok"] is True
+        assert result["url"] == fake_slack.url
+        assert result["self"] == {"id": "U0", "name": "bot"}
+        assert ("users" in result) is (method == "rtm.start")
+        assert fake_slack.api_calls[method] == 1
+
+    def test_auth_test(self, api):
+        assert api("auth.test")["user_id"] == "U0"
+
+    def test_post_message(self, api, fake_slack):
+        result = api("chat.postMessage", channel="C1", text="spam")
+
+        message = {"type": "message", "channel": "C1", "text": "spam"}
+        assert result == {"ok": True, "channel": "C1", "message": message}
+        assert fake_slack.received.get(timeout=1) == message
+
+    def test_other_methods(self, api, fake_slack):
+        assert api("reactions.add", name="thumbsup") == {"ok": True}
+        assert fake_slack.api_calls == {"reactions.add": 1}
+
+    def test_websocket_still_served(self, fake_slack):
+        response = Client(fake_slack.app).get("/")
+
+        assert response.status_code == 400
+
+
+class TestPatchWebApi:
+    def test_routes_calls_to_the_fake(self, fake_slack):
+        fake_slack.session = Mock()
+        original = SlackRequest.do
+
+        with fake_slack.patch_web_api():
+            response = SlackRequest().do(
+                "xoxb-1", "chat.postMessage", {"channel": "C1", "blocks": [{}]}
+            )
+
+        assert SlackRequest.do is original
+        assert response == fake_slack.session.post.return_value
+        assert fake_slack.session.post.call_args == call(
+            fake_slack.api_url + "chat.postMessage",
+            headers={"Authorization": "Bearer xoxb-1"},
+            data={"channel": "C1", "blocks": "[{}]"},
+            timeout=None,
+        )
+
+    def test_uses_session_of_pooled_requesters(self, fake_slack):
+        requester = Mock()
+
+        with fake_slack.patch_web_api():
+            SlackRequest.do(requester, "xoxb-1", "auth.test", timeout=5)
+
+        ((url,), kwargs) = requester.session.post.call_args
+        assert url == fake_slack.api_url + "auth.test"
+        assert kwargs["timeout"] == 5
+
+    @patch("nameko_slack.testing.Session")
+    def test_creates_shared_session(self, Session, fake_slack):
+        requester = Mock(session=None)
+
+        with fake_slack.patch_web_api():
+            SlackRequest.do(requester, "xoxb-1", "auth.test")
+            SlackRequest.do(requester, "xoxb-1", "auth.test")
+
+        assert Session.call_count == 1
+        assert fake_slack.session.post.call_count == 2
+
+
+def test_publish_to_one_connection(fake_slack):
+    one, other = Mock(), Mock()
+    fake_slack.connections.update([one, other])
+
+    fake_slack.publish({"type": "hello"}, one)
+    fake_slack.publish({"type": "spam"})
+
+    assert one.send.call_args_list == [
+        call(json.dumps({"type": "hello"})),
+        call(json.dumps({"type": "spam"})),
+    ]
+    assert other.send.call_args_list == [call(json.dumps({"type": "spam"}))]
+    fake_slack.connections.clear()
+
+
+def test_stop_closes_session():
+    fake_slack = FakeSlack()
+    fake_slack.start()
+    fake_slack.session = session = Mock()
+
+    fake_slack.stop()
+
+    assert session.close.called
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import pytest
+from mock import Mock, patch
+from nameko.exceptions import ConfigurationError
+
+from nameko_slack import rtm
+from nameko_slack.transport import Transport, get_transport
+
+
+def test_default_transport():
+    transport = get_transport("eventlet")
+
+    assert type(transport) is Transport
+
+    client = Mock()
+    transport.setup()
+    transport.start()
+    transport.attach(client)
+    transport.stop()
+
+    assert client.mock_calls == []
+
+
+def test_default_transport_disconnect():
+    client = Mock()
+
+    Transport().disconnect(client)
+
+    assert client.server.websocket.close.called
+    assert client.server.connected is False
+
+    # never connected
+    client.server.websocket = None
+    Transport().disconnect(client)
+
+
+@patch("nameko_slack.rtm.SlackClient")
+def test_client_manager_setup_unknown_transport(SlackClient):
+    config = {"SLACK": {"TOKEN": "abc-123", "TRANSPORT": "spam"}}
+
+    client_manager = rtm.SlackRTMClientManager()
+    client_manager.container = Mock(config=config)
+
+    with pytest.raises(ConfigurationError) as exc:
+        client_manager.setup()
+
+    assert str(exc.value) == "Unknown `TRANSPORT` `spam` in `SLACK` config"
+
+
+@patch("nameko_slack.rtm.get_transport")
+@patch("nameko_slack.rtm.SlackClient")
+def test_client_manager_attaches_transport(SlackClient, get_transport):
+    config = {"SLACK": {"BOTS": {"Alice": "abc-123", "Bob": "def-456"}}}
+
+    client_manager = rtm.SlackRTMClientManager()
+    client_manager.container = Mock(config=config)
+    client_manager.setup()
+
+    transport = get_transport.return_value
+    assert get_transport.call_args[0] == ("eventlet",)
+    assert client_manager.transport is transport
+    assert transport.setup.called
+    assert transport.attach.call_count == 2
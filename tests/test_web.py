@@ -1,14 +1,35 @@
 # -*- coding: utf-8 -*-
+import time
+from collections import OrderedDict
+
 import nameko
 import pytest
-from mock import Mock
+from eventlet import sleep, spawn
+from mock import ANY, Mock, call, patch
 from nameko.containers import ServiceContainer
 from nameko.exceptions import ConfigurationError
 from nameko.testing.services import dummy
 from nameko.testing.utils import get_extension
 
-from nameko_slack import constants
-from nameko_slack.web import Slack
+from nameko_slack import constants, rtm
+from nameko_slack.web import (
+    CACHED_METHODS,
+    CachingClient,
+    ClientPool,
+    CoalescingClient,
+    EntityCache,
+    InstrumentedClient,
+    PooledSlackRequest,
+    RateLimitedClient,
+    RateLimiter,
+    Slack,
+    SlackApiError,
+    SlackPool,
+    UnknownBot,
+    WebClient,
+    make_client,
+    retry_after,
+)
 
 
 @pytest.fixture
@@ -17,12 +38,12 @@ def make_slack_provider(config):
     containers = []
     default_config = config
 
-    def factory(config=None, bot_name=None):
+    def factory(config=None, bot_name=None, **options):
         class Service(object):
 
             name = "service"
 
-            slack_api = Slack(bot_name)
+            slack_api = Slack(bot_name, **options)
 
             @dummy
             def dummy(self):
@@ -130,3 +151,988 @@ def test_get_dependency(config, make_slack_provider):
     slack_provider.setup()
     worker_ctx = Mock()
     assert slack_provider.get_dependency(worker_ctx) == slack_provider.client
+
+
+class TestConnectionPool:
+    def test_default_pool_is_sized_to_max_workers(self, config, make_slack_provider):
+        config["max_workers"] = 50
+
+        slack_provider = make_slack_provider(config)
+        slack_provider.setup()
+
+        adapter = slack_provider.session.get_adapter("https://slack.com/api/")
+        assert adapter._pool_maxsize == 50
+        assert adapter._pool_connections == 1
+        assert adapter._pool_block is True
+        assert slack_provider.session.headers["Connection"] == "keep-alive"
+
+        requester = slack_provider.client.server.api_requester
+        assert isinstance(requester, PooledSlackRequest)
+        assert requester.session is slack_provider.session
+
+    def test_configured_pool(self, config, make_slack_provider):
+        config[constants.CONFIG_KEY]["HTTP_POOL"] = {
+            "SIZE": 5,
+            "HOSTS": 2,
+            "KEEP_ALIVE": False,
+            "BLOCK": False,
+        }
+
+        slack_provider = make_slack_provider(config)
+        slack_provider.setup()
+
+        adapter = slack_provider.session.get_adapter("https://slack.com/api/")
+        assert adapter._pool_maxsize == 5
+        assert adapter._pool_connections == 2
+        assert adapter._pool_block is False
+        assert slack_provider.session.headers["Connection"] == "close"
+
+    @pytest.mark.parametrize("method", ("stop", "kill"))
+    def test_session_closed(self, make_slack_provider, method):
+        slack_provider = make_slack_provider()
+        slack_provider.setup()
+
+        with patch.object(slack_provider.session, "close") as close:
+            getattr(slack_provider, method)()
+
+        assert close.call_count == 1
+
+    def test_requests_are_sent_over_session(self):
+        session = Mock()
+        session.post.return_value = Mock(text='{"ok": true}', headers={})
+        client = make_client("xxx-000", session)
+
+        client.api_call("chat.postMessage", channel="C1", text="spam")
+        client.server.api_requester.post_http_request(
+            "xxx-000", "users.info", {"user": "U1", "token": "yyy-111"}
+        )
+
+        assert session.post.call_args_list == [
+            call(
+                "https://slack.com/api/chat.postMessage",
+                headers={"user-agent": ANY, "Authorization": "Bearer xxx-000"},
+                data={"channel": "C1", "text": "spam"},
+                files=None,
+                timeout=None,
+                proxies=None,
+            ),
+            call(
+                "https://slack.com/api/users.info",
+                headers={"user-agent": ANY, "Authorization": "Bearer yyy-111"},
+                data={"user": "U1", "token": "yyy-111"},
+                files=None,
+                timeout=None,
+                proxies=None,
+            ),
+        ]
+
+
+class TestCoalescingClient:
+    @pytest.fixture
+    def responses(self):
+        return {}
+
+    @pytest.fixture
+    def client(self, responses):
+        def api_call(method, timeout=None, **kwargs):
+            sleep(0.01)
+            response = responses.get(method, {"ok": True, "method": method})
+            if isinstance(response, Exception):
+                raise response
+            if callable(response):
+                return response(**kwargs)
+            return dict(response, args=kwargs)
+
+        client = Mock()
+        client.api_call.side_effect = api_call
+        return client
+
+    def test_identical_read_calls_share_request(self, client):
+        coalescing = CoalescingClient(client)
+
+        calls = [
+            spawn(coalescing.api_call, "users.info", user="U1"),
+            spawn(coalescing.api_call, "users.info", user="U1"),
+            spawn(coalescing.api_call, "users.info", user="U2"),
+        ]
+        results = [call.wait() for call in calls]
+
+        assert results == [
+            {"ok": True, "method": "users.info", "args": {"user": "U1"}},
+            {"ok": True, "method": "users.info", "args": {"user": "U1"}},
+            {"ok": True, "method": "users.info", "args": {"user": "U2"}},
+        ]
+        assert results[0] is not results[1]
+        assert client.api_call.call_args_list == [
+            call("users.info", timeout=None, user="U1"),
+            call("users.info", timeout=None, user="U2"),
+        ]
+        assert coalescing.in_flight == {}
+
+        # calls made after the shared one finished hit the API again
+        coalescing.api_call("users.info", user="U1")
+        assert client.api_call.call_count == 3
+
+    def test_write_calls_are_not_shared(self, client):
+        coalescing = CoalescingClient(client)
+
+        calls = [
+            spawn(coalescing.api_call, "chat.postMessage", channel="C1", text="spam")
+            for _ in range(2)
+        ]
+        for thread in calls:
+            thread.wait()
+
+        assert client.api_call.call_count == 2
+
+    def test_errors_are_raised_to_all_callers(self, client, responses):
+        responses["users.info"] = ValueError("boom")
+        coalescing = CoalescingClient(client)
+
+        calls = [spawn(coalescing.api_call, "users.info", user="U1") for _ in range(2)]
+        for thread in calls:
+            with pytest.raises(ValueError):
+                thread.wait()
+
+        assert client.api_call.call_count == 1
+        assert coalescing.in_flight == {}
+
+    def test_attributes_of_wrapped_client(self, client):
+        assert CoalescingClient(client).token == client.token
+
+    def test_batch_below_batch_size(self, client):
+        coalescing = CoalescingClient(client, batch_size=3)
+
+        calls = [
+            spawn(coalescing.api_call, "users.info", user=user)
+            for user in ("U1", "U2", "U1")
+        ]
+        results = [thread.wait() for thread in calls]
+
+        assert [result["args"]["user"] for result in results] == ["U1", "U2", "U1"]
+        assert client.api_call.call_args_list == [
+            call("users.info", timeout=None, user="U1"),
+            call("users.info", timeout=None, user="U2"),
+        ]
+
+    def test_batch_resolved_from_users_list(self, client, responses):
+        def users_list(limit, cursor):
+            pages = {
+                None: {
+                    "ok": True,
+                    "members": [{"id": "U1"}, {"id": "U2"}],
+                    "response_metadata": {"next_cursor": "page-2"},
+                },
+                "page-2": {"ok": True, "members": [{"id": "U3"}]},
+            }
+            return pages[cursor]
+
+        responses["users.list"] = users_list
+        coalescing = CoalescingClient(client, batch_size=3, batch_pages=2)
+
+        calls = [
+            spawn(coalescing.api_call, "users.info", user=user)
+            for user in ("U1", "U2", "U3", "U4")
+        ]
+        results = [thread.wait() for thread in calls]
+
+        assert results[:3] == [
+            {"ok": True, "user": {"id": "U1"}},
+            {"ok": True, "user": {"id": "U2"}},
+            {"ok": True, "user": {"id": "U3"}},
+        ]
+        assert results[3]["args"] == {"user": "U4"}
+        assert client.api_call.call_args_list == [
+            call("users.list", timeout=None, limit=200, cursor=None),
+            call("users.list", timeout=None, limit=200, cursor="page-2"),
+            call("users.info", timeout=None, user="U4"),
+        ]
+
+    def test_batch_stops_when_all_resolved(self, client, responses):
+        responses["users.list"] = lambda limit, cursor: {
+            "ok": True,
+            "members": [{"id": "U1"}, {"id": "U2"}],
+            "response_metadata": {"next_cursor": "page-2"},
+        }
+        coalescing = CoalescingClient(client, batch_size=2, batch_pages=5)
+
+        calls = [
+            spawn(coalescing.api_call, "users.info", user=user) for user in ("U1", "U2")
+        ]
+        for thread in calls:
+            thread.wait()
+
+        assert client.api_call.call_count == 1
+
+    def test_batch_reads_at_most_batch_pages(self, client, responses):
+        responses["users.list"] = lambda limit, cursor: {
+            "ok": True,
+            "members": [{"id": "U1"}, {"id": "U9"}],
+            "response_metadata": {"next_cursor": "next"},
+        }
+        coalescing = CoalescingClient(client, batch_size=2, batch_pages=1)
+
+        calls = [
+            spawn(coalescing.api_call, "users.info", user=user) for user in ("U1", "U2")
+        ]
+        results = [thread.wait() for thread in calls]
+
+        assert results[0] == {"ok": True, "user": {"id": "U1"}}
+        assert results[1]["args"] == {"user": "U2"}
+        assert client.api_call.call_args_list == [
+            call("users.list", timeout=None, limit=200, cursor=None),
+            call("users.info", timeout=None, user="U2"),
+        ]
+
+    @pytest.mark.parametrize(
+        "users_list", ({"ok": False, "error": "ratelimited"}, ValueError("boom"))
+    )
+    def test_batch_falls_back_to_users_info(self, client, responses, users_list):
+        responses["users.list"] = users_list
+        coalescing = CoalescingClient(client, batch_size=2)
+
+        calls = [
+            spawn(coalescing.api_call, "users.info", user=user) for user in ("U1", "U2")
+        ]
+        results = [thread.wait() for thread in calls]
+
+        assert [result["args"]["user"] for result in results] == ["U1", "U2"]
+        assert client.api_call.call_count == 3
+
+    def test_provider(self, config, make_slack_provider):
+        config[constants.CONFIG_KEY]["COALESCE"] = {"BATCH_SIZE": 10}
+
+        slack_provider = make_slack_provider(config, coalesce=True)
+        slack_provider.setup()
+
+        client = slack_provider.get_dependency(Mock()).client
+        assert isinstance(client, CoalescingClient)
+        assert client.batch_size == 10
+        assert client.batch_window == 0.01
+        assert client.batch_pages == 1
+
+
+class TestEntityCache:
+    @pytest.fixture
+    def clock(self):
+        with patch("nameko_slack.web.clock") as clock:
+            clock.return_value = 100.0
+            yield clock
+
+    @pytest.fixture
+    def cache(self, clock):
+        return EntityCache()
+
+    def test_get_and_set(self, cache):
+        with pytest.raises(KeyError):
+            cache.get("Alice", "users", "U1")
+
+        cache.set("Alice", "users", "U1", {"id": "U1"})
+
+        assert cache.get("Alice", "users", "U1") == {"id": "U1"}
+        with pytest.raises(KeyError):
+            cache.get("Bob", "users", "U1")
+
+        assert cache.stats() == {
+            "size": 1,
+            "hits": {"users": 1},
+            "misses": {"users": 2},
+            "evictions": 0,
+        }
+
+    def test_entries_expire(self, cache, clock):
+        cache.set("Alice", "users", "U1", {"id": "U1"})
+        cache.set("Alice", "team", None, {"id": "T1"})
+
+        clock.return_value = 100.0 + 301
+        with pytest.raises(KeyError):
+            cache.get("Alice", "users", "U1")
+        assert cache.get("Alice", "team", None) == {"id": "T1"}
+
+    def test_least_recently_used_entries_are_evicted(self, cache):
+        cache.size = 2
+        cache.set("Alice", "users", "U1", {"id": "U1"})
+        cache.set("Alice", "users", "U2", {"id": "U2"})
+        cache.get("Alice", "users", "U1")
+        cache.set("Alice", "users", "U3", {"id": "U3"})
+
+        assert cache.get("Alice", "users", "U1") == {"id": "U1"}
+        assert cache.get("Alice", "users", "U3") == {"id": "U3"}
+        with pytest.raises(KeyError):
+            cache.get("Alice", "users", "U2")
+        assert cache.stats()["evictions"] == 1
+
+    @pytest.mark.parametrize(
+        ("event", "kind", "entity_id"),
+        (
+            ({"type": "user_change", "user": {"id": "U1"}}, "users", "U1"),
+            ({"type": "channel_rename", "channel": {"id": "C1"}}, "channels", "C1"),
+            ({"type": "member_joined_channel", "channel": "C1"}, "channels", "C1"),
+            ({"type": "team_rename", "name": "spam"}, "team", None),
+            ({"type": "bot_changed", "bot": {"id": "B1"}}, "bots", "B1"),
+        ),
+    )
+    def test_invalidate_event(self, cache, event, kind, entity_id):
+        cache.set("Alice", kind, entity_id, {"ok": True})
+        cache.set("Bob", kind, entity_id, {"ok": True})
+
+        cache.invalidate_event("Alice", {"type": "user_typing", "user": "U1"})
+        cache.invalidate_event("Alice", event)
+
+        with pytest.raises(KeyError):
+            cache.get("Alice", kind, entity_id)
+        assert cache.get("Bob", kind, entity_id) == {"ok": True}
+
+    def test_setup(self, cache):
+        cache.container = Mock(
+            config={
+                constants.CONFIG_KEY: {
+                    "CACHE": {"SIZE": 10, "TTL": {"users": 60}},
+                }
+            }
+        )
+        cache.setup()
+
+        assert cache.size == 10
+        assert cache.ttls == {"users": 60, "channels": 300, "team": 3600, "bots": 3600}
+
+
+class TestCachingClient:
+    @pytest.fixture
+    def client(self):
+        def api_call(method, timeout=None, **kwargs):
+            if kwargs.get("user") == "U0":
+                return {"ok": False, "error": "user_not_found"}
+            field = CACHED_METHODS.get(method, (None, None, "result"))[2]
+            return {"ok": True, field: {"method": method, "args": kwargs}}
+
+        client = Mock()
+        client.api_call.side_effect = api_call
+        return client
+
+    @pytest.fixture
+    def caching(self, client):
+        return CachingClient(client, EntityCache(), "Alice")
+
+    def test_entity_lookups_are_cached(self, caching, client):
+        first = caching.api_call("users.info", user="U1")
+        first["user"]["args"]["user"] = "mutated"
+        second = caching.api_call("users.info", user="U1")
+        second["user"]["args"]["user"] = "mutated"
+
+        assert caching.api_call("users.info", user="U1") == {
+            "ok": True,
+            "user": {"method": "users.info", "args": {"user": "U1"}},
+        }
+        caching.api_call("team.info")
+        caching.api_call("team.info")
+        assert client.api_call.call_args_list == [
+            call("users.info", timeout=None, user="U1"),
+            call("team.info", timeout=None),
+        ]
+        assert caching.cache.stats()["hits"] == {"users": 2, "team": 1}
+
+    def test_hits_are_returned_in_the_envelope_of_the_method(self, caching, client):
+        group = caching.api_call("groups.info", channel="G1")["group"]
+
+        assert caching.api_call("conversations.info", channel="G1") == {
+            "ok": True,
+            "channel": group,
+        }
+        assert caching.api_call("channels.info", channel="G1") == {
+            "ok": True,
+            "channel": group,
+        }
+        assert caching.api_call("groups.info", channel="G1") == {
+            "ok": True,
+            "group": group,
+        }
+        assert client.api_call.call_count == 1
+
+    def test_failed_lookups_are_not_cached(self, caching, client):
+        caching.api_call("users.info", user="U0")
+        caching.api_call("users.info", user="U0")
+
+        assert client.api_call.call_count == 2
+
+    @pytest.mark.parametrize(
+        ("method", "kwargs"),
+        (
+            ("chat.postMessage", {"channel": "C1", "text": "spam"}),
+            ("users.info", {"user": "U1", "include_locale": True}),
+            ("team.info", {"team": "T1"}),
+        ),
+    )
+    def test_other_calls_are_not_cached(self, caching, client, method, kwargs):
+        caching.api_call(method, **kwargs)
+        caching.api_call(method, **kwargs)
+
+        assert client.api_call.call_count == 2
+
+    def test_attributes_of_wrapped_client(self, caching, client):
+        assert caching.token == client.token
+
+
+class TestInstrumentedClient:
+    @pytest.fixture
+    def client(self):
+        client = Mock()
+        client.api_call.return_value = {"ok": True}
+        return client
+
+    @pytest.fixture
+    def instrumentation(self):
+        return Mock()
+
+    @pytest.fixture
+    def instrumented(self, client, instrumentation):
+        return InstrumentedClient(client, instrumentation)
+
+    def test_times_calls(self, instrumented, client, instrumentation):
+        assert instrumented.api_call("users.info", user="U1") == {"ok": True}
+
+        recorder = instrumentation.recorder
+        assert client.api_call.call_args == call("users.info", timeout=None, user="U1")
+        ((name, _), labels) = recorder.timing.call_args
+        assert (name, labels) == ("api_call_seconds", {"method": "users.info"})
+        assert not recorder.incr.called
+        assert instrumented.token == client.token
+
+    def test_counts_errors(self, instrumented, client, instrumentation):
+        client.api_call.return_value = {"ok": False, "error": "ratelimited"}
+
+        instrumented.api_call("users.info", user="U1")
+        client.api_call.return_value = {"ok": False}
+        instrumented.api_call("users.info", user="U1")
+
+        assert instrumentation.recorder.incr.call_args_list == [
+            call("api_call_errors", method="users.info", error="ratelimited"),
+            call("api_call_errors", method="users.info", error="unknown"),
+        ]
+
+    def test_counts_exceptions(self, instrumented, client, instrumentation):
+        client.api_call.side_effect = ValueError("Boom")
+
+        with pytest.raises(ValueError):
+            instrumented.api_call("chat.postMessage", channel="C1")
+
+        recorder = instrumentation.recorder
+        assert recorder.incr.call_args == call(
+            "api_call_errors", method="chat.postMessage", error="ValueError"
+        )
+        assert recorder.timing.called
+
+    def test_without_recorder(self, instrumented, client, instrumentation):
+        instrumentation.recorder = None
+
+        assert instrumented.api_call("users.info", user="U1") == {"ok": True}
+
+    def test_setup(self, make_slack_provider):
+        config = {"SLACK": {"TOKEN": "abc-123", "METRICS": {"PROMETHEUS": True}}}
+
+        provider = make_slack_provider(config, coalesce=True)
+        provider.setup()
+
+        instrumented = provider.client.client.client
+        assert isinstance(instrumented, InstrumentedClient)
+        assert instrumented.instrumentation is provider.metrics
+
+
+class TestRateLimitedClient:
+    @pytest.fixture
+    def client(self):
+        return Mock(token="xoxb-1")
+
+    @pytest.fixture
+    def limiter(self):
+        limiter = RateLimiter()
+        limiter.container = Mock(
+            config={"SLACK": {"RATE_LIMITS": {"TIERS": {"tier4": 60000}}}}
+        )
+        limiter.setup()
+        limiter.metrics = Mock()
+        return limiter
+
+    @pytest.fixture
+    def limited(self, client, limiter):
+        return RateLimitedClient(client, limiter)
+
+    def test_waits_for_turn(self, limited, client, limiter):
+        client.api_call.return_value = {"ok": True}
+
+        assert limited.api_call("users.info", user="U1") == {"ok": True}
+        assert limited.token == "xoxb-1"
+
+        assert client.api_call.call_args == call("users.info", timeout=None, user="U1")
+        assert ("xoxb-1", "users.info") in limiter.limits.buckets
+        ((name, waited), labels) = limiter.metrics.recorder.timing.call_args
+        assert (name, labels) == (
+            "api_wait_seconds",
+            {"method": "users.info", "tier": "tier4"},
+        )
+
+    def test_retries_after_slack_asks_to(self, limited, client, limiter):
+        ratelimited = {
+            "ok": False,
+            "error": "ratelimited",
+            "headers": {"Retry-After": "0.01"},
+        }
+        client.api_call.side_effect = [ratelimited, {"ok": True}]
+
+        assert limited.api_call("chat.postMessage", channel="C1") == {"ok": True}
+
+        key = ("xoxb-1", "chat.postMessage", "C1")
+        assert key in limiter.limits.blocked_until
+        assert limiter.metrics.recorder.incr.call_args == call(
+            "api_rate_limited", method="chat.postMessage", tier="special"
+        )
+
+    def test_gives_up_after_max_retries(self, limited, client, limiter):
+        ratelimited = {"ok": False, "error": "ratelimited", "headers": {}}
+        client.api_call.return_value = ratelimited
+        limiter.max_retries = 1
+        limiter.limits.block = Mock()
+
+        assert limited.api_call("users.info", user="U1") == ratelimited
+        assert client.api_call.call_count == 2
+
+    def test_without_recorder(self, limited, client, limiter):
+        limiter.metrics.recorder = None
+        client.api_call.side_effect = [
+            {"ok": False, "error": "ratelimited", "headers": {"Retry-After": "0"}},
+            {"ok": True},
+        ]
+
+        assert limited.api_call("users.info", user="U1") == {"ok": True}
+
+    def test_disabled(self):
+        limiter = RateLimiter()
+        limiter.container = Mock(config={"SLACK": {}})
+        limiter.setup()
+
+        assert limiter.limits is None
+
+    def test_setup(self, make_slack_provider):
+        config = {
+            "SLACK": {
+                "TOKEN": "abc-123",
+                "RATE_LIMITS": {
+                    "METHODS": {"users.info": "tier2"},
+                    "BURST": 5,
+                    "MAX_RETRIES": 10,
+                },
+            }
+        }
+
+        provider = make_slack_provider(config)
+        provider.setup()
+        provider.rate_limiter.setup()
+
+        limited = provider.client.client
+        assert isinstance(limited, RateLimitedClient)
+        assert limited.limiter is provider.rate_limiter
+        limits = provider.rate_limiter.limits
+        assert (limits.tier("users.info"), limits.burst) == ("tier2", 5)
+        assert provider.rate_limiter.max_retries == 10
+
+
+class TestWebClient:
+    @pytest.fixture
+    def client(self):
+        return Mock()
+
+    @pytest.fixture
+    def pages(self, client):
+        pages = {
+            None: {"ok": True, "members": ["U1", "U2"], "response_metadata": {}},
+            "2": {"ok": True, "members": ["U3"]},
+            "3": {"ok": True, "members": ["U4"], "response_metadata": {}},
+        }
+        pages[None]["response_metadata"]["next_cursor"] = "2"
+        pages["2"]["response_metadata"] = {"next_cursor": "3"}
+
+        def api_call(method, timeout=None, cursor=None, **kwargs):
+            return pages[cursor]
+
+        client.api_call.side_effect = api_call
+        return pages
+
+    def test_delegates_to_client(self, client):
+        web_client = WebClient(client)
+
+        assert web_client.api_call("users.info", user="U1") == (
+            client.api_call.return_value
+        )
+        assert web_client.token == client.token
+
+    def test_streams_items(self, client, pages):
+        web_client = WebClient(client, page_size=2)
+
+        assert list(web_client.paginate("users.list", presence=True)) == [
+            "U1",
+            "U2",
+            "U3",
+            "U4",
+        ]
+        assert client.api_call.call_args_list == [
+            call("users.list", timeout=None, cursor=cursor, limit=2, presence=True)
+            for cursor in (None, "2", "3")
+        ]
+
+    def test_prefetches_next_page(self, client, pages):
+        items = WebClient(client).paginate("users.list")
+
+        assert next(items) == "U1"
+        sleep(0)
+        assert client.api_call.call_count == 2
+
+    def test_without_prefetch(self, client, pages):
+        items = WebClient(client, prefetch=False).paginate("users.list")
+
+        assert next(items) == "U1"
+        sleep(0)
+        assert client.api_call.call_count == 1
+        assert list(items) == ["U2", "U3", "U4"]
+
+    def test_stops_fetching_when_done_iterating(self, client, pages):
+        fetched = []
+
+        def api_call(method, timeout=None, cursor=None, **kwargs):
+            sleep(0.01 if cursor else 0)
+            fetched.append(cursor)
+            return pages[cursor]
+
+        client.api_call.side_effect = api_call
+        items = WebClient(client).paginate("users.list")
+
+        assert next(items) == "U1"
+        sleep(0)
+        items.close()
+        sleep(0.02)
+
+        assert fetched == [None]
+
+    def test_waits_when_rate_limited(self, client):
+        client.api_call.side_effect = [
+            {"ok": False, "error": "ratelimited", "headers": {"retry-after": "0.01"}},
+            {"ok": True, "members": ["U1"]},
+        ]
+
+        assert list(WebClient(client).iter_users()) == ["U1"]
+        assert client.api_call.call_count == 2
+
+    def test_gives_up_when_rate_limited_too_often(self, client):
+        client.api_call.return_value = {
+            "ok": False,
+            "error": "ratelimited",
+            "headers": {"Retry-After": "0"},
+        }
+
+        with pytest.raises(SlackApiError) as exc:
+            list(WebClient(client, max_retries=2).iter_users())
+
+        assert str(exc.value) == "`users.list` failed: ratelimited"
+        assert client.api_call.call_count == 3
+
+    def test_raises_errors(self, client):
+        client.api_call.return_value = {"ok": False, "error": "channel_not_found"}
+
+        with pytest.raises(SlackApiError) as exc:
+            list(WebClient(client).iter_history("C1"))
+
+        assert exc.value.method == "conversations.history"
+        assert exc.value.response == client.api_call.return_value
+        assert client.api_call.call_count == 1
+
+    def test_retry_after(self):
+        assert retry_after({"ok": False, "error": "ratelimited"}) == 1.0
+        assert (
+            retry_after(
+                {"ok": False, "error": "ratelimited", "headers": {"Date": "today"}}
+            )
+            == 1.0
+        )
+        assert retry_after({"ok": False, "error": "invalid_auth"}) is None
+
+    def test_helpers(self, client):
+        client.api_call.return_value = {"ok": True, "messages": [1], "members": [2]}
+        web_client = WebClient(client)
+
+        assert list(web_client.iter_history("C1", oldest="1")) == [1]
+        assert client.api_call.call_args == call(
+            "conversations.history",
+            timeout=None,
+            cursor=None,
+            channel="C1",
+            oldest="1",
+            limit=200,
+        )
+        assert list(web_client.iter_members("C1")) == [2]
+        assert list(web_client.paginate("search.all", field="members")) == [2]
+
+    def test_unknown_items_field(self, client):
+        with pytest.raises(ValueError) as exc:
+            next(WebClient(client).paginate("search.all"))
+
+        assert str(exc.value) == "Unknown items field of `search.all`"
+
+    def test_calls_side_by_side(self, client):
+        def api_call(method, timeout=None, **kwargs):
+            sleep(0.02)
+            return {"ok": True, "channel": kwargs["channel"]}
+
+        client.api_call.side_effect = api_call
+        web_client = WebClient(client, pool_size=2)
+        started = time.time()
+
+        futures = [
+            web_client.call_async("chat.postMessage", channel=channel)
+            for channel in ("C1", "C2", "C3", "C4")
+        ]
+        results = web_client.gather(futures)
+
+        assert [result["channel"] for result in results] == ["C1", "C2", "C3", "C4"]
+        # two at a time
+        assert time.time() - started == pytest.approx(0.04, abs=0.015)
+
+    def test_gather_raises_first_error(self, client):
+        client.api_call.side_effect = [{"ok": True}, ValueError("Boom")]
+        web_client = WebClient(client)
+        futures = [web_client.call_async("auth.test") for _ in range(2)]
+
+        with pytest.raises(ValueError):
+            web_client.gather(futures)
+
+    def test_gather_returns_errors(self, client):
+        error = ValueError("Boom")
+        client.api_call.side_effect = [error, {"ok": True}]
+        web_client = WebClient(client)
+        futures = [web_client.call_async("auth.test") for _ in range(2)]
+
+        assert web_client.gather(futures, return_exceptions=True) == [
+            error,
+            {"ok": True},
+        ]
+
+    def test_stop_waits_for_calls(self, make_slack_provider):
+        provider = make_slack_provider()
+        provider.setup()
+        finished = []
+        provider.client.pool.spawn(lambda: sleep(0.01) or finished.append(True))
+
+        provider.stop()
+
+        assert finished == [True]
+
+    def test_kill_stops_calls(self, make_slack_provider):
+        provider = make_slack_provider()
+        provider.setup()
+        finished = []
+        provider.client.pool.spawn(lambda: sleep(0.01) or finished.append(True))
+
+        provider.kill()
+        sleep(0.02)
+
+        assert finished == []
+
+    def test_setup(self, make_slack_provider):
+        config = {
+            "SLACK": {
+                "TOKEN": "abc-123",
+                "PAGINATION": {"PAGE_SIZE": 1000, "PREFETCH": False},
+                "ASYNC_POOL": {"SIZE": 50},
+            }
+        }
+
+        provider = make_slack_provider(config)
+        provider.setup()
+
+        client = provider.get_dependency(Mock())
+        assert isinstance(client, WebClient)
+        assert (client.page_size, client.prefetch, client.max_retries) == (
+            1000,
+            False,
+            5,
+        )
+        assert client.pool.size == 50
+
+
+def test_cache_shared_with_rtm_client_manager(container_factory, config):
+    class Service(object):
+
+        name = "service"
+
+        slack = Slack(cache=True)
+
+        @rtm.handle_event
+        def handle_event(self, event):
+            pass
+
+    container = container_factory(Service, config)
+
+    slack_provider = get_extension(container, Slack)
+    client_manager = get_extension(container, rtm.SlackRTMClientManager)
+    assert slack_provider.cache is client_manager.cache
+
+    slack_provider.setup()
+    client = slack_provider.get_dependency(Mock()).client
+    assert isinstance(client, CachingClient)
+    assert client.cache is slack_provider.cache
+    assert client.bot_name == constants.DEFAULT_BOT_NAME
+
+
+class TestClientPool:
+    @pytest.fixture
+    def build_client(self):
+        teams = {"xoxb-a": "T1", "xoxb-b": "T2", "xoxb-c": "T3"}
+
+        def build(token, bot_name):
+            client = Mock(token=token, bot_name=bot_name)
+            client.api_call.return_value = {"ok": True, "team_id": teams[token]}
+            return client
+
+        return Mock(side_effect=build)
+
+    @pytest.fixture
+    def tokens(self):
+        return OrderedDict(
+            [("alice", "xoxb-a"), ("bob", "xoxb-b"), ("carol", "xoxb-c")]
+        )
+
+    def test_reuses_clients_of_bots(self, tokens, build_client):
+        pool = ClientPool(tokens, build_client)
+
+        client = pool.get("alice")
+        assert client.token == "xoxb-a"
+        assert pool["alice"] is client
+        assert build_client.call_args_list == [call("xoxb-a", "alice")]
+
+    def test_evicts_least_recently_used(self, tokens, build_client):
+        pool = ClientPool(tokens, build_client, size=2)
+        alice = pool.get("alice")
+        pool.get("bob")
+        pool.get("alice")
+
+        pool.get("carol")
+
+        assert list(pool.clients) == ["alice", "carol"]
+        assert pool["alice"] is alice
+        assert pool.stats() == {"size": 2, "teams": 0, "evictions": 1}
+
+    def test_finds_bots_of_teams(self, tokens, build_client):
+        pool = ClientPool(tokens, build_client)
+
+        assert pool.get("T2").bot_name == "bob"
+        assert pool.teams == {"T1": "alice", "T2": "bob"}
+
+        # known teams are not looked for again
+        pool.get("T1")
+        assert build_client.call_count == 2
+        assert pool.clients["alice"].api_call.call_args_list == [call("auth.test")]
+
+    def test_teams_given(self, tokens, build_client):
+        pool = ClientPool(tokens, build_client, teams={"T3": "carol"})
+
+        assert pool.get("T3").bot_name == "carol"
+        assert pool.unidentified == ["alice", "bob"]
+        assert build_client.call_count == 1
+
+    def test_unknown_team(self, tokens, build_client):
+        pool = ClientPool(tokens, build_client)
+
+        with pytest.raises(UnknownBot) as exc:
+            pool.get("T9")
+
+        assert str(exc.value) == "No bot named or of team `T9` in `SLACK` config"
+        assert pool.unidentified == []
+
+    def test_bot_failing_to_identify(self, tokens, build_client):
+        pool = ClientPool(tokens, build_client)
+        pool.get("alice").api_call.return_value = {
+            "ok": False,
+            "error": "invalid_auth",
+        }
+        pool.get("bob").api_call.side_effect = ValueError("Boom")
+
+        with pytest.raises(ValueError):
+            pool.get("T3")
+
+        # tried again on the next lookup
+        assert pool.unidentified == ["carol", "bob"]
+        pool.get("bob").api_call.side_effect = None
+        assert pool.get("T2").bot_name == "bob"
+        assert pool.teams == {"T2": "bob", "T3": "carol"}
+
+
+class TestSlackPool:
+    @pytest.fixture
+    def make_pool_provider(self, container_factory):
+        def make(config):
+            class Service(object):
+
+                name = "service"
+
+                slack = SlackPool(cache=True)
+
+                @dummy
+                def dummy(self):
+                    pass
+
+            container = container_factory(Service, config)
+            provider = get_extension(container, SlackPool)
+            provider.setup()
+            return provider
+
+        return make
+
+    def test_clients_of_all_bots(self, make_pool_provider):
+        config = {
+            "SLACK": {
+                "TOKEN": "xoxb-0",
+                "BOTS": {"alice": "xoxb-a"},
+                "CLIENT_POOL": {"SIZE": 10, "TEAMS": {"T1": "alice"}},
+            }
+        }
+
+        provider = make_pool_provider(config)
+        pool = provider.get_dependency(Mock())
+
+        assert pool.size == 10
+        assert pool.tokens == {"default": "xoxb-0", "alice": "xoxb-a"}
+        client = pool.get("T1")
+        assert isinstance(client, WebClient)
+        assert client.token == "xoxb-a"
+        assert client.pool is provider.pool
+        assert isinstance(client.client, CachingClient)
+        assert client.client.bot_name == "alice"
+        requester = client.server.api_requester
+        assert requester.session is provider.session
+
+    def test_bots_token_takes_precedence(self, make_pool_provider):
+        config = {"SLACK": {"TOKEN": "xoxb-0", "BOTS": {"default": "xoxb-1"}}}
+
+        provider = make_pool_provider(config)
+
+        assert provider.client.tokens == {"default": "xoxb-1"}
+
+    def test_no_tokens(self, make_pool_provider):
+        with pytest.raises(ConfigurationError) as exc:
+            make_pool_provider({"SLACK": {}})
+
+        assert str(exc.value) == "No token provided by `SLACK` config"
+
+    def test_config_key_missing(self, make_pool_provider):
+        with pytest.raises(ConfigurationError) as exc:
+            make_pool_provider({})
+
+        assert str(exc.value) == "`SLACK` config key not found"
+
+    def test_unknown_bot_of_team(self, make_pool_provider):
+        config = {"SLACK": {"TOKEN": "xoxb-0", "CLIENT_POOL": {"TEAMS": {"T1": "bob"}}}}
+
+        with pytest.raises(ConfigurationError) as exc:
+            make_pool_provider(config)
+
+        assert str(exc.value) == (
+            "Unknown `bob` bot in `CLIENT_POOL.TEAMS` of `SLACK` config"
+        )